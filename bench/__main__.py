@@ -0,0 +1,130 @@
+"""Benchmark BTree and the buffer pool.
+
+    python -m bench --distribution sequential random zipfian \\
+        --data-size 1G --pool-size 1024 65536 --output result.json
+    python -m bench ... --compare result.json
+
+Every combination of the listed distributions, sizes and pool sizes is
+run in turn.  The results are written as JSON; with --compare, a run that
+regresses against a baseline file makes the command exit with status 1.
+--profile writes cProfile statistics for `python -m pstats`.
+"""
+from typing import List, Optional
+import argparse
+import cProfile
+import itertools
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+from bench.workload import DISTRIBUTIONS
+from bench.runner import BenchmarkConfig, Result, compare, run
+
+UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text: str) -> int:
+    """Parse a byte count such as 512, 64K or 2G."""
+    text = text.strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * UNITS[unit])
+
+
+def _report(result: Result) -> str:
+    lines = [result['name']]
+    for phase, numbers in result['phases'].items():
+        latency = numbers['latency_us']
+        lines.append(
+            f"  {phase:<6} {numbers['ops_per_sec']:>10.0f} ops/s"
+            f"  p50 {latency.get('p50', 0):>8.1f}us"
+            f"  p99 {latency.get('p99', 0):>8.1f}us"
+            f"  hit {numbers['hit_rate']:>6.1%}"
+            f"  read {numbers['bytes_read_per_op']:>8.1f}B/op"
+            f"  written {numbers['bytes_written_per_op']:>8.1f}B/op"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bench')
+    parser.add_argument('--distribution', nargs='+', choices=DISTRIBUTIONS,
+                        default=list(DISTRIBUTIONS))
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--records', nargs='+', type=int)
+    size.add_argument('--data-size', nargs='+', type=parse_size,
+                      help='bytes of keys and values to load, e.g. 2G')
+    parser.add_argument('--key-size', nargs='+', type=int, default=[8])
+    parser.add_argument('--value-size', nargs='+', type=int, default=[100])
+    parser.add_argument('--pool-size', nargs='+', type=int, default=[1024],
+                        help='buffer pool size in pages')
+    parser.add_argument('--partitions', type=int, default=1)
+    parser.add_argument('--lookups', type=int,
+                        help='lookups per run (default: one per record)')
+    parser.add_argument('--mmap', action='store_true',
+                        help='use MmapDiskManager')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', type=pathlib.Path,
+                        help='directory for the heap files')
+    parser.add_argument('--output', type=pathlib.Path,
+                        help='write the results as JSON to this file')
+    parser.add_argument('--compare', type=pathlib.Path,
+                        help='baseline JSON file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='regression threshold as a fraction')
+    parser.add_argument('--profile', type=pathlib.Path,
+                        help='write cProfile statistics to this file')
+    args = parser.parse_args(argv)
+
+    configs = []
+    for distribution, key_size, value_size, pool_size in itertools.product(
+            args.distribution, args.key_size, args.value_size,
+            args.pool_size):
+        if args.data_size is not None:
+            counts = [data_size // (key_size + value_size)
+                      for data_size in args.data_size]
+        else:
+            counts = args.records or [100000]
+        for records in counts:
+            configs.append(BenchmarkConfig(
+                distribution, records, key_size, value_size, pool_size,
+                args.partitions, args.lookups, args.mmap, args.seed,
+            ))
+
+    profiler = cProfile.Profile() if args.profile is not None else None
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for config in configs:
+            if profiler is not None:
+                profiler.enable()
+            result = run(config, pathlib.Path(directory))
+            if profiler is not None:
+                profiler.disable()
+            print(_report(result), file=sys.stderr)
+            results.append(result)
+    if profiler is not None:
+        profiler.dump_stats(str(args.profile))
+
+    document = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    text = json.dumps(document, indent=2)
+    if args.output is not None:
+        args.output.write_text(text + '\n')
+    else:
+        print(text)
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())['results']
+        regressions = compare(baseline, results, args.threshold)
+        for regression in regressions:
+            print(f'regression: {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
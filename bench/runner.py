@@ -0,0 +1,192 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import pathlib
+import time
+from src.disk import PAGE_SIZE, DiskManager, MmapDiskManager
+from src.buffer import BufferPool, BufferPoolManager, \
+    PartitionedBufferPoolManager
+from src.btree.btree import BTree
+from src.stats import LatencyHistogram
+from bench.workload import Workload
+
+Result = Dict[str, Any]
+
+MIN_KEY_SIZE: int       = 8
+
+
+class BenchmarkConfig:
+    """One point of a benchmark matrix.
+
+    lookups defaults to records.  With partitions > 1, pool_size frames
+    are split evenly over a PartitionedBufferPoolManager.
+    """
+    distribution: str
+    records: int
+    key_size: int
+    value_size: int
+    pool_size: int
+    partitions: int
+    lookups: int
+    mmap: bool
+    seed: int
+
+    def __init__(self, distribution: str, records: int,
+                 key_size: int = 8, value_size: int = 100,
+                 pool_size: int = 1024, partitions: int = 1,
+                 lookups: Optional[int] = None, mmap: bool = False,
+                 seed: int = 0) -> None:
+        if key_size < MIN_KEY_SIZE:
+            raise ValueError(f'key_size must be at least {MIN_KEY_SIZE}')
+        if pool_size < partitions:
+            raise ValueError('every partition needs a buffer')
+        self.distribution = distribution
+        self.records = records
+        self.key_size = key_size
+        self.value_size = value_size
+        self.pool_size = pool_size
+        self.partitions = partitions
+        self.lookups = records if lookups is None else lookups
+        self.mmap = mmap
+        self.seed = seed
+
+    def name(self) -> str:
+        """Identify the configuration, for matching runs to compare."""
+        name = (f'{self.distribution}-n{self.records}-k{self.key_size}'
+                f'-v{self.value_size}-p{self.pool_size}')
+        if self.partitions > 1:
+            name += f'x{self.partitions}'
+        if self.mmap:
+            name += '-mmap'
+        return name
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+def _snapshot(tree: BTree) -> Dict[str, int]:
+    counters = dict(vars(tree.bufmgr.stats))
+    counters.update(vars(tree.bufmgr.disk.stats))
+    counters.update(vars(tree.stats))
+    return counters
+
+
+def _phase(ops: int, seconds: float, latencies: LatencyHistogram,
+           before: Dict[str, int], after: Dict[str, int]) -> Result:
+    delta = {name: after[name] - before[name] for name in after}
+    requests = delta['hits'] + delta['misses']
+    per_op = max(ops, 1)
+    return {
+        'ops': ops,
+        'seconds': seconds,
+        'ops_per_sec': ops / seconds if seconds else 0.0,
+        'latency_us': latencies.summary(),
+        'hit_rate': delta['hits'] / requests if requests else 0.0,
+        'evictions': delta['evictions'],
+        'eviction_writes': delta['eviction_writes'],
+        'splits': delta['leaf_splits'] + delta['inner_splits'],
+        'pages_read': delta['pages_read'],
+        'pages_written': delta['pages_written'],
+        'bytes_read_per_op': delta['pages_read'] * PAGE_SIZE / per_op,
+        'bytes_written_per_op': delta['pages_written'] * PAGE_SIZE / per_op,
+    }
+
+
+def _timed(keys: Iterable[int], operation: Callable[[bytes], None],
+           key_size: int) -> LatencyHistogram:
+    latencies = LatencyHistogram()
+    clock = time.perf_counter_ns
+    for key in keys:
+        encoded = key.to_bytes(key_size, 'big')
+        begin = clock()
+        operation(encoded)
+        latencies.record(clock() - begin)
+    return latencies
+
+
+def run(config: BenchmarkConfig, directory: pathlib.Path) -> Result:
+    """Load config.records records into a new tree, then look keys up.
+
+    The heap file is made in directory and removed afterwards.  The
+    insert phase includes the final flush of the buffer pool in its
+    seconds and bytes written, but not in its latencies.
+    """
+    workload = Workload(config.distribution, config.records, config.seed)
+    path = directory / f'{config.name()}.db'
+    if path.exists():
+        path.unlink()
+    disk = (MmapDiskManager if config.mmap else DiskManager)(path)
+    if config.partitions > 1:
+        sizes = [config.pool_size // config.partitions
+                 + (i < config.pool_size % config.partitions)
+                 for i in range(config.partitions)]
+        bufmgr = PartitionedBufferPoolManager(
+            disk, [BufferPool(size) for size in sizes]
+        )
+    else:
+        bufmgr = BufferPoolManager(disk, BufferPool(config.pool_size))
+    try:
+        tree = BTree(bufmgr, config.key_size, config.value_size)
+        value = bytes(config.value_size)
+
+        def insert(key: bytes) -> None:
+            if not tree.add(key, value):
+                raise RuntimeError(f'duplicate key {key.hex()}')
+
+        def lookup(key: bytes) -> None:
+            if tree.get(key) is None:
+                raise RuntimeError(f'key {key.hex()} not found')
+
+        before = _snapshot(tree)
+        begin = time.perf_counter()
+        latencies = _timed(workload.insert_keys(), insert, config.key_size)
+        bufmgr.flush()
+        seconds = time.perf_counter() - begin
+        inserts = _phase(config.records, seconds, latencies,
+                         before, _snapshot(tree))
+
+        before = _snapshot(tree)
+        begin = time.perf_counter()
+        latencies = _timed(workload.lookup_keys(config.lookups), lookup,
+                           config.key_size)
+        seconds = time.perf_counter() - begin
+        lookups = _phase(config.lookups, seconds, latencies,
+                         before, _snapshot(tree))
+    finally:
+        disk.close()
+        path.unlink()
+    return {
+        'name': config.name(),
+        'config': config.to_dict(),
+        'phases': {'insert': inserts, 'lookup': lookups},
+    }
+
+
+def compare(baseline: List[Result], current: List[Result],
+            threshold: float = 0.1) -> List[str]:
+    """Return the regressions of current against baseline.
+
+    A phase regresses when its ops/s drop, or its bytes read or written
+    per operation grow, by more than threshold (a fraction).  Results
+    are matched by name; unmatched ones are ignored.
+    """
+    previous = {result['name']: result for result in baseline}
+    regressions = []
+    for result in current:
+        if result['name'] not in previous:
+            continue
+        old_phases = previous[result['name']]['phases']
+        for phase, new in result['phases'].items():
+            old = old_phases.get(phase)
+            if old is None:
+                continue
+            if new['ops_per_sec'] < old['ops_per_sec'] * (1 - threshold):
+                regressions.append(
+                    f"{result['name']} {phase}: ops/s "
+                    f"{old['ops_per_sec']:.0f} -> {new['ops_per_sec']:.0f}"
+                )
+            for metric in ('bytes_read_per_op', 'bytes_written_per_op'):
+                if new[metric] > old[metric] * (1 + threshold):
+                    regressions.append(
+                        f"{result['name']} {phase}: {metric} "
+                        f"{old[metric]:.1f} -> {new[metric]:.1f}"
+                    )
+    return regressions
@@ -0,0 +1,138 @@
+from typing import Iterator, Optional
+from array import array
+import math
+import random
+
+"""
+A workload inserts records keys and then looks keys up.  Keys are 8-byte
+integers, big endian and padded with leading zeros to key_size, so they
+sort like the integers.
+
+sequential  inserts 0, 1, 2, ... and looks them up in the same order.
+random      inserts i * GOLDEN_GAMMA modulo 2 ** 64, distinct keys in
+            scattered order, and looks up records uniformly at random.
+zipfian     inserts keys clustered around hot spots: the high 32 bits are
+            a Zipf-distributed hot spot and the low 32 bits the insert
+            sequence number.  Lookups pick records Zipf-distributed, the
+            popular ones scattered over the key space.
+"""
+
+DISTRIBUTIONS = ('sequential', 'random', 'zipfian')
+
+KEY_BITS: int           = 64
+# odd, so multiplying by it modulo 2 ** 64 is a bijection
+GOLDEN_GAMMA: int       = 0x9E3779B97F4A7C15
+FNV_OFFSET: int         = 0xCBF29CE484222325
+FNV_PRIME: int          = 0x100000001B3
+# terms of the zeta sum added up one by one; the rest is integrated
+ZETA_EXACT_TERMS: int   = 1 << 20
+
+
+def scramble(n: int) -> int:
+    """FNV-1a hash of the 8 bytes of n."""
+    h = FNV_OFFSET
+    for byte in n.to_bytes(8, 'big'):
+        h = ((h ^ byte) * FNV_PRIME) & ((1 << KEY_BITS) - 1)
+    return h
+
+
+def zeta(n: int, theta: float) -> float:
+    """Return the sum of 1 / i ** theta over i = 1 ... n.
+
+    Beyond ZETA_EXACT_TERMS terms the sum is approximated by an integral.
+    """
+    exact = min(n, ZETA_EXACT_TERMS)
+    total = math.fsum(i ** -theta for i in range(1, exact + 1))
+    if n > exact:
+        # midpoint rule: term i covers [i - 0.5, i + 0.5]
+        low, high = exact + 0.5, n + 0.5
+        total += (high ** (1 - theta) - low ** (1 - theta)) / (1 - theta)
+    return total
+
+
+class ZipfianGenerator:
+    """Draws ranks 0 ... n - 1, rank r with weight 1 / (r + 1) ** theta.
+
+    The method of Gray et al., "Quickly Generating Billion-Record
+    Synthetic Databases", as used by YCSB.
+    """
+    n: int
+    theta: float
+    alpha: float
+    zetan: float
+    eta: float
+    rng: random.Random
+
+    def __init__(self, n: int, rng: random.Random,
+                 theta: float = 0.99) -> None:
+        self.n = n
+        self.theta = theta
+        self.alpha = 1 / (1 - theta)
+        self.zetan = zeta(n, theta)
+        # with at most two ranks next() never gets to use eta
+        self.eta = 0.0 if n <= 2 else (
+            (1 - (2 / n) ** (1 - theta)) / (1 - zeta(2, theta) / self.zetan)
+        )
+        self.rng = rng
+
+    def next(self) -> int:
+        u = self.rng.random()
+        uz = u * self.zetan
+        if uz < 1:
+            return 0
+        if uz < 1 + 0.5 ** self.theta:
+            return 1
+        rank = int(self.n * (self.eta * u - self.eta + 1) ** self.alpha)
+        return min(rank, self.n - 1)
+
+
+class Workload:
+    """The keys a benchmark inserts and looks up, as integers."""
+    distribution: str
+    records: int
+    seed: int
+    zipfian_keys: Optional['array[int]']
+
+    def __init__(self, distribution: str, records: int,
+                 seed: int = 0) -> None:
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f'unknown distribution {distribution!r}')
+        if not 0 < records < 1 << 32:
+            raise ValueError('records must be in [1, 2 ** 32)')
+        self.distribution = distribution
+        self.records = records
+        self.seed = seed
+        self.zipfian_keys = None
+
+    def key(self, i: int) -> int:
+        """Return the key of the i-th record inserted."""
+        if self.distribution == 'sequential':
+            return i
+        if self.distribution == 'random':
+            return (i * GOLDEN_GAMMA) & ((1 << KEY_BITS) - 1)
+        if self.zipfian_keys is None:
+            # 8 bytes a record: lookups need the keys drawn at insert time
+            rng = random.Random(self.seed)
+            hot = ZipfianGenerator(self.records, rng)
+            self.zipfian_keys = array('Q', (
+                (scramble(hot.next()) & 0xFFFFFFFF) << 32 | i
+                for i in range(self.records)
+            ))
+        return self.zipfian_keys[i]
+
+    def insert_keys(self) -> Iterator[int]:
+        for i in range(self.records):
+            yield self.key(i)
+
+    def lookup_keys(self, count: int) -> Iterator[int]:
+        rng = random.Random(self.seed + 1)
+        if self.distribution == 'sequential':
+            for i in range(count):
+                yield self.key(i % self.records)
+        elif self.distribution == 'random':
+            for _ in range(count):
+                yield self.key(rng.randrange(self.records))
+        else:
+            popular = ZipfianGenerator(self.records, rng)
+            for _ in range(count):
+                yield self.key(scramble(popular.next()) % self.records)
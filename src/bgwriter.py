@@ -0,0 +1,56 @@
+from typing import Optional
+import threading
+import time
+from src.buffer import BufferPoolManager
+
+
+class BackgroundWriter:
+    """Background thread that keeps the buffer pool mostly clean.
+
+    Every interval seconds the writer writes up to batch_size dirty pages
+    in page-ID order through BufferPoolManager.write_back(), so that an
+    eviction seldom has to write its victim first.  Every
+    checkpoint_interval seconds it also takes a fuzzy checkpoint, which
+    bounds the log that recovery has to replay; a checkpoint that cannot
+    complete yet is retried on the next round.
+    """
+    bufmgr: BufferPoolManager
+    interval: float
+    batch_size: int
+    checkpoint_interval: Optional[float]
+    last_checkpoint: float
+    checkpoints: int
+    stopped: threading.Event
+    worker: threading.Thread
+
+    def __init__(self, bufmgr: BufferPoolManager, interval: float = 0.05,
+                 batch_size: int = 32,
+                 checkpoint_interval: Optional[float] = None) -> None:
+        self.bufmgr = bufmgr
+        self.interval = interval
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = time.monotonic()
+        self.checkpoints = 0
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+
+    def run_once(self) -> None:
+        self.bufmgr.write_back(limit=self.batch_size)
+        if self.checkpoint_interval is None:
+            return
+        now = time.monotonic()
+        if now - self.last_checkpoint < self.checkpoint_interval:
+            return
+        if self.bufmgr.fuzzy_checkpoint():
+            self.last_checkpoint = now
+            self.checkpoints += 1
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.worker.join()
@@ -0,0 +1,226 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+import hashlib
+import math
+import threading
+import zlib
+from src.disk import PAGE_SIZE, PageID, DiskManager
+
+"""
+FILTER PAGE
+0                        4
++------------------------+-----------------+
+| [int] next_page_id     | [bytes] payload |
++------------------------+-----------------+
+
+PAYLOAD (the payloads of the chain one after another)
+0             1                  2                 6
++-------------+------------------+-----------------+
+| [int] clean | [int] hash_count | [int] bit_count |
++-------------+------------------+-----------------+
+6                  10               14                18
++------------------+----------------+-----------------+--------------+
+| [int] capacity   | [int] count    | [int] checksum  | [bytes] bits |
++------------------+----------------+-----------------+--------------+
+
+A filter is saved to a chain of pages written straight to the disk,
+never through the buffer pool.  clean says whether the bits cover every
+key of the tree: it is cleared on disk before the first change to the
+tree after a save, and set again by the next save, so a filter that may
+be missing keys is never trusted.  The checksum, a CRC-32 of the
+payload from hash_count on without itself, catches pages that were
+overwritten.  A next_page_id of 0 ends the chain.
+"""
+
+NEXT_PAGE_ID_BEGIN: int = 0
+NEXT_PAGE_ID_END: int   = 4
+PAYLOAD_BEGIN: int      = 4
+PAYLOAD_SIZE: int       = PAGE_SIZE - PAYLOAD_BEGIN
+
+CLEAN: int              = 0
+HASH_COUNT: int         = 1
+BIT_COUNT_BEGIN: int    = 2
+BIT_COUNT_END: int      = 6
+CAPACITY_BEGIN: int     = 6
+CAPACITY_END: int       = 10
+COUNT_BEGIN: int        = 10
+COUNT_END: int          = 14
+CHECKSUM_BEGIN: int     = 14
+CHECKSUM_END: int       = 18
+BITS_BEGIN: int         = 18
+
+MAX_HASH_COUNT: int     = 32
+MIN_CAPACITY: int       = 1024
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives.
+
+    The hash_count bit positions of a key come from one BLAKE2b digest by
+    double hashing.  add() is serialized by a lock, since two threads
+    setting bits of the same byte could otherwise lose one; lookups read
+    the bits without it.  count is the number of keys added that were
+    not already seemingly present; once it passes capacity, the false
+    positive rate climbs and the filter should be replaced by grown().
+    """
+    bit_count: int
+    hash_count: int
+    capacity: int
+    count: int
+    bits: bytearray
+    lock: threading.Lock
+
+    def __init__(self, bit_count: int, hash_count: int, capacity: int,
+                 bits: Optional[bytearray] = None) -> None:
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.capacity = capacity
+        self.count = 0
+        self.bits = (bytearray(-(-bit_count // 8)) if bits is None
+                     else bits)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def for_capacity(capacity: int,
+                     false_positive_rate: float) -> BloomFilter:
+        """Size a filter for capacity keys at the given false positive rate.
+
+        The capacity is at least MIN_CAPACITY.
+        """
+        if not 0 < false_positive_rate < 1:
+            raise ValueError('false_positive_rate must be in (0, 1)')
+        capacity = max(capacity, MIN_CAPACITY)
+        bit_count = math.ceil(-capacity * math.log(false_positive_rate)
+                              / math.log(2) ** 2)
+        hash_count = round(bit_count / capacity * math.log(2))
+        return BloomFilter(bit_count,
+                           min(max(hash_count, 1), MAX_HASH_COUNT), capacity)
+
+    def is_full(self) -> bool:
+        return self.count > self.capacity
+
+    def grown(self) -> BloomFilter:
+        """Return an empty filter for twice the keys at the same rate."""
+        return BloomFilter(2 * self.bit_count, self.hash_count,
+                           2 * self.capacity)
+
+    def _positions(self, key: bytes) -> List[int]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bit_count
+                for i in range(self.hash_count)]
+
+    def add(self, key: bytes) -> bool:
+        """Add key; return whether the filter already seemed to contain it.
+
+        Of several threads adding one key, only the first gets False.
+        """
+        bits = self.bits
+        positions = self._positions(key)
+        with self.lock:
+            present = True
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not bits[position >> 3] & mask:
+                    present = False
+                    bits[position >> 3] |= mask
+            if not present:
+                self.count += 1
+            return present
+
+    def __contains__(self, key: bytes) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    def page_count(self) -> int:
+        return -(-(BITS_BEGIN + len(self.bits)) // PAYLOAD_SIZE)
+
+    def save(self, disk: DiskManager, page_ids: List[PageID]) -> None:
+        """Write the filter over page_ids, page_count() pages, as clean.
+
+        The pages are synced before the clean flag is set, so that a
+        crash in between leaves a filter marked unclean.
+        """
+        payload = bytearray(BITS_BEGIN) + self.bits
+        payload[HASH_COUNT] = self.hash_count
+        payload[BIT_COUNT_BEGIN:BIT_COUNT_END] = self.bit_count.to_bytes(
+            BIT_COUNT_END - BIT_COUNT_BEGIN, 'big'
+        )
+        payload[CAPACITY_BEGIN:CAPACITY_END] = self.capacity.to_bytes(
+            CAPACITY_END - CAPACITY_BEGIN, 'big'
+        )
+        payload[COUNT_BEGIN:COUNT_END] = self.count.to_bytes(
+            COUNT_END - COUNT_BEGIN, 'big'
+        )
+        payload[CHECKSUM_BEGIN:CHECKSUM_END] = zlib.crc32(
+            payload[HASH_COUNT:CHECKSUM_BEGIN] + self.bits
+        ).to_bytes(CHECKSUM_END - CHECKSUM_BEGIN, 'big')
+        pages = []
+        for i, page_id in enumerate(page_ids):
+            page = bytearray(PAGE_SIZE)
+            next_page_id = page_ids[i + 1] if i + 1 < len(page_ids) else 0
+            page[NEXT_PAGE_ID_BEGIN:NEXT_PAGE_ID_END] = int(
+                next_page_id
+            ).to_bytes(NEXT_PAGE_ID_END - NEXT_PAGE_ID_BEGIN, 'big')
+            chunk = payload[i * PAYLOAD_SIZE:(i + 1) * PAYLOAD_SIZE]
+            page[PAYLOAD_BEGIN:PAYLOAD_BEGIN + len(chunk)] = chunk
+            pages.append((page_id, page))
+        disk.write_pages(pages)
+        disk.sync()
+        first = pages[0][1]
+        first[PAYLOAD_BEGIN + CLEAN] = True
+        disk.write_page_data(page_ids[0], first)
+        disk.sync()
+
+    @staticmethod
+    def mark_unclean(disk: DiskManager, first_page_id: PageID) -> None:
+        page = disk.read_page_data(first_page_id)
+        page[PAYLOAD_BEGIN + CLEAN] = False
+        disk.write_page_data(first_page_id, page)
+        disk.sync()
+
+    @staticmethod
+    def read(disk: DiskManager, first_page_id: PageID
+             ) -> Optional[Tuple[BloomFilter, List[PageID], bool]]:
+        """Read a saved filter; return it, its chain and whether it is clean.
+
+        An unclean filter may be missing keys, so it is returned empty to
+        be rebuilt in the same size and pages.  Returns None if
+        the pages do not hold an intact filter, as after a crash that
+        redid older page images over them.
+        """
+        page = disk.read_page_data(first_page_id)
+        payload = bytearray(page[PAYLOAD_BEGIN:])
+        hash_count = payload[HASH_COUNT]
+        bit_count = int.from_bytes(payload[BIT_COUNT_BEGIN:BIT_COUNT_END],
+                                   'big')
+        capacity = int.from_bytes(payload[CAPACITY_BEGIN:CAPACITY_END],
+                                  'big')
+        if not 0 < hash_count <= MAX_HASH_COUNT or bit_count == 0:
+            return None
+        filter_ = BloomFilter(bit_count, hash_count, capacity)
+        page_ids = [first_page_id]
+        while len(page_ids) < filter_.page_count():
+            next_page_id = int.from_bytes(
+                page[NEXT_PAGE_ID_BEGIN:NEXT_PAGE_ID_END], 'big'
+            )
+            if next_page_id == 0:
+                return None
+            page_ids.append(PageID(next_page_id))
+            page = disk.read_page_data(page_ids[-1])
+            payload += page[PAYLOAD_BEGIN:]
+        filter_.bits[:] = payload[BITS_BEGIN:BITS_BEGIN + len(filter_.bits)]
+        checksum = zlib.crc32(payload[HASH_COUNT:CHECKSUM_BEGIN]
+                              + filter_.bits)
+        if checksum != int.from_bytes(payload[CHECKSUM_BEGIN:CHECKSUM_END],
+                                      'big'):
+            return None
+        clean = bool(payload[CLEAN])
+        if clean:
+            filter_.count = int.from_bytes(payload[COUNT_BEGIN:COUNT_END],
+                                           'big')
+        else:
+            filter_ = BloomFilter(bit_count, hash_count, capacity)
+        return filter_, page_ids, clean
@@ -1,150 +1,939 @@
-from typing import Optional
-from bisect import bisect_left
-from src.disk import PageID, PAGE_SIZE
-from src.buffer import Page, BufferPoolManager
-from src.btree.leaf_page import LeafPage
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, \
+    Tuple, TypeVar
+from contextlib import contextmanager
+import functools
+import threading
+import time
+from src.disk import PageID
+from src.buffer import Buffer, Page, BufferPoolManager
+from src.latch import RWLatch
+from src.stats import StatsRegistry, TreeStats
+from src.btree.slotted_page import SLOT_SIZE, SlottedPage
+from src.btree.leaf_page import (
+    LeafPage, Row, RECORD_SIZE, CELL_HEADER_SIZE
+)
 from src.btree.inner_page import InnerPage
+from src.btree.bulk_loader import BulkLoader
+from src.btree.bloom import BloomFilter
+from src.btree.prefix import shortest_separator, fence_prefix
+
+
+Split = Tuple[bytes, PageID]
+Fence = Optional[bytes]
+
+# the share of the rows a split keeps on the left when a key is appended
+# past the end of the tree, as by inserts in ascending order
+APPEND_SPLIT_SHARE: float = 0.9
+
+
+Operation = TypeVar('Operation', bound=Callable)
 
 
 def is_leaf(page: Page) -> bool:
     return (page[0] & 1) == 1
 
 
+def timed(operation: Operation) -> Operation:
+    """Time a BTree method into its registry, once one is attached."""
+    @functools.wraps(operation)
+    def wrapper(self: BTree, *args, **kwargs):
+        if self.registry is None:
+            return operation(self, *args, **kwargs)
+        begin = time.perf_counter_ns()
+        try:
+            return operation(self, *args, **kwargs)
+        finally:
+            self.registry.record(f'{self.stats_name}.{operation.__name__}',
+                                 time.perf_counter_ns() - begin)
+    return wrapper  # type: ignore
+
+
 class BTree:
+    """B+tree over the pages of a buffer pool.
+
+    One BTree object may be shared by many threads.  Lookups, scans and
+    updates that stay within one leaf hold the tree latch shared while
+    they descend, latching each page before releasing its parent, and let
+    go of the tree latch once they hold their leaf.  An insert that
+    splits or a removal that rebalances takes the tree latch exclusively
+    and latches every page it changes.  Scans hold no latch between
+    leaves; they step to the next leaf directly unless the structure
+    changed meanwhile, in which case they descend again from where they
+    stopped.
+
+    Inserts in ascending order are cheap: an insert past the last key
+    goes straight to the rightmost leaf if the tree has not changed shape
+    since the previous one, and splits at the right edge of the tree
+    leave the left page APPEND_SPLIT_SHARE full rather than half full.
+
+    With a Bloom filter enabled, get() and update() answer most keys
+    that are absent without descending.
+    """
     bufmgr: BufferPoolManager
     root_page_id: PageID
     key_size: int
     value_size: int
+    name: Optional[str]
+    latch: RWLatch
+    version: int
+    stats: TreeStats
+    registry: Optional[StatsRegistry]
+    stats_name: str
+    bloom: Optional[BloomFilter]
+    bloom_page_ids: List[PageID]
+    bloom_clean: bool
+    bloom_lock: threading.Lock
+    rightmost: Optional[Tuple[PageID, int]]
 
     def __init__(self, bufmgr: BufferPoolManager,
                  key_size: int, value_size: int,
                  root_page_id: Optional[PageID] = None) -> None:
         self.bufmgr = bufmgr
+        self.name = None
+        self.latch = RWLatch()
+        # bumped by every change to the shape of the tree
+        self.version = 0
+        self.stats = TreeStats()
+        # set by StatsRegistry.attach_tree() to time operations and
+        # report events
+        self.registry = None
+        self.stats_name = 'btree'
+        self.bloom = None
+        # the pages the filter is saved to, and whether the saved filter
+        # still covers every key
+        self.bloom_page_ids = []
+        self.bloom_clean = False
+        self.bloom_lock = threading.Lock()
+        # the rightmost leaf and the version it was seen at
+        self.rightmost = None
         if root_page_id is None:
-            buffer_ = self.bufmgr.create_page()
-            buffer_.page = LeafPage.empty_leaf(key_size, value_size).to_page()
-            buffer_.is_dirty = True
-            self.root_page_id = buffer_.page_id
+            with self.bufmgr.new_page() as buffer_:
+                LeafPage(buffer_.page, key_size, value_size).initialize()
+                buffer_.is_dirty = True
+                self.root_page_id = buffer_.page_id
         else:
             self.root_page_id = root_page_id
         self.key_size = key_size
         self.value_size = value_size
 
+    @staticmethod
+    def check_sizes(key_size: int, value_size: int) -> None:
+        """Raise ValueError if pages cannot hold keys and values this big."""
+        LeafPage.empty_leaf(key_size, value_size)
+        InnerPage.empty_inner(key_size)
+
+    @staticmethod
+    def create(bufmgr: BufferPoolManager, name: str,
+               key_size: int, value_size: int) -> BTree:
+        """Create an empty tree and record it in the file's catalog."""
+        tree = BTree(bufmgr, key_size, value_size)
+        bufmgr.disk.create_tree(name, tree.root_page_id,
+                                key_size, value_size)
+        tree.name = name
+        return tree
+
+    @staticmethod
+    def open(bufmgr: BufferPoolManager, name: str) -> BTree:
+        """Open a tree recorded in the file's catalog."""
+        entry = bufmgr.disk.trees.get(name)
+        if entry is None:
+            raise KeyError(f'no tree named {name!r}')
+        tree = BTree(bufmgr, entry.key_size, entry.value_size,
+                     entry.root_page_id)
+        tree.name = name
+        bloom_entry = bufmgr.disk.trees.get(tree._bloom_name())
+        if bloom_entry is not None:
+            saved = BloomFilter.read(bufmgr.disk, bloom_entry.root_page_id)
+            if saved is None:
+                # the pages were overwritten; rebuild into new ones
+                tree.enable_bloom()
+            elif saved[2]:
+                tree.bloom, tree.bloom_page_ids, tree.bloom_clean = saved
+            else:
+                bloom, tree.bloom_page_ids, _ = saved
+                tree._fill_bloom(bloom)
+        return tree
+
+    def _bloom_name(self) -> str:
+        return f'{self.name}.bloom'
+
+    def _fill_bloom(self, bloom: BloomFilter) -> None:
+        """Install the empty bloom, grown to fit the keys, filled with them."""
+        key_count = sum(1 for _ in self.scan())
+        while bloom.capacity < key_count:
+            bloom = bloom.grown()
+        for key, _ in self.scan():
+            bloom.add(key)
+        self.bloom = bloom
+
+    def enable_bloom(self, capacity: Optional[int] = None,
+                     false_positive_rate: float = 0.01) -> None:
+        """Build a Bloom filter over the keys, sized for capacity keys.
+
+        The filter starts with room for at least the current keys, and is
+        rebuilt twice as large whenever more keys than its capacity have
+        been added, which keeps the false positive rate.  Must not run
+        alongside updates.  The filter lives in memory until save_bloom()
+        is called.
+        """
+        self._fill_bloom(BloomFilter.for_capacity(
+            0 if capacity is None else capacity, false_positive_rate
+        ))
+        self.bloom_clean = False
+
+    def save_bloom(self) -> None:
+        """Save the Bloom filter next to a tree recorded in the catalog.
+
+        Later changes mark the saved filter unclean, and open() rebuilds
+        an unclean filter from the keys, so save after the tree's pages
+        have been flushed, as when closing the file.
+        """
+        if self.bloom is None:
+            raise ValueError('the tree has no Bloom filter')
+        if self.name is None:
+            raise ValueError('only a tree in the catalog can save its '
+                             'Bloom filter')
+        disk = self.bufmgr.disk
+        with self.bloom_lock:
+            if len(self.bloom_page_ids) != self.bloom.page_count():
+                for page_id in self.bloom_page_ids:
+                    disk.free_page(page_id)
+                # written in place outside the log, so never reused pages
+                self.bloom_page_ids = [disk.allocate_page(reuse=False) for _
+                                       in range(self.bloom.page_count())]
+                if self._bloom_name() in disk.trees:
+                    disk.set_root(self._bloom_name(), self.bloom_page_ids[0])
+                else:
+                    disk.create_tree(self._bloom_name(),
+                                     self.bloom_page_ids[0], 0, 0)
+            self.bloom.save(disk, self.bloom_page_ids)
+            self.bloom_clean = True
+
+    def _bloom_add(self, key: bytes) -> None:
+        """Add key to the Bloom filter before it is inserted into a leaf.
+
+        The caller holds the leaf latched exclusively, or the tree latch
+        exclusively.  The first change after a save marks the saved filter
+        unclean on disk first.
+        """
+        if self.bloom is None:
+            return
+        if self.bloom_clean:
+            with self.bloom_lock:
+                if self.bloom_clean:
+                    BloomFilter.mark_unclean(self.bufmgr.disk,
+                                             self.bloom_page_ids[0])
+                    self.bloom_clean = False
+        self.bloom.add(key)
+
+    def _grow_bloom(self) -> None:
+        """Replace a Bloom filter holding too many keys by one twice as big.
+
+        The new filter is filled from the leaves with the tree latch held
+        exclusively.  A writer already past its descent holds its leaf
+        latched exclusively and adds its key to the old filter before
+        letting go, so the leaf is read after the key is in; later
+        writers find the new filter installed.
+        """
+        with self.latch.exclusive():
+            bloom = self.bloom
+            if bloom is None or not bloom.is_full():
+                return
+            grown = bloom.grown()
+            buffer_ = self._find_leaf(b'')
+            while True:
+                leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+                for key, _ in leaf.rows(0, leaf.key_count):
+                    grown.add(key)
+                next_page_id = leaf.next_page_id
+                self.bufmgr.unpin_page(buffer_.page_id, False)
+                if next_page_id is None:
+                    break
+                buffer_ = self.bufmgr.fetch_page(next_page_id, False)
+            self.bloom = grown
+
+    def _event(self, event: str, **fields) -> None:
+        if self.registry is not None:
+            self.registry.emit(event, tree=self.stats_name, **fields)
+
+    def _set_root(self, root_page_id: PageID) -> None:
+        self.root_page_id = root_page_id
+        if self.name is not None:
+            self.bufmgr.disk.set_root(self.name, root_page_id)
+
     def __contains__(self, key: bytearray) -> bool:
         return self._search(key)
 
-    def _search(self, key: bytearray) -> bool:
-        buffer_ = self.bufmgr.fetch_page(self.root_page_id)
+    @contextmanager
+    def _restructure(self) -> Iterator[None]:
+        """Hold the tree latch exclusively to change the shape of the tree.
+
+        The buffer pool's structure latch is held shared too, so that a
+        commit waits for the change to finish rather than logging part of
+        it.
+        """
+        with self.bufmgr.structure_latch.shared(), self.latch.exclusive():
+            self.version += 1
+            yield
+
+    def _find_leaf(self, key: Optional[bytes],
+                   exclusive: bool = False) -> Buffer:
+        """Descend to the leaf where key belongs, or the last leaf if None.
+
+        The caller holds the tree latch.  Each page is latched shared
+        before its parent is released, and the leaf ends up latched
+        exclusively if asked.  The returned buffer is pinned and latched;
+        the caller must unpin it with the same exclusive.
+        """
+        buffer_ = self.bufmgr.fetch_page(self.root_page_id, False)
         while not is_leaf(buffer_.page):
             page = InnerPage(buffer_.page, self.key_size)
-            index = bisect_left(page.keys, key)
-            buffer_ = self.bufmgr.fetch_page(page.children[index])
+            index = page.key_count if key is None else page.search(key)
+            child = self.bufmgr.fetch_page(page.child(index), False)
+            self.bufmgr.unpin_page(buffer_.page_id, False)
+            buffer_ = child
+        if exclusive:
+            # the tree latch keeps the leaf in place while it is relatched
+            page_id = buffer_.page_id
+            self.bufmgr.unpin_page(page_id, False)
+            buffer_ = self.bufmgr.fetch_page(page_id, True)
+        return buffer_
+
+    def _rightmost_leaf(self, key: bytes) -> Optional[Buffer]:
+        """Return the rightmost leaf if key goes past its last key.
+
+        The caller holds the tree latch.  The leaf remembered by an
+        earlier insert is trusted only if the tree has not changed shape
+        since.  The returned buffer is pinned and latched exclusively.
+        """
+        hint = self.rightmost
+        if hint is None or hint[1] != self.version:
+            return None
+        page_id, _ = hint
+        buffer_ = self.bufmgr.fetch_page(page_id, True)
         leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
-        index = bisect_left(leaf.keys, key)
-        return index != len(leaf.keys) and leaf.keys[index] == key
+        count = leaf.key_count
+        if count and key > leaf.key(count - 1):
+            return buffer_
+        self.bufmgr.unpin_page(page_id, True)
+        return None
+
+    def height(self) -> int:
+        """Return the number of levels, 1 for a tree that is one leaf."""
+        height = 1
+        with self.latch.shared():
+            page_id = self.root_page_id
+            while True:
+                with self.bufmgr.page(page_id, False) as buffer_:
+                    if is_leaf(buffer_.page):
+                        return height
+                    page_id = InnerPage(buffer_.page, self.key_size).child(0)
+                height += 1
+
+    def _search(self, key: bytearray) -> bool:
+        return self.get(key) is not None
 
-    def leaf_split(self, page: LeafPage,
-                   page_id: PageID) -> Optional[LeafPage]:
-        if len(page.keys) != page.max_key_count:
+    @timed
+    def get(self, key: bytes) -> Optional[bytes]:
+        if self.bloom is not None and key not in self.bloom:
             return None
+        with self.latch.shared():
+            buffer_ = self._find_leaf(key)
+        try:
+            return self._leaf_get(buffer_, key)
+        finally:
+            self.bufmgr.unpin_page(buffer_.page_id, False)
 
-        new_buffer = self.bufmgr.create_page()
-        new_page_id = new_buffer.page_id
-        new = LeafPage.empty_leaf(self.key_size, self.value_size)
+    def _leaf_get(self, buffer_: Buffer, key: bytes) -> Optional[bytes]:
+        leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+        index = leaf.search(key)
+        if index == leaf.key_count or leaf.key(index) != key:
+            return None
+        return leaf.value(index)
 
-        new.keys = page.keys[:page.max_key_count // 2]
-        new.values = page.values[:page.max_key_count // 2]
-        page.keys = page.keys[page.max_key_count // 2:]
-        page.values = page.values[page.max_key_count // 2:]
+    @timed
+    def get_many(self, keys: Iterable[bytes]) -> List[Optional[bytes]]:
+        """Look up every key, returning the values in the order given.
 
-        if page.prev_page_id is not None:
-            prev_buffer = self.bufmgr.fetch_page(page.prev_page_id)
-            prev = LeafPage(prev_buffer.page, self.key_size, self.value_size)
-            prev.next_page_id = new_page_id
-            prev_buffer.page = prev.to_page()
-            prev_buffer.is_dirty = True
-            new.prev_page_id = page.prev_page_id
-        new.next_page_id = page_id
-        page.prev_page_id = new_buffer.page_id
+        The probes are sorted and pushed down the tree together, so each
+        page on the way is fetched once per call rather than once per key.
+        """
+        keys = list(keys)
+        probes = sorted(range(len(keys)), key=keys.__getitem__)
+        if self.bloom is not None:
+            probes = [i for i in probes if keys[i] in self.bloom]
+        values: List[Optional[bytes]] = [None] * len(keys)
+        if probes:
+            with self.latch.shared():
+                self._get_many_rec(self.root_page_id, keys, probes, values)
+        return values
 
-        buffer_ = self.bufmgr.fetch_page(page_id)
-        buffer_.page = page.to_page()
-        buffer_.is_dirty = True
+    def _get_many_rec(self, page_id: PageID, keys: List[bytes],
+                      probes: List[int],
+                      values: List[Optional[bytes]]) -> None:
+        with self.bufmgr.page(page_id, False) as buffer_:
+            if is_leaf(buffer_.page):
+                leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+                for i in probes:
+                    index = leaf.search(keys[i])
+                    if index != leaf.key_count and leaf.key(index) == keys[i]:
+                        values[i] = leaf.value(index)
+                return
 
-        buffer_ = self.bufmgr.fetch_page(new_page_id)
-        buffer_.page = new.to_page()
-        buffer_.is_dirty = True
+            inner = InnerPage(buffer_.page, self.key_size)
+            groups: List[Tuple[int, List[int]]] = []
+            for i in probes:
+                index = inner.search(keys[i])
+                if groups and groups[-1][0] == index:
+                    groups[-1][1].append(i)
+                else:
+                    groups.append((index, [i]))
+            children = inner.children()
+        for index, group in groups:
+            self._get_many_rec(PageID(children[index]), keys, group, values)
 
-        return new_page_id, new
+    @timed
+    def scan_many(self, ranges: Iterable[Tuple[bytes, Optional[bytes]]]
+                  ) -> List[List[Tuple[bytes, bytes]]]:
+        """Return the (key, value) pairs of each [start, end) range, in order.
 
-    def inner_split(self, page: InnerPage,
-                    page_id: PageID) -> Optional[InnerPage]:
-        if len(page.keys) != page.max_key_count:
-            return None
+        end None reaches the end of the tree.  As in get_many(), the ranges
+        are sorted and pushed down the tree together, so each page they
+        cover is fetched once per call.
+        """
+        ranges = list(ranges)
+        probes = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+        rows: List[List[Tuple[bytes, bytes]]] = [[] for _ in ranges]
+        if probes:
+            with self.latch.shared():
+                self._scan_many_rec(self.root_page_id, ranges, probes, rows)
+        return rows
 
-        new_buffer = self.bufmgr.create_page()
-        new_page_id = new_buffer.page_id
-        new = InnerPage.empty_inner(self.key_size)
+    def _scan_many_rec(self, page_id: PageID,
+                       ranges: List[Tuple[bytes, Optional[bytes]]],
+                       probes: List[int],
+                       rows: List[List[Tuple[bytes, bytes]]]) -> None:
+        with self.bufmgr.page(page_id, False) as buffer_:
+            if is_leaf(buffer_.page):
+                leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+                for i in probes:
+                    start, end = ranges[i]
+                    high = leaf.key_count if end is None else leaf.search(end)
+                    rows[i].extend(leaf.rows(leaf.search(start), high))
+                return
 
-        new.keys = page.keys[:page.max_key_count // 2]
-        new.children = page.children[:page.max_key_count // 2]
-        page.keys = page.keys[page.max_key_count // 2:]
-        page.children = page.children[page.max_key_count // 2:]
+            inner = InnerPage(buffer_.page, self.key_size)
+            # a range goes to every child from its start's to its end's
+            groups: Dict[int, List[int]] = {}
+            for i in probes:
+                start, end = ranges[i]
+                last = inner.key_count if end is None else inner.search(end)
+                for index in range(inner.search(start), last + 1):
+                    groups.setdefault(index, []).append(i)
+            children = inner.children()
+        for index in sorted(groups):
+            self._scan_many_rec(PageID(children[index]), ranges,
+                                groups[index], rows)
 
-        buffer_ = self.bufmgr.fetch_page(page_id)
-        buffer_.page = page.to_page()
-        buffer_.is_dirty = True
+    def scan(self, start: Optional[bytes] = None,
+             end: Optional[bytes] = None, reverse: bool = False,
+             prefetch: bool = False) -> Iterator[Tuple[bytes, bytes]]:
+        """Yield the (key, value) pairs with start <= key < end in key order.
 
-        buffer_ = self.bufmgr.fetch_page(new_page_id)
-        buffer_.page = new.to_page()
-        buffer_.is_dirty = True
+        The tree is descended once, then the scan follows the leaf sibling
+        links.  Rows are copied out a leaf at a time and the leaf is unpinned
+        before they are yielded, so an abandoned scan holds no pins.  With
+        prefetch, the next leaf is fetched into the pool before the current
+        rows are yielded; without it, the disk is told the next leaf is
+        wanted, a hint that covers only that leaf's pages.  If the tree was
+        split or merged while the rows were out, the scan descends again to
+        the first key it has not seen.
+        """
+        def find() -> Buffer:
+            if reverse:
+                return self._find_leaf(end)
+            return self._find_leaf(b'' if start is None else start)
 
-        return new_page_id, new
+        with self.latch.shared():
+            buffer_ = find()
+            version = self.version
 
-    def _add_rec(self, page_id: PageID,
-                 key: bytearray, value: bytearray) -> PageID:
-        buffer_ = self.bufmgr.fetch_page(page_id)
-        if is_leaf(buffer_.page):
-            leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
-            index = bisect_left(leaf.keys, key)
-            leaf.keys.insert(index, key)
-            leaf.values.insert(index, value)
-            buffer_ = self.bufmgr.fetch_page(page_id)
-            buffer_.page = leaf.to_page()
+        while True:
+            page_id = buffer_.page_id
+            try:
+                leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+                count = leaf.key_count
+                low = 0 if start is None else leaf.search(start)
+                high = count if end is None else leaf.search(end)
+                if reverse:
+                    next_page_id = leaf.prev_page_id if low == 0 else None
+                else:
+                    next_page_id = (
+                        leaf.next_page_id if high == count else None
+                    )
+                rows = leaf.rows(low, high)
+                if reverse:
+                    rows.reverse()
+            finally:
+                self.bufmgr.unpin_page(page_id, False)
+
+            if prefetch and next_page_id is not None:
+                self.bufmgr.prefetch([next_page_id])
+            elif next_page_id is not None and abs(
+                    next_page_id.to_int() - page_id.to_int()) != 1:
+                # the kernel already reads around the page just read, so
+                # only a leaf elsewhere in the file needs the hint
+                self.bufmgr.disk.advise([next_page_id])
+            yield from rows
+            if next_page_id is None:
+                return
+            if rows and reverse:
+                end = rows[-1][0]
+            elif rows:
+                # the smallest key greater than the last one yielded
+                start = rows[-1][0] + b'\x00'
+            with self.latch.shared():
+                if self.version == version:
+                    buffer_ = self.bufmgr.fetch_page(next_page_id, False)
+                else:
+                    buffer_ = find()
+                    version = self.version
+
+    def bulk_load(self, items: Iterable[Tuple[bytes, bytes]],
+                  fill_factor: float = 1.0) -> int:
+        """Fill an empty tree from (key, value) pairs in ascending key order.
+
+        Pages are packed up to fill_factor and written sequentially, then
+        the top page is copied into the root.  Returns the number of rows.
+        """
+        with self._restructure(), \
+                self.bufmgr.page(self.root_page_id, True) as buffer_:
+            if not is_leaf(buffer_.page) or LeafPage(
+                    buffer_.page, self.key_size, self.value_size).key_count:
+                raise ValueError('bulk_load requires an empty tree')
+
+            loader = BulkLoader(self.bufmgr.disk, self.key_size,
+                                self.value_size, fill_factor)
+            for key, value in items:
+                loader.add(key, value)
+                self._bloom_add(key)
+            buffer_.page[:] = loader.finish()
             buffer_.is_dirty = True
-            return self.leaf_split(leaf, page_id)
-        else:
-            inner = InnerPage(buffer_.page, self.key_size)
-            index = bisect_left(inner.keys, key)
-            new = self._add_rec(inner.children[index], key, value)
-            if new is not None:
-                new_page_id, new_page = new
-                inner.keys.insert(index, new_page.keys[-1])
-                inner.children.insert(index, new_page_id)
-            buffer_ = self.bufmgr.fetch_page(page_id)
-            buffer_.page = inner.to_page()
+        return loader.count
+
+    def _cut_rows(self, rows: List[Row], low: Fence, high: Fence,
+                  share: float = 0.5) -> Optional[Tuple[int, bytes]]:
+        """Choose where to cut rows spread over two leaves.
+
+        The leaves are bounded by low and high, and each is stored under
+        the prefix its new bounds allow.  Returns the number of rows for
+        the left leaf and the separator, picking the cut that leaves both
+        leaves unsplit and gives the left one closest to share of the
+        bytes, or None if there is none.
+        """
+        sums = [0]
+        for key, value in rows:
+            sums.append(sums[-1] + SLOT_SIZE + CELL_HEADER_SIZE
+                        + len(key) + len(value))
+        max_cell_size = (SLOT_SIZE + CELL_HEADER_SIZE
+                         + self.key_size + self.value_size)
+
+        def size(begin: int, end: int, prefix: bytes) -> Optional[int]:
+            used = sums[end] - sums[begin] - (end - begin) * len(prefix)
+            if used > RECORD_SIZE - len(prefix) - max_cell_size:
+                return None
+            return used
+
+        best: Optional[Tuple[int, int, bytes]] = None
+        for half in range(1, len(rows)):
+            separator = shortest_separator(rows[half - 1][0], rows[half][0])
+            left = size(0, half, fence_prefix(low, separator))
+            right = size(half, len(rows), fence_prefix(separator, high))
+            if left is None or right is None:
+                continue
+            skew = abs((1 - share) * left - share * right)
+            if best is None or skew < best[0]:
+                best = (skew, half, separator)
+        return None if best is None else best[1:]
+
+    def leaf_split(self, page: LeafPage, page_id: PageID, low: Fence,
+                   high: Fence, share: float = 0.5) -> Optional[Split]:
+        if not page.is_full():
+            return None
+
+        rows = page.rows(0, page.key_count)
+        # the parts' prefixes can only grow, so the even cut and the cut
+        # before the last row always fit
+        half, separator = self._cut_rows(rows, low, high, share)
+        with self.bufmgr.new_page() as new_buffer:
+            new_page_id = new_buffer.page_id
+            new = LeafPage(new_buffer.page, self.key_size, self.value_size)
+            new.initialize()
+            new.rebuild(fence_prefix(low, separator), rows[:half])
+            new.prev_page_id = page.prev_page_id
+            new.next_page_id = page_id
+            new_buffer.is_dirty = True
+
+        page.rebuild(fence_prefix(separator, high), rows[half:])
+        if page.prev_page_id is not None:
+            with self.bufmgr.page(page.prev_page_id, True) as prev_buffer:
+                prev = LeafPage(prev_buffer.page,
+                                self.key_size, self.value_size)
+                prev.next_page_id = new_page_id
+                prev_buffer.is_dirty = True
+        page.prev_page_id = new_page_id
+        self.stats.leaf_splits += 1
+        self._event('btree.split', page_id=page_id, new_page_id=new_page_id,
+                    leaf=True)
+        return separator, new_page_id
+
+    def inner_split(self, page: InnerPage, page_id: PageID,
+                    share: float = 0.5) -> Optional[Split]:
+        if not page.is_full():
+            return None
+
+        half = max(2, page.split_index(share))
+        with self.bufmgr.new_page() as new_buffer:
+            new = InnerPage(new_buffer.page, self.key_size)
+            new.initialize()
+            new.insert_cells(0, page.cells(0, half))
+            # the separator moves up, so its child becomes the rightmost one
+            separator = new.key(half - 1)
+            new.truncate(half - 1)
+            new_buffer.is_dirty = True
+
+        page.delete_cells(0, half)
+        self.stats.inner_splits += 1
+        self._event('btree.split', page_id=page_id,
+                    new_page_id=new_buffer.page_id, leaf=False)
+        return separator, new_buffer.page_id
+
+    @staticmethod
+    def _child_fences(inner: InnerPage, index: int, low: Fence,
+                      high: Fence) -> Tuple[Fence, Fence]:
+        """Return the separators bounding child(index) of inner."""
+        if index > 0:
+            low = inner.key(index - 1)
+        if index < inner.key_count:
+            high = inner.key(index)
+        return low, high
+
+    def _add_rec(self, page_id: PageID, key: bytes, value: bytes,
+                 create: bool, replace: bool, low: Fence,
+                 high: Fence) -> Tuple[bool, Optional[Split]]:
+        """Put key below page_id, whose keys k satisfy low < k <= high.
+
+        Returns whether key was present, and the split made if the page
+        became full.
+        """
+        with self.bufmgr.page(page_id, True) as buffer_:
+            if is_leaf(buffer_.page):
+                leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+                index = leaf.search(key)
+                found = index < leaf.key_count and leaf.key(index) == key
+                if not (replace if found else create):
+                    return found, None
+                if found:
+                    leaf.delete_cells(index, index + 1)
+                else:
+                    self._bloom_add(key)
+                leaf.insert(index, key, value)
+                buffer_.is_dirty = True
+                return found, self.leaf_split(
+                    leaf, page_id, low, high,
+                    self._split_share(leaf, index, high)
+                )
+            else:
+                inner = InnerPage(buffer_.page, self.key_size)
+                index = inner.search(key)
+                found, new = self._add_rec(
+                    inner.child(index), key, value, create, replace,
+                    *self._child_fences(inner, index, low, high)
+                )
+                if new is None:
+                    return found, None
+                separator, new_page_id = new
+                inner.insert(index, separator, new_page_id)
+                buffer_.is_dirty = True
+                return found, self.inner_split(
+                    inner, page_id, self._split_share(inner, index, high)
+                )
+
+    @staticmethod
+    def _split_share(page: SlottedPage, index: int, high: Fence) -> float:
+        """Return the share to split at after an insert at index of page.
+
+        A page without an upper bound is the rightmost of its level, and
+        an insert after its last cell is taken for an append.
+        """
+        if high is None and index == page.key_count - 1:
+            return APPEND_SPLIT_SHARE
+        return 0.5
+
+    def _rebalance_leaves(self, parent: InnerPage, index: int,
+                          left_page_id: PageID, right_page_id: PageID,
+                          low: Fence, high: Fence) -> None:
+        """Merge or even out two sibling leaves bounded by low and high."""
+        with self.bufmgr.page(left_page_id, True) as left_buffer, \
+                self.bufmgr.page(right_page_id, True) as right_buffer:
+            left = LeafPage(left_buffer.page, self.key_size, self.value_size)
+            right = LeafPage(right_buffer.page,
+                             self.key_size, self.value_size)
+            rows = (left.rows(0, left.key_count)
+                    + right.rows(0, right.key_count))
+
+            # merging widens the bounds, so the prefix may get shorter
+            prefix = fence_prefix(low, high)
+            used = sum(LeafPage.cell_space_for(key, value)
+                       for key, value in rows) - len(rows) * len(prefix)
+            merge = used <= RECORD_SIZE - len(prefix) - right.max_cell_size
+            if merge:
+                right.rebuild(prefix, rows)
+                prev_page_id = left.prev_page_id
+                right.prev_page_id = prev_page_id
+                right_buffer.is_dirty = True
+            else:
+                cut = self._cut_rows(rows, low, high)
+                if cut is None:
+                    return
+                half, separator = cut
+                left.rebuild(fence_prefix(low, separator), rows[:half])
+                right.rebuild(fence_prefix(separator, high), rows[half:])
+                left_buffer.is_dirty = True
+                right_buffer.is_dirty = True
+                parent.set_key(index, separator)
+
+        if merge:
+            if prev_page_id is not None:
+                with self.bufmgr.page(prev_page_id, True) as prev_buffer:
+                    prev = LeafPage(prev_buffer.page,
+                                    self.key_size, self.value_size)
+                    prev.next_page_id = right_page_id
+                    prev_buffer.is_dirty = True
+            self.bufmgr.free_page(left_page_id)
+            parent.delete_cells(index, index + 1)
+            self.stats.merges += 1
+            self._event('btree.merge', page_id=right_page_id,
+                        freed_page_id=left_page_id, leaf=True)
+
+    def _rebalance_inners(self, parent: InnerPage, index: int,
+                          left_page_id: PageID,
+                          right_page_id: PageID) -> None:
+        with self.bufmgr.page(left_page_id, True) as left_buffer, \
+                self.bufmgr.page(right_page_id, True) as right_buffer:
+            left = InnerPage(left_buffer.page, self.key_size)
+            right = InnerPage(right_buffer.page, self.key_size)
+            left_buffer.is_dirty = True
+            right_buffer.is_dirty = True
+            separator = parent.key(index)
+
+            total = (left.used_space() + right.used_space()
+                     + InnerPage.cell_space_for(separator))
+            merge = total <= left.capacity - left.max_cell_size
+            if merge:
+                right.insert(0, separator, left.child(left.key_count))
+                right.insert_cells(0, left.cells(0, left.key_count))
+            else:
+                # rotate keys through the parent one at a time, as long as
+                # that evens out the bytes and leaves the receiver unsplit
+                while left.key_count > 1 and (
+                        left.used_space() - right.used_space()
+                        > left.cell_space(left.key_count - 1)) and (
+                        right.free_space() - right.max_cell_size
+                        >= InnerPage.cell_space_for(separator)):
+                    count = left.key_count
+                    right.insert(0, separator, left.child(count))
+                    separator = left.key(count - 1)
+                    left.truncate(count - 1)
+                while right.key_count > 1 and (
+                        right.used_space() - left.used_space()
+                        > right.cell_space(0)) and (
+                        left.free_space() - left.max_cell_size
+                        >= InnerPage.cell_space_for(separator)):
+                    count = left.key_count
+                    left.insert(count, separator, left.child(count))
+                    left.set_child(count + 1, right.child(0))
+                    separator = right.key(0)
+                    right.delete_cells(0, 1)
+                parent.set_key(index, separator)
+
+        if merge:
+            self.bufmgr.free_page(left_page_id)
+            parent.delete_cells(index, index + 1)
+            self.stats.merges += 1
+            self._event('btree.merge', page_id=right_page_id,
+                        freed_page_id=left_page_id, leaf=False)
+
+    def _remove_rec(self, page_id: PageID, key: bytes, low: Fence,
+                    high: Fence) -> Optional[Tuple[bool, Optional[Split]]]:
+        """Remove key below page_id, whose keys k satisfy low < k <= high.
+
+        Returns None if the key was not found.  Otherwise returns whether
+        the page is now less than half full and should be rebalanced by
+        its parent, and the split made if a longer separator written by a
+        rebalance below left the page full.
+        """
+        with self.bufmgr.page(page_id, True) as buffer_:
+            if is_leaf(buffer_.page):
+                leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+                index = leaf.search(key)
+                if index == leaf.key_count or leaf.key(index) != key:
+                    return None
+                leaf.delete_cells(index, index + 1)
+                buffer_.is_dirty = True
+                return leaf.is_underflow(), None
+
+            parent = InnerPage(buffer_.page, self.key_size)
+            index = parent.search(key)
+            child = parent.child(index)
+            result = self._remove_rec(
+                child, key, *self._child_fences(parent, index, low, high)
+            )
+            if result is None:
+                return None
+            underflow, split = result
+            if split is not None:
+                separator, new_page_id = split
+                parent.insert(index, separator, new_page_id)
+            elif not underflow:
+                return False, None
+            elif parent.key_count > 0:
+                index = index - 1 if index > 0 else 0
+                left_page_id = parent.child(index)
+                right_page_id = parent.child(index + 1)
+                with self.bufmgr.page(child, False) as child_buffer:
+                    leaf_children = is_leaf(child_buffer.page)
+                if leaf_children:
+                    low, _ = self._child_fences(parent, index, low, high)
+                    _, high = self._child_fences(parent, index + 1, low, high)
+                    self._rebalance_leaves(parent, index,
+                                           left_page_id, right_page_id,
+                                           low, high)
+                else:
+                    self._rebalance_inners(parent, index,
+                                           left_page_id, right_page_id)
             buffer_.is_dirty = True
-            return self.inner_split(inner, page_id)
+            return parent.is_underflow(), self.inner_split(parent, page_id)
+
+    @timed
+    def remove(self, key: bytes) -> bool:
+        with self.latch.shared():
+            buffer_ = self._find_leaf(key, exclusive=True)
+            is_root = buffer_.page_id == self.root_page_id
+        try:
+            leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+            index = leaf.search(key)
+            if index == leaf.key_count or leaf.key(index) != key:
+                return False
+            if is_root or not leaf.underflows_without(index):
+                leaf.delete_cells(index, index + 1)
+                buffer_.is_dirty = True
+                return True
+        finally:
+            self.bufmgr.unpin_page(buffer_.page_id, True)
 
-    def add(self, key: bytearray, value: bytearray) -> bool:
-        if key in self:
+        # the leaf has to be rebalanced with a sibling
+        with self._restructure():
+            return self._remove(key)
+
+    def _remove(self, key: bytes) -> bool:
+        result = self._remove_rec(self.root_page_id, key, None, None)
+        if result is None:
             return False
+        _, split = result
+        if split is not None:
+            self._grow_root(split)
+            return True
+
+        with self.bufmgr.page(self.root_page_id, False) as buffer_:
+            child = None
+            if not is_leaf(buffer_.page):
+                root = InnerPage(buffer_.page, self.key_size)
+                if root.key_count == 0:
+                    child = root.child(0)
+        if child is not None:
+            self.bufmgr.free_page(self.root_page_id)
+            self._set_root(child)
+            self.stats.root_shrinks += 1
+            self._event('btree.shrink', root_page_id=child)
+        return True
 
-        new = self._add_rec(self.root_page_id, key, value)
-        if new is not None:
-            page_id_l, page_l = new
-            new_root_buffer = self.bufmgr.create_page()
+    def _grow_root(self, split: Split) -> None:
+        separator, new_page_id = split
+        with self.bufmgr.new_page() as new_root_buffer:
             new_root = InnerPage(new_root_buffer.page, self.key_size)
-            new_root.keys.insert(0, page_l.keys_pop())
-            new_root.children.insert(0, page_id_l)
-            new_root.children.insert(1, self.root_page_id)
-            self.root_page_id = new_root_buffer.page_id
+            new_root.initialize()
+            new_root.set_child(0, self.root_page_id)
+            new_root.insert(0, separator, new_page_id)
+            new_root_buffer.is_dirty = True
+            self._set_root(new_root_buffer.page_id)
+        self.stats.root_grows += 1
+        self._event('btree.grow', root_page_id=self.root_page_id)
 
-            buffer_ = self.bufmgr.fetch_page(page_id_l)
-            buffer_.page = page_l.to_page()
-            buffer_.is_dirty = True
+    @timed
+    def add(self, key: bytes, value: bytes) -> bool:
+        """Insert key unless it is present; return whether it was added."""
+        return not self._put(key, value, create=True, replace=False)
 
-            buffer_ = self.bufmgr.fetch_page(self.root_page_id)
-            buffer_.page = new_root.to_page()
-            buffer_.is_dirty = True
-        return True
+    insert = add
+
+    @timed
+    def upsert(self, key: bytes, value: bytes) -> bool:
+        """Insert key or replace its value; return whether it was added."""
+        return not self._put(key, value, create=True, replace=True)
+
+    @timed
+    def update(self, key: bytes, value: bytes) -> bool:
+        """Replace the value of key if present; return whether it was."""
+        return self._put(key, value, create=False, replace=True)
+
+    def _put(self, key: bytes, value: bytes, create: bool,
+             replace: bool) -> bool:
+        """Insert key if create, or replace its value if replace.
+
+        Whether key is present is learnt at the leaf, so the tree is
+        descended once.  A value of the same length is written over the
+        old one, and a replacement only restructures the tree when a
+        longer value does not fit in the leaf.  Returns whether key was
+        present.
+        """
+        if len(key) > self.key_size or len(value) > self.value_size:
+            raise ValueError('key or value is longer than the tree allows')
+        bloom = self.bloom
+        if bloom is not None and create and bloom.is_full():
+            self._grow_bloom()
+        elif bloom is not None and not create and key not in bloom:
+            return False
+        with self.latch.shared():
+            buffer_ = self._rightmost_leaf(key) if create else None
+            if buffer_ is None:
+                buffer_ = self._find_leaf(key, exclusive=True)
+            version = self.version
+        try:
+            leaf = LeafPage(buffer_.page, self.key_size, self.value_size)
+            index = leaf.search(key)
+            found = index < leaf.key_count and leaf.key(index) == key
+            if not (replace if found else create):
+                return found
+            if found and leaf.replace_value(index, value):
+                buffer_.is_dirty = True
+                return True
+            if not found and leaf.has_room_for(key, value):
+                self._bloom_add(key)
+                leaf.insert(index, key, value)
+                buffer_.is_dirty = True
+                if leaf.next_page_id is None:
+                    self.rightmost = (buffer_.page_id, version)
+                return False
+        finally:
+            self.bufmgr.unpin_page(buffer_.page_id, True)
+
+        # the leaf has to split; it may have changed since it was let go,
+        # so whether key is present is learnt again on the way down
+        with self._restructure():
+            found, new = self._add_rec(self.root_page_id, key, value,
+                                       create, replace, None, None)
+            if new is not None:
+                self._grow_root(new)
+            return found
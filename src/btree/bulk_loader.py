@@ -0,0 +1,154 @@
+from typing import List, Optional, Tuple
+from src.disk import PageID, DiskManager
+from src.buffer import Page
+from src.btree.leaf_page import LeafPage
+from src.btree.inner_page import InnerPage
+from src.btree.prefix import shortest_separator, fence_prefix
+
+
+BULK_WRITE_PAGES: int = 64
+
+
+class BulkLoader:
+    """Build a B-tree bottom-up from rows given in ascending key order.
+
+    Leaves are packed one after another and linked as they are started.
+    Every level above keeps one open inner page; when it is full it is
+    written out and pushed to the level above.  Finished pages go straight
+    to the DiskManager in batches, bypassing the buffer pool, and the page
+    left at the top is returned by finish() for the caller to install as
+    the root.  Since those writes skip the write-ahead log, the pages
+    are taken past the end of the file rather than from the free list.
+    """
+    disk: DiskManager
+    key_size: int
+    value_size: int
+    leaf_limit: int
+    inner_limit: int
+
+    leaf: Optional[LeafPage]
+    leaf_page_id: Optional[PageID]
+    last_key: Optional[bytes]
+    low: Optional[bytes]
+    levels: List[Optional[InnerPage]]
+    max_keys: List[bytes]
+    pending: List[Tuple[PageID, memoryview]]
+    count: int
+
+    def __init__(self, disk: DiskManager, key_size: int, value_size: int,
+                 fill_factor: float) -> None:
+        if not 0 < fill_factor <= 1:
+            raise ValueError('fill_factor must be in (0, 1]')
+        self.disk = disk
+        self.key_size = key_size
+        self.value_size = value_size
+        # A page without room for the largest cell is split, so leave that
+        # much free; every page still gets at least one key.
+        leaf = LeafPage.empty_leaf(key_size, value_size)
+        self.leaf_limit = int(
+            (leaf.capacity - leaf.max_cell_size) * fill_factor
+        )
+        inner = InnerPage.empty_inner(key_size)
+        self.inner_limit = int(
+            (inner.capacity - inner.max_cell_size) * fill_factor
+        )
+
+        self.leaf = None
+        self.leaf_page_id = None
+        self.last_key = None
+        self.low = None
+        self.levels = []
+        self.max_keys = []
+        self.pending = []
+        self.count = 0
+
+    def add(self, key: bytes, value: bytes) -> None:
+        if self.last_key is not None and key <= self.last_key:
+            raise ValueError('bulk_load requires strictly ascending keys')
+        if self.leaf is None:
+            self.leaf = LeafPage.empty_leaf(self.key_size, self.value_size)
+        elif self.leaf.key_count and (
+                self.leaf.used_space() + LeafPage.cell_space_for(key, value)
+                > self.leaf_limit):
+            self._next_leaf(key)
+        self.leaf.insert(self.leaf.key_count, key, value)
+        self.last_key = bytes(key)
+        self.count += 1
+
+    def finish(self) -> Page:
+        """Write out everything below the root and return the root page."""
+        if self.leaf is None:
+            return LeafPage.empty_leaf(self.key_size, self.value_size).page
+        if self.leaf_page_id is None:
+            return self.leaf.page
+
+        self._emit_leaf(self.last_key)
+        level = 0
+        while level < len(self.levels) - 1:
+            if self.levels[level] is not None:
+                self._emit_inner(level)
+            level += 1
+        self._flush()
+        # the pages skip the write-ahead log, so they must be durable
+        # before the root that points at them can be committed
+        self.disk.sync()
+        return self.levels[-1].page
+
+    def _next_leaf(self, next_key: bytes) -> None:
+        if self.leaf_page_id is None:
+            self.leaf_page_id = self.disk.allocate_page(reuse=False)
+        prev_page_id = self.leaf_page_id
+        page_id = self.disk.allocate_page(reuse=False)
+        self.leaf.next_page_id = page_id
+        # the leaf was filled without a prefix, so this only shrinks it
+        separator = shortest_separator(self.last_key, next_key)
+        self.leaf.set_prefix(fence_prefix(self.low, separator))
+        self.low = separator
+        self._emit_leaf(separator)
+
+        self.leaf = LeafPage.empty_leaf(self.key_size, self.value_size)
+        self.leaf.prev_page_id = prev_page_id
+        self.leaf_page_id = page_id
+
+    def _emit_leaf(self, separator: bytes) -> None:
+        self._write(self.leaf_page_id, self.leaf.page)
+        self._push(0, self.leaf_page_id, separator)
+
+    def _emit_inner(self, level: int) -> None:
+        node = self.levels[level]
+        self.levels[level] = None
+        page_id = self.disk.allocate_page(reuse=False)
+        self._write(page_id, node.page)
+        self._push(level + 1, page_id, self.max_keys[level])
+
+    def _push(self, level: int, page_id: PageID, max_key: bytes) -> None:
+        """Append a finished child page whose keys are all <= max_key."""
+        if level == len(self.levels):
+            self.levels.append(None)
+            self.max_keys.append(b'')
+        node = self.levels[level]
+        if node is None:
+            node = InnerPage.empty_inner(self.key_size)
+            node.set_child(0, page_id)
+            self.levels[level] = node
+        elif node.key_count and (
+                node.used_space()
+                + InnerPage.cell_space_for(self.max_keys[level])
+                > self.inner_limit):
+            self._emit_inner(level)
+            self._push(level, page_id, max_key)
+            return
+        else:
+            last = node.key_count
+            node.insert(last, self.max_keys[level], node.child(last))
+            node.set_child(last + 1, page_id)
+        self.max_keys[level] = max_key
+
+    def _write(self, page_id: PageID, page: memoryview) -> None:
+        self.pending.append((page_id, page))
+        if len(self.pending) >= BULK_WRITE_PAGES:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.disk.write_pages(self.pending)
+        self.pending = []
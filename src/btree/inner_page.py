@@ -1,99 +1,142 @@
 from __future__ import annotations
-from typing import List
+from array import array
 from src.disk import PAGE_SIZE, PageID
 from src.buffer import Page
+from src.btree.slotted_page import SlottedPage, SLOT_SIZE
 
 """
 HEADER
-0            1                 5
-+------------+-----------------+
-| [int] flag | [int] key_count |
-+------------+-----------------+
+0            1                  5                 7                9
++------------+------------------+-----------------+----------------+
+| [int] flag | [int] last_child | [int] key_count | [int] free_end |
++------------+------------------+-----------------+----------------+
+9               11
++---------------+
+| [int] garbage |
++---------------+
 
 CELL
-0                    4          4 + key_size
-+--------------------+-------------+
-|[int] child_page_id | [bytes] key |
-+--------------------+-------------+
+0                    4                6
++--------------------+----------------+-------------+
+|[int] child_page_id | [int] key_size | [bytes] key |
++--------------------+----------------+-------------+
 
-PAGE = HEADER + CELL + CELL + CELL + ...
+PAGE = HEADER + SLOT + SLOT + ... + free space + ... + CELL + CELL
+
+An InnerPage with key_count keys has key_count + 1 children; the child of
+cell i holds the keys <= key(i), and the last child, which has no key,
+is kept in the header.  Like LeafPage, an InnerPage is a slotted page
+(see slotted_page) whose keys may be any length up to key_size.
 """
 
 FLAG: int                = 0
 LEAF_BIT: int            = 0b00000001
 
-KEY_COUNT_BEGIN: int     = 1
-KEY_COUNT_END: int       = 5
+LAST_CHILD_BEGIN: int    = 1
+LAST_CHILD_END: int      = 5
+
+KEY_COUNT_BEGIN: int     = 5
+KEY_COUNT_END: int       = 7
 
-CELL_BEGIN: int          = 5
+SLOT_BEGIN: int          = 11
 
 PAGE_ID_SIZE: int        = 4
-RECORD_SIZE: int         = PAGE_SIZE - CELL_BEGIN
+LENGTH_SIZE: int         = 2
+CELL_HEADER_SIZE: int    = PAGE_ID_SIZE + LENGTH_SIZE
 
+RECORD_SIZE: int         = PAGE_SIZE - SLOT_BEGIN
 
-class InnerPage:
-    key_size: int
-    max_key_count: int
 
-    keys: List[bytearray]
-    children: List[PageID]
+class InnerPage(SlottedPage):
+    __slots__ = ('key_size',)
+    key_size: int
 
     def __init__(self, page: Page, key_size: int) -> None:
         self.key_size = key_size
-        self.max_key_count = (
-            (RECORD_SIZE - PAGE_ID_SIZE) // (PAGE_ID_SIZE + key_size)
-        )
-        self.keys = self._parse_keys(page)
-        self.children = self._parse_children(page)
+        max_cell_size = SLOT_SIZE + CELL_HEADER_SIZE + key_size
+        if 4 * max_cell_size > RECORD_SIZE:
+            raise ValueError('key_size is too large for a page')
+        super().__init__(page, KEY_COUNT_BEGIN, SLOT_BEGIN, max_cell_size)
 
     @staticmethod
     def empty_inner(key_size: int) -> InnerPage:
-        page = bytearray(PAGE_SIZE)
-        inner = InnerPage(page, key_size)
-        inner.children = []
+        inner = InnerPage(bytearray(PAGE_SIZE), key_size)
+        inner.initialize()
         return inner
 
-    def _parse_key_count(self, page: Page) -> int:
-        count = int.from_bytes(page[KEY_COUNT_BEGIN:KEY_COUNT_END], 'big')
-        return count
-
-    def _parse_keys(self, page: Page) -> List[bytearray]:
-        keys = []
-        begin = CELL_BEGIN + PAGE_ID_SIZE
-        for _ in range(self._parse_key_count(page)):
-            end = begin + self.key_size
-            keys.append(page[begin:end])
-            begin += PAGE_ID_SIZE + self.key_size
-        return keys
-
-    def _parse_children(self, page: Page) -> List[PageID]:
-        children = []
-        begin = CELL_BEGIN
-        for _ in range(self._parse_key_count(page) + 1):
-            end = begin + PAGE_ID_SIZE
-            children.append(PageID(int.from_bytes(page[begin:end], 'big')))
-            begin += PAGE_ID_SIZE + self.key_size
-        return children
+    def initialize(self) -> None:
+        self.page[:SLOT_BEGIN] = bytes(SLOT_BEGIN)
+        self.initialize_slots()
 
-    def keys_pop(self) -> bytearray:
-        return self.keys.pop()
+    def _cell_size(self, offset: int) -> int:
+        begin = offset + PAGE_ID_SIZE
+        return CELL_HEADER_SIZE + int.from_bytes(
+            self.page[begin:begin + LENGTH_SIZE], 'big'
+        )
+
+    @staticmethod
+    def cell_space_for(key: bytes) -> int:
+        """Bytes a cell holding key takes, with its slot."""
+        return SLOT_SIZE + CELL_HEADER_SIZE + len(key)
+
+    def key(self, index: int) -> bytes:
+        return bytes(self.cell(index)[CELL_HEADER_SIZE:])
+
+    def set_key(self, index: int, key: bytes) -> None:
+        child = self.child(index)
+        self.delete_cells(index, index + 1)
+        self.insert(index, key, child)
+
+    def child(self, index: int) -> PageID:
+        if index == self.key_count:
+            begin = LAST_CHILD_BEGIN
+        else:
+            begin = self._offset(index)
+        return PageID(
+            int.from_bytes(self.page[begin:begin + PAGE_ID_SIZE], 'big')
+        )
 
-    def to_page(self) -> Page:
-        page = bytearray(PAGE_SIZE)
+    def children(self) -> 'array[int]':
+        """Return the key_count + 1 child page IDs as an array of ints."""
+        children = array('I', (
+            int.from_bytes(self.page[begin:begin + PAGE_ID_SIZE], 'big')
+            for begin in map(self._offset, range(self.key_count))
+        ))
+        children.append(int.from_bytes(
+            self.page[LAST_CHILD_BEGIN:LAST_CHILD_END], 'big'
+        ))
+        return children
 
-        size = KEY_COUNT_END - KEY_COUNT_BEGIN
-        page[KEY_COUNT_BEGIN:KEY_COUNT_END] = (
-            len(self.keys).to_bytes(size, 'big')
+    def set_child(self, index: int, page_id: PageID) -> None:
+        if index == self.key_count:
+            begin = LAST_CHILD_BEGIN
+        else:
+            begin = self._offset(index)
+        self.page[begin:begin + PAGE_ID_SIZE] = (
+            page_id.to_int().to_bytes(PAGE_ID_SIZE, 'big')
         )
-        begin = CELL_BEGIN + PAGE_ID_SIZE
-        for key in self.keys:
-            end = begin + self.key_size
-            page[begin:end] = key
-            begin += PAGE_ID_SIZE + self.key_size
-
-        begin = CELL_BEGIN
-        for child in self.children:
-            end = begin + PAGE_ID_SIZE
-            page[begin:end] = child.to_int().to_bytes(PAGE_ID_SIZE, 'big')
-            begin += PAGE_ID_SIZE + self.key_size
-        return page
+
+    def search(self, key: bytes) -> int:
+        """Return the index of the child whose subtree may contain key."""
+        low, high = 0, self.key_count
+        while low < high:
+            mid = (low + high) // 2
+            if self.key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def insert(self, index: int, key: bytes, child: PageID) -> None:
+        """Insert key at index with child as its left neighbour."""
+        cell = bytearray(CELL_HEADER_SIZE)
+        cell[:PAGE_ID_SIZE] = child.to_int().to_bytes(PAGE_ID_SIZE, 'big')
+        cell[PAGE_ID_SIZE:] = len(key).to_bytes(LENGTH_SIZE, 'big')
+        cell += key
+        self.insert_cell(index, cell)
+
+    def truncate(self, count: int) -> None:
+        """Drop the keys from index count on; child(count) becomes last."""
+        last_child = self.child(count)
+        self.delete_cells(count, self.key_count)
+        self.set_child(count, last_child)
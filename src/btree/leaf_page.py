@@ -1,22 +1,40 @@
 from __future__ import annotations
-from typing import List
+from typing import List, Optional, Tuple
 from src.disk import PAGE_SIZE, PageID
 from src.buffer import Page
+from src.btree.slotted_page import SlottedPage, SLOT_SIZE
 
 """
 HEADER
-0            1                    5                    9                 13
-+------------+--------------------+--------------------+-----------------+
-| [int] flag | [int] prev_page_id | [int] next_page_id | [int] key_count |
-+------------+--------------------+--------------------+-----------------+
+0            1                    5                    9
++------------+--------------------+--------------------+
+| [int] flag | [int] prev_page_id | [int] next_page_id |
++------------+--------------------+--------------------+
+9                 11               13              15                17
++-----------------+----------------+---------------+-------------------+
+| [int] key_count | [int] free_end | [int] garbage | [int] prefix_size |
++-----------------+----------------+---------------+-------------------+
+17
++----------------+
+| [bytes] prefix |
++----------------+
 
 CELL
-0          key_size        key_size + value_size
-+-------------+---------------+
-| [bytes] key | [bytes] value |
-+-------------+---------------+
+0                2                  4
++----------------+------------------+----------------+---------------+
+| [int] key_size | [int] value_size | [bytes] suffix | [bytes] value |
++----------------+------------------+----------------+---------------+
 
-PAGE = HEADER + CELL + CELL + CELL + ...
+PAGE = HEADER + SLOT + SLOT + ... + free space + ... + CELL + CELL
+
+A LeafPage is a slotted page (see slotted_page) viewed over the page bytes
+held by a Buffer.  key_size and value_size are the longest key and value
+it accepts; the keys and values stored may be any length up to those.
+
+Every key in the page starts with prefix, which is stored once in the
+header while the cells keep only the rest of the key.  BTree picks the
+prefix from the separators that bound the page, so that any key that may
+later be inserted shares it too.
 """
 
 
@@ -32,98 +50,201 @@ NEXT_PAGE_ID_BEGIN: int = 5
 NEXT_PAGE_ID_END: int   = 9
 
 KEY_COUNT_BEGIN: int    = 9
-KEY_COUNT_END: int      = 13
+KEY_COUNT_END: int      = 11
+
+PREFIX_SIZE_BEGIN: int  = 15
+PREFIX_SIZE_END: int    = 17
+
+PREFIX_BEGIN: int       = 17
+
+LENGTH_SIZE: int        = 2
+CELL_HEADER_SIZE: int   = 2 * LENGTH_SIZE
 
-CELL_BEGIN: int         = 13
+RECORD_SIZE: int        = PAGE_SIZE - PREFIX_BEGIN
 
-RECORD_SIZE: int        = PAGE_SIZE - CELL_BEGIN
+Row = Tuple[bytes, bytes]
 
 
-class LeafPage:
+class LeafPage(SlottedPage):
+    __slots__ = ('key_size', 'value_size', 'prefix')
     key_size: int
     value_size: int
-    max_key_count: int
-
-    prev_page_id: PageID
-    next_page_id: PageID
-    keys: List[bytearray]
-    values: List[bytearray]
+    prefix: bytes
 
     def __init__(self, page: Page, key_size: int, value_size: int) -> None:
         self.key_size = key_size
         self.value_size = value_size
-        self.max_key_count = RECORD_SIZE // (key_size + value_size)
-
-        self.prev_page_id = self._parse_prev_page_id(page)
-        self.next_page_id = self._parse_next_page_id(page)
-        self.keys = self._parse_keys(page)
-        self.values = self._parse_values(page)
+        max_cell_size = SLOT_SIZE + CELL_HEADER_SIZE + key_size + value_size
+        # the prefix may take up to key_size bytes of the page
+        if 4 * max_cell_size + key_size > RECORD_SIZE:
+            raise ValueError('key and value sizes are too large for a page')
+        super().__init__(page, KEY_COUNT_BEGIN, PREFIX_BEGIN, max_cell_size)
+        prefix_size = int.from_bytes(
+            self.page[PREFIX_SIZE_BEGIN:PREFIX_SIZE_END], 'big'
+        )
+        self._place_prefix(
+            bytes(self.page[PREFIX_BEGIN:PREFIX_BEGIN + prefix_size])
+        )
 
     @staticmethod
     def empty_leaf(key_size: int, value_size: int) -> LeafPage:
-        page = bytearray(PAGE_SIZE)
-        page[FLAG] |= LEAF_BIT
-        return LeafPage(page, key_size, value_size)
-
-    def _parse_prev_page_id(self, page: Page) -> PageID:
-        if not (page[FLAG] & PREV_PAGE_BIT):
+        leaf = LeafPage(bytearray(PAGE_SIZE), key_size, value_size)
+        leaf.initialize()
+        return leaf
+
+    def initialize(self) -> None:
+        self.page[:PREFIX_BEGIN] = bytes(PREFIX_BEGIN)
+        self.page[FLAG] = LEAF_BIT
+        self._place_prefix(b'')
+        self.initialize_slots()
+
+    def _place_prefix(self, prefix: bytes) -> None:
+        self.prefix = prefix
+        self.slot_begin = PREFIX_BEGIN + len(prefix)
+        self.capacity = PAGE_SIZE - self.slot_begin
+
+    def rebuild(self, prefix: bytes, rows: List[Row]) -> None:
+        """Replace the cells with rows, stored under a new prefix."""
+        size = PREFIX_SIZE_END - PREFIX_SIZE_BEGIN
+        self.page[PREFIX_SIZE_BEGIN:PREFIX_SIZE_END] = (
+            len(prefix).to_bytes(size, 'big')
+        )
+        self.page[PREFIX_BEGIN:PREFIX_BEGIN + len(prefix)] = prefix
+        self._place_prefix(prefix)
+        self.initialize_slots()
+        for i, (key, value) in enumerate(rows):
+            self.insert(i, key, value)
+
+    def set_prefix(self, prefix: bytes) -> None:
+        self.rebuild(prefix, self.rows(0, self.key_count))
+
+    @property
+    def prev_page_id(self) -> Optional[PageID]:
+        if not (self.page[FLAG] & PREV_PAGE_BIT):
             return None
-        id_ = int.from_bytes(page[PREV_PAGE_ID_BEGIN:PREV_PAGE_ID_END], 'big')
+        id_ = int.from_bytes(
+            self.page[PREV_PAGE_ID_BEGIN:PREV_PAGE_ID_END], 'big'
+        )
         return PageID(id_)
 
-    def _parse_next_page_id(self, page: Page) -> PageID:
-        if not (page[FLAG] & NEXT_PAGE_BIT):
+    @prev_page_id.setter
+    def prev_page_id(self, page_id: Optional[PageID]) -> None:
+        if page_id is None:
+            self.page[FLAG] &= ~PREV_PAGE_BIT
+            return
+        self.page[FLAG] |= PREV_PAGE_BIT
+        size = PREV_PAGE_ID_END - PREV_PAGE_ID_BEGIN
+        self.page[PREV_PAGE_ID_BEGIN:PREV_PAGE_ID_END] = (
+            page_id.to_int().to_bytes(size, 'big')
+        )
+
+    @property
+    def next_page_id(self) -> Optional[PageID]:
+        if not (self.page[FLAG] & NEXT_PAGE_BIT):
             return None
-        id_ = int.from_bytes(page[NEXT_PAGE_ID_BEGIN:NEXT_PAGE_ID_END], 'big')
+        id_ = int.from_bytes(
+            self.page[NEXT_PAGE_ID_BEGIN:NEXT_PAGE_ID_END], 'big'
+        )
         return PageID(id_)
 
-    def _parse_key_count(self, page: Page) -> int:
-        count = int.from_bytes(page[KEY_COUNT_BEGIN:KEY_COUNT_END], 'big')
-        return count
-
-    def _parse_keys(self, page: Page) -> List[bytearray]:
-        keys = []
-        begin = CELL_BEGIN
-        for i in range(self._parse_key_count(page)):
-            end = begin + self.key_size
-            keys.append(page[begin:end])
-            begin += self.key_size + self.value_size
-        return keys
-
-    def _parse_values(self, page: Page) -> List[bytearray]:
-        values = []
-        begin = CELL_BEGIN + self.key_size
-        for i in range(self._parse_key_count(page)):
-            end = begin + self.value_size
-            values.append(page[begin:end])
-            begin += self.key_size + self.value_size
-        return values
-
-    def keys_pop(self) -> bytearray:
-        return self.keys[-1]
-
-    def to_page(self) -> Page:
-        page = bytearray(PAGE_SIZE)
-        page[FLAG] |= LEAF_BIT
-
-        id_size = PREV_PAGE_ID_END - PREV_PAGE_ID_BEGIN
-        if self.prev_page_id is not None:
-            page[FLAG] |= PREV_PAGE_BIT
-            page[PREV_PAGE_ID_BEGIN:PREV_PAGE_ID_END] = (
-                self.prev_page_id.to_int().to_bytes(id_size, 'big')
-            )
-        if self.next_page_id is not None:
-            page[FLAG] |= NEXT_PAGE_BIT
-            page[NEXT_PAGE_ID_BEGIN:NEXT_PAGE_ID_END] = (
-                self.next_page_id.to_int().to_bytes(id_size, 'big')
-            )
-        size = KEY_COUNT_END - KEY_COUNT_BEGIN
-        page[KEY_COUNT_BEGIN:KEY_COUNT_END] = (
-            len(self.keys).to_bytes(size, 'big')
+    @next_page_id.setter
+    def next_page_id(self, page_id: Optional[PageID]) -> None:
+        if page_id is None:
+            self.page[FLAG] &= ~NEXT_PAGE_BIT
+            return
+        self.page[FLAG] |= NEXT_PAGE_BIT
+        size = NEXT_PAGE_ID_END - NEXT_PAGE_ID_BEGIN
+        self.page[NEXT_PAGE_ID_BEGIN:NEXT_PAGE_ID_END] = (
+            page_id.to_int().to_bytes(size, 'big')
+        )
+
+    def _cell_size(self, offset: int) -> int:
+        header = self.page[offset:offset + CELL_HEADER_SIZE]
+        return (CELL_HEADER_SIZE + int.from_bytes(header[:LENGTH_SIZE], 'big')
+                + int.from_bytes(header[LENGTH_SIZE:], 'big'))
+
+    @staticmethod
+    def cell_space_for(key: bytes, value: bytes) -> int:
+        """Bytes a cell holding key and value takes, with its slot."""
+        return SLOT_SIZE + CELL_HEADER_SIZE + len(key) + len(value)
+
+    def has_room_for(self, key: bytes, value: bytes) -> bool:
+        """Return whether key and value fit without the page becoming full."""
+        space = self.cell_space_for(key, value) - len(self.prefix)
+        return self.free_space() - space >= self.max_cell_size
+
+    def _suffix(self, index: int) -> bytes:
+        offset = self._offset(index)
+        suffix_size = int.from_bytes(
+            self.page[offset:offset + LENGTH_SIZE], 'big'
         )
-        begin = CELL_BEGIN
-        for key, value in zip(self.keys, self.values):
-            end = begin + self.key_size + self.value_size
-            page[begin:end] = key + value
-            begin += self.key_size + self.value_size
-        return page
+        begin = offset + CELL_HEADER_SIZE
+        return bytes(self.page[begin:begin + suffix_size])
+
+    def key(self, index: int) -> bytes:
+        return self.prefix + self._suffix(index)
+
+    def value(self, index: int) -> bytes:
+        cell = self.cell(index)
+        suffix_size = int.from_bytes(cell[:LENGTH_SIZE], 'big')
+        return bytes(cell[CELL_HEADER_SIZE + suffix_size:])
+
+    def replace_value(self, index: int, value: bytes) -> bool:
+        """Replace the value of cell index, in place if its length is kept.
+
+        Returns False, changing nothing, if a longer value would leave the
+        page full; the page has to be split instead.
+        """
+        if len(value) > self.value_size:
+            raise ValueError('value is longer than the tree allows')
+        cell = self.cell(index)
+        suffix_size = int.from_bytes(cell[:LENGTH_SIZE], 'big')
+        value_size = int.from_bytes(cell[LENGTH_SIZE:CELL_HEADER_SIZE], 'big')
+        if len(value) == value_size:
+            cell[CELL_HEADER_SIZE + suffix_size:] = value
+            return True
+        if self.free_space() - len(value) + value_size < self.max_cell_size:
+            return False
+        key = self.key(index)
+        self.delete_cells(index, index + 1)
+        self.insert(index, key, value)
+        return True
+
+    def rows(self, begin: int, end: int) -> List[Row]:
+        """Return the (key, value) pairs [begin, end)."""
+        rows = []
+        for i in range(begin, end):
+            cell = self.cell(i)
+            suffix_size = int.from_bytes(cell[:LENGTH_SIZE], 'big')
+            split = CELL_HEADER_SIZE + suffix_size
+            rows.append((self.prefix + bytes(cell[CELL_HEADER_SIZE:split]),
+                         bytes(cell[split:])))
+        return rows
+
+    def search(self, key: bytes) -> int:
+        """Return the bisect_left position of key among the cells."""
+        prefix = self.prefix
+        if not key.startswith(prefix):
+            return 0 if key < prefix else self.key_count
+        suffix = key[len(prefix):]
+        low, high = 0, self.key_count
+        while low < high:
+            mid = (low + high) // 2
+            if self._suffix(mid) < suffix:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def insert(self, index: int, key: bytes, value: bytes) -> None:
+        if len(key) > self.key_size or len(value) > self.value_size:
+            raise ValueError('key or value is longer than the tree allows')
+        if not key.startswith(self.prefix):
+            raise ValueError('key does not share the page prefix')
+        suffix = key[len(self.prefix):]
+        cell = bytearray(CELL_HEADER_SIZE)
+        cell[:LENGTH_SIZE] = len(suffix).to_bytes(LENGTH_SIZE, 'big')
+        cell[LENGTH_SIZE:] = len(value).to_bytes(LENGTH_SIZE, 'big')
+        cell += suffix
+        cell += value
+        self.insert_cell(index, cell)
@@ -0,0 +1,35 @@
+from typing import Optional
+
+
+def common_prefix(a: bytes, b: bytes) -> bytes:
+    """Return the longest common prefix of a and b."""
+    low, high = 0, min(len(a), len(b))
+    # binary search on slice comparisons, which run in C
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return a[:low]
+
+
+def shortest_separator(left: bytes, right: bytes) -> bytes:
+    """Return a short key s with left <= s < right, for left < right.
+
+    This is the shortest prefix of right that is still greater than left,
+    unless that is right itself, in which case left is returned.
+    """
+    separator = right[:len(common_prefix(left, right)) + 1]
+    return separator if separator != right else left
+
+
+def fence_prefix(low: Optional[bytes], high: Optional[bytes]) -> bytes:
+    """Return the prefix shared by every key k with low < k <= high.
+
+    A bound of None means the range is open on that side, so no prefix is
+    shared.
+    """
+    if low is None or high is None:
+        return b''
+    return common_prefix(low, high)
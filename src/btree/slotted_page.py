@@ -0,0 +1,190 @@
+from typing import List
+from src.disk import PAGE_SIZE
+from src.buffer import Page
+
+"""
+PAGE
+0        slot_begin                    free_end                PAGE_SIZE
++--------+------+------+-----+---------+------+------+-----+------+
+| HEADER | SLOT | SLOT | ... |  free   | CELL | free | ... | CELL |
++--------+------+------+-----+---------+------+------+-----+------+
+
+HEADER = ... + [int] key_count + [int] free_end + [int] garbage + ...
+
+SLOT
+0                2
++----------------+
+| [int] offset   |
++----------------+
+
+Cells have variable length and are allocated downwards from the end of the
+page; the slot directory grows upwards after the header and keeps the
+cells in key order.  A deleted cell leaves a hole counted in garbage, and
+the page is compacted when an insert needs more contiguous space than is
+left between the slots and free_end.  Every page type has key_count,
+free_end and garbage, two bytes each, somewhere in its header.
+"""
+
+SLOT_SIZE: int          = 2
+FIELD_SIZE: int         = 2
+
+KEY_COUNT_OFFSET: int   = 0
+FREE_END_OFFSET: int    = 2
+GARBAGE_OFFSET: int     = 4
+
+
+class SlottedPage:
+    """Slot directory and cell heap shared by LeafPage and InnerPage.
+
+    A subclass gives the length of a cell from its first bytes through
+    _cell_size(), and max_cell_size, the space taken by the largest cell
+    it may hold.  A page whose free space falls below max_cell_size is full
+    and must be split, so an insert into a page at rest always fits.  The
+    subclass must keep max_cell_size within a quarter of the page so that
+    either half of a split page has room for it.
+    """
+    __slots__ = ('fields_begin', 'slot_begin', 'capacity', 'max_cell_size',
+                 'page')
+    fields_begin: int
+    slot_begin: int
+    capacity: int
+    max_cell_size: int
+
+    page: memoryview
+
+    def __init__(self, page: Page, fields_begin: int, slot_begin: int,
+                 max_cell_size: int) -> None:
+        self.fields_begin = fields_begin
+        self.slot_begin = slot_begin
+        self.capacity = PAGE_SIZE - slot_begin
+        self.max_cell_size = max_cell_size
+        self.page = memoryview(page)
+
+    def _field(self, offset: int) -> int:
+        begin = self.fields_begin + offset
+        return int.from_bytes(self.page[begin:begin + FIELD_SIZE], 'big')
+
+    def _set_field(self, offset: int, value: int) -> None:
+        begin = self.fields_begin + offset
+        self.page[begin:begin + FIELD_SIZE] = value.to_bytes(FIELD_SIZE, 'big')
+
+    def _cell_size(self, offset: int) -> int:
+        raise NotImplementedError
+
+    def initialize_slots(self) -> None:
+        self.key_count = 0
+        self._set_field(FREE_END_OFFSET, PAGE_SIZE)
+        self._set_field(GARBAGE_OFFSET, 0)
+
+    @property
+    def key_count(self) -> int:
+        return self._field(KEY_COUNT_OFFSET)
+
+    @key_count.setter
+    def key_count(self, count: int) -> None:
+        self._set_field(KEY_COUNT_OFFSET, count)
+
+    def free_space(self) -> int:
+        """Bytes available for new cells and slots, after compaction."""
+        slot_end = self.slot_begin + self.key_count * SLOT_SIZE
+        return (self._field(FREE_END_OFFSET) - slot_end
+                + self._field(GARBAGE_OFFSET))
+
+    def used_space(self) -> int:
+        return self.capacity - self.free_space()
+
+    def is_full(self) -> bool:
+        return self.free_space() < self.max_cell_size
+
+    def is_underflow(self) -> bool:
+        return self.used_space() < (self.capacity - self.max_cell_size) // 2
+
+    def underflows_without(self, index: int) -> bool:
+        """Return whether the page underflows once cell index is deleted."""
+        used = self.used_space() - self.cell_space(index)
+        return used < (self.capacity - self.max_cell_size) // 2
+
+    def split_index(self, share: float = 0.5) -> int:
+        """Return how many leading cells hold about share of the used space.
+
+        The leading cells are kept from filling a page of their own.
+        """
+        target = min(int(self.used_space() * share),
+                     self.capacity - 2 * self.max_cell_size)
+        count = self.key_count
+        used = 0
+        for i in range(count - 1):
+            used += self.cell_space(i)
+            if used >= target:
+                return i + 1
+        return count - 1
+
+    def _offset(self, index: int) -> int:
+        begin = self.slot_begin + index * SLOT_SIZE
+        return int.from_bytes(self.page[begin:begin + SLOT_SIZE], 'big')
+
+    def cell(self, index: int) -> memoryview:
+        offset = self._offset(index)
+        return self.page[offset:offset + self._cell_size(offset)]
+
+    def cell_space(self, index: int) -> int:
+        """Bytes taken by a cell together with its slot."""
+        return self._cell_size(self._offset(index)) + SLOT_SIZE
+
+    def cells(self, begin: int, end: int) -> List[bytes]:
+        """Return copies of the raw cells [begin, end)."""
+        return [bytes(self.cell(i)) for i in range(begin, end)]
+
+    def compact(self) -> None:
+        cells = self.cells(0, self.key_count)
+        free_end = PAGE_SIZE
+        for i, cell in enumerate(cells):
+            free_end -= len(cell)
+            self.page[free_end:free_end + len(cell)] = cell
+            begin = self.slot_begin + i * SLOT_SIZE
+            self.page[begin:begin + SLOT_SIZE] = (
+                free_end.to_bytes(SLOT_SIZE, 'big')
+            )
+        self._set_field(FREE_END_OFFSET, free_end)
+        self._set_field(GARBAGE_OFFSET, 0)
+
+    def insert_cell(self, index: int, cell: bytes) -> None:
+        count = self.key_count
+        size = len(cell)
+        slot_end = self.slot_begin + count * SLOT_SIZE
+        if self._field(FREE_END_OFFSET) - slot_end < size + SLOT_SIZE:
+            if self.free_space() < size + SLOT_SIZE:
+                raise ValueError('page is full')
+            self.compact()
+        free_end = self._field(FREE_END_OFFSET) - size
+        self.page[free_end:free_end + size] = cell
+        self._set_field(FREE_END_OFFSET, free_end)
+
+        begin = self.slot_begin + index * SLOT_SIZE
+        self.page[begin + SLOT_SIZE:slot_end + SLOT_SIZE] = (
+            self.page[begin:slot_end]
+        )
+        self.page[begin:begin + SLOT_SIZE] = (
+            free_end.to_bytes(SLOT_SIZE, 'big')
+        )
+        self.key_count = count + 1
+
+    def insert_cells(self, index: int, cells: List[bytes]) -> None:
+        for i, cell in enumerate(cells):
+            self.insert_cell(index + i, cell)
+
+    def delete_cells(self, begin: int, end: int) -> None:
+        count = self.key_count
+        if begin == 0 and end == count:
+            self.initialize_slots()
+            return
+        garbage = self._field(GARBAGE_OFFSET)
+        for i in range(begin, end):
+            garbage += self._cell_size(self._offset(i))
+        self._set_field(GARBAGE_OFFSET, garbage)
+
+        slot_end = self.slot_begin + count * SLOT_SIZE
+        size = (end - begin) * SLOT_SIZE
+        begin = self.slot_begin + begin * SLOT_SIZE
+        self.page[begin:slot_end - size] = self.page[begin + size:slot_end]
+        self.key_count = count - size // SLOT_SIZE
@@ -1,12 +1,19 @@
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional, Sequence, Set, Tuple
+from array import array
+from contextlib import contextmanager, ExitStack
+import threading
 from src.disk import PageID, DiskManager, PAGE_SIZE
+from src.replacer import BufferID, NoFreeBufferError, Replacer, ClockReplacer
+from src.readahead import ReadAhead
+from src.latch import RWLatch
+from src.stats import StatsRegistry
 
 
-BufferID = int
 Page = bytearray
 
 
 class Buffer:
+    __slots__ = ('page_id', 'page', 'is_dirty')
     page_id: PageID
     page: Page
     is_dirty: bool
@@ -18,21 +25,30 @@ class Buffer:
 
 
 class Frame:
+    __slots__ = ('usage_count', 'pin_count', 'buffer', 'latch')
     usage_count: int
-    buffer_: Buffer
+    pin_count: int
+    buffer: Buffer
+    latch: RWLatch
 
     def __init__(self, usage_count: int, buffer_: Buffer) -> None:
         self.usage_count = usage_count
+        self.pin_count = 0
         self.buffer = buffer_
+        self.latch = RWLatch()
 
 
 class BufferPool:
     buffers: List[Frame]
-    next_victim_id: BufferID
+    replacer: Replacer
+    free_buffer_ids: 'array[BufferID]'
 
-    def __init__(self, pool_size: int) -> None:
+    def __init__(self, pool_size: int,
+                 replacer: Optional[Replacer] = None) -> None:
         self.buffers = [Frame(0, Buffer()) for _ in range(pool_size)]
-        self.next_victim_id = 0
+        self.replacer = ClockReplacer() if replacer is None else replacer
+        self.replacer.attach(self.buffers)
+        self.free_buffer_ids = array('I', reversed(range(pool_size)))
 
     def __len__(self) -> int:
         return len(self.buffers)
@@ -43,82 +59,754 @@ class BufferPool:
     def __setitem__(self, buffer_id: BufferID, buffer_: Frame) -> None:
         self.buffers[buffer_id] = buffer_
 
-    def evict(self) -> BufferID:
-        pool_size = len(self)
-        consective_pinned = 0
+    def evict(self, page_id: Optional[PageID] = None) -> BufferID:
+        """Return a buffer to load page_id into, free ones first."""
+        if self.free_buffer_ids:
+            return self.free_buffer_ids.pop()
+        return self.replacer.evict(page_id)
 
-        while True:
-            next_victim_id = self.next_victim_id
-            frame = self[next_victim_id]
-            if frame.usage_count == 0:
-                return self.next_victim_id
-            frame.usage_count -= 1
-            consective_pinned = 0
-            self.next_victim_id = self.increment_id(self.next_victim_id)
+    def release(self, buffer_id: BufferID) -> None:
+        self.replacer.remove(buffer_id)
+        self.free_buffer_ids.append(buffer_id)
 
-    def increment_id(self, buffer_id: BufferID) -> BufferID:
-        return (buffer_id + 1) % len(self)
+    def resize(self, pool_size: int) -> None:
+        """Add or drop buffers at the end; dropped ones must be empty."""
+        size = len(self.buffers)
+        if pool_size >= size:
+            self.buffers.extend(Frame(0, Buffer())
+                                for _ in range(pool_size - size))
+            self.free_buffer_ids[:0] = array(
+                'I', reversed(range(size, pool_size))
+            )
+            return
+        for buffer_id in range(pool_size, size):
+            self.replacer.remove(buffer_id)
+        self.free_buffer_ids = array('I', (
+            buffer_id for buffer_id in self.free_buffer_ids
+            if buffer_id < pool_size
+        ))
+        del self.buffers[pool_size:]
+
+
+class BufferPoolStats:
+    hits: int
+    misses: int
+    evictions: int
+    dirty_writes: int
+    eviction_writes: int
+    readahead_hits: int
+    background_writes: int
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dirty_writes = 0
+        self.eviction_writes = 0
+        self.readahead_hits = 0
+        self.background_writes = 0
+
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+
+def _log_commit(disk: DiskManager, committed_meta: Dict[PageID, bytes],
+                committed: Set[PageID]) -> int:
+    """Log the changed meta pages and a commit record; return its LSN.
+
+    committed_meta keeps the latest committed image of every meta page
+    logged since the last checkpoint; a page in committed has just been
+    logged with new contents and drops out of it.
+    """
+    wal = disk.wal
+    for page_id in committed:
+        # a reused free page no longer needs its free-list link
+        committed_meta.pop(page_id, None)
+    for page_id, data in disk.take_dirty_meta_pages():
+        wal.append_page(page_id, data)
+        committed_meta[page_id] = data
+    return wal.commit(wait=False)
+
+
+def _relog_meta(disk: DiskManager,
+                committed_meta: Dict[PageID, bytes]) -> int:
+    """Log committed_meta again as a group of its own, for a checkpoint."""
+    wal = disk.wal
+    for page_id, data in committed_meta.items():
+        wal.append_page(page_id, data)
+    return wal.commit(wait=False)
 
 
 class BufferPoolManager:
     disk: DiskManager
     pool: BufferPool
     page_table: Dict[PageID, BufferID]
+    stats: BufferPoolStats
+    pending: Set[PageID]
+    unwritten: Dict[PageID, int]
+    readahead: Optional[ReadAhead]
+    commit_lsn: int
+    committed_meta: Dict[PageID, bytes]
+    write_cursor: int
+    writing: Dict[PageID, Page]
+    latch: threading.RLock
+    io_latch: threading.Lock
+    structure_latch: RWLatch
+    registry: Optional[StatsRegistry]
 
-    def __init__(self, disk: DiskManager, pool: BufferPool) -> None:
+    def __init__(self, disk: DiskManager, pool: BufferPool,
+                 readahead: Optional[ReadAhead] = None) -> None:
         self.disk = disk
         self.pool = pool
         self.page_table = {}
+        self.stats = BufferPoolStats()
+        self.readahead = readahead
+        # With a write-ahead log, a page changed since the last commit stays
+        # pinned in pending so that it is never written back uncommitted,
+        # and a committed page remembers in unwritten the LSN of its commit
+        # until it has been written in place.
+        self.pending = set()
+        self.unwritten = {}
+        # the latest committed image of every meta page logged since the
+        # last checkpoint, for fuzzy_checkpoint() to log again
+        self.commit_lsn = 0
+        self.committed_meta = {}
+        self.write_cursor = 0
+        self.writing = {}
+        # latch guards the pool and page table, so that a BackgroundWriter
+        # can work alongside the thread using the pool; io_latch is held
+        # while pages are written in place, so that two writes of one page
+        # reach the disk in the order their images were taken
+        self.latch = threading.RLock()
+        self.io_latch = threading.Lock()
+        # held shared by a change spanning several pages, such as a split,
+        # and exclusively by commit(), so that none is logged halfway
+        self.structure_latch = RWLatch()
+        # set by StatsRegistry.attach_buffer_pool() to report events
+        self.registry = None
+
+    def _evict(self, page_id: Optional[PageID]) -> BufferID:
+        """Make a buffer available, writing back its page if dirty."""
+        buffer_id = self.pool.evict(page_id)
+        buffer_ = self.pool[buffer_id].buffer
+        evict_page_id = buffer_.page_id
+        if self.page_table.pop(evict_page_id, None) is None:
+            self._write_back(evict_page_id, buffer_)
+            return buffer_id
+        self.stats.evictions += 1
+        written = self._write_back(evict_page_id, buffer_)
+        if written:
+            self.stats.eviction_writes += 1
+        if self.registry is not None:
+            self.registry.emit('buffer.evict', page_id=evict_page_id,
+                               written=written)
+        return buffer_id
 
-    def fetch_page(self, page_id: PageID) -> Buffer:
+    def _invalidate(self, page_id: PageID) -> None:
+        if self.readahead is not None:
+            self.readahead.invalidate(page_id)
+
+    def _write_back(self, page_id: PageID, buffer_: Buffer) -> bool:
+        """Write the page in place if it has to be; return whether it was."""
+        lsn = self.unwritten.pop(page_id, None)
+        if lsn is not None:
+            self.disk.wal.flush(lsn)
+        elif not buffer_.is_dirty:
+            return False
+        with self.io_latch:
+            self.disk.write_page_data(page_id, buffer_.page)
+        self._invalidate(page_id)
+        buffer_.is_dirty = False
+        self.stats.dirty_writes += 1
+        return True
+
+    def fetch_page(self, page_id: PageID,
+                   exclusive: Optional[bool] = None) -> Buffer:
+        """Pin a page, reading it in on a miss.
+
+        With exclusive given, the frame latch is also taken, shared or
+        exclusive; pass the same value to unpin_page().  The latch is
+        waited for outside the pool latch, while the pin keeps the frame.
+        """
+        with self.latch:
+            buffer_ = self._fetch_page(page_id)
+            frame = self.pool[self.page_table[page_id]]
+        if exclusive is not None:
+            frame.latch.acquire(exclusive)
+        return buffer_
+
+    def _fetch_page(self, page_id: PageID) -> Buffer:
         if page_id in self.page_table:
             buffer_id = self.page_table[page_id]
             frame = self.pool[buffer_id]
-            frame.usage_count += 1
+            frame.pin_count += 1
+            self.pool.replacer.access(buffer_id, page_id, True)
+            self.stats.hits += 1
             return frame.buffer
 
-        buffer_id = self.pool.evict()
+        self.stats.misses += 1
+        if self.registry is not None:
+            self.registry.emit('buffer.miss', page_id=page_id)
+        buffer_id = self._evict(page_id)
         frame = self.pool[buffer_id]
-        evict_page_id = frame.buffer.page_id
 
         buffer_ = frame.buffer
-        if buffer_.is_dirty:
-            self.disk.write_page_data(evict_page_id, buffer_.page)
-
         buffer_.page_id = page_id
         buffer_.is_dirty = False
-        buffer_.page = self.disk.read_page_data(page_id)
-        frame.usage_count = 1
+        # a page marked clean but still on its way to disk is copied from
+        # the image being written
+        page = self.writing.get(page_id)
+        if page is not None:
+            page = bytearray(page)
+        elif self.readahead is not None:
+            page = self.readahead.take(page_id)
+            if page is not None:
+                self.stats.readahead_hits += 1
+        if page is None:
+            page = self.disk.read_page_data(page_id)
+        buffer_.page = page
+        frame.pin_count = 1
+        self.pool.replacer.access(buffer_id, page_id, False)
 
-        page = frame.buffer
-        self.page_table.pop(evict_page_id, None)
         self.page_table[page_id] = buffer_id
-        return page
+        return buffer_
 
-    def create_page(self) -> Buffer:
-        buffer_id = self.pool.evict()
+    def create_page(self, page_id: Optional[PageID] = None) -> Buffer:
+        """Allocate a page and pin a zeroed buffer for it.
+
+        page_id, if given, is a page already allocated from the disk.
+        """
+        with self.latch:
+            return self._create_page(page_id)
+
+    def _create_page(self, page_id: Optional[PageID]) -> Buffer:
+        buffer_id = self._evict(None)
         frame = self.pool[buffer_id]
-        evict_page_id = frame.buffer.page_id
 
-        buffer_ = frame.buffer
-        if buffer_.is_dirty:
-            self.disk.write_page_data(evict_page_id, buffer_.page)
-        page_id = self.disk.allocate_page()
+        if page_id is None:
+            page_id = self.disk.allocate_page()
+        self._invalidate(page_id)
         frame.buffer = Buffer()
         frame.buffer.page_id = page_id
         frame.buffer.is_dirty = True
-        frame.usage_count = 1
+        frame.pin_count = 1
+        self.pool.replacer.access(buffer_id, page_id, False)
 
-        page = frame.buffer
-        self.page_table.pop(evict_page_id, None)
         self.page_table[page_id] = buffer_id
-        return page
+        return frame.buffer
 
-    def flush(self) -> None:
-        for page_id, buffer_id in self.page_table.items():
+    def unpin_page(self, page_id: PageID,
+                   exclusive: Optional[bool] = None) -> None:
+        with self.latch:
+            frame = self.pool[self.page_table[page_id]]
+            self._unpin_page(page_id)
+        # released after the pin, so that whoever waits on the latch to
+        # free the page finds it unpinned
+        if exclusive is not None:
+            frame.latch.release(exclusive)
+
+    def _unpin_page(self, page_id: PageID) -> None:
+        frame = self.pool[self.page_table[page_id]]
+        if frame.pin_count == 0:
+            raise ValueError('page is not pinned')
+        if (self.disk.wal is not None and frame.buffer.is_dirty
+                and page_id not in self.pending):
+            # the pin now belongs to the transaction until commit()
+            self.pending.add(page_id)
+            return
+        frame.pin_count -= 1
+
+    @contextmanager
+    def page(self, page_id: PageID,
+             exclusive: Optional[bool] = None) -> Iterator[Buffer]:
+        """Fetch a page and keep it pinned until the block exits.
+
+        With exclusive given, the page is latched for the block too.
+        """
+        buffer_ = self.fetch_page(page_id, exclusive)
+        try:
+            yield buffer_
+        finally:
+            self.unpin_page(page_id, exclusive)
+
+    @contextmanager
+    def new_page(self) -> Iterator[Buffer]:
+        """Create a page and keep it pinned until the block exits."""
+        buffer_ = self.create_page()
+        try:
+            yield buffer_
+        finally:
+            self.unpin_page(buffer_.page_id)
+
+    def free_page(self, page_id: PageID) -> None:
+        with self.latch:
+            self._free_page(page_id)
+
+    def _free_page(self, page_id: PageID) -> None:
+        buffer_id = self.page_table.get(page_id)
+        if buffer_id is not None:
             frame = self.pool[buffer_id]
-            if frame.buffer.is_dirty:
-                page = frame.buffer.page
-                self.disk.write_page_data(page_id, page)
+            if frame.pin_count > int(page_id in self.pending):
+                raise ValueError('cannot free a pinned page')
+            self.pending.discard(page_id)
+            del self.page_table[page_id]
+            frame.pin_count = 0
+            frame.buffer = Buffer()
+            self.pool.release(buffer_id)
+        self.unwritten.pop(page_id, None)
+        with self.io_latch:
+            self.disk.free_page(page_id)
+        self._invalidate(page_id)
+
+    def prefetch(self, page_ids: Sequence[PageID]) -> None:
+        """Start loading pages that are about to be fetched.
+
+        With a ReadAhead the pages are read in the background; without
+        one they are fetched into the pool right away.
+        """
+        with self.latch:
+            missing = [page_id for page_id in page_ids
+                       if page_id not in self.page_table]
+        if self.readahead is not None:
+            if missing:
+                self.readahead.request(missing)
+            return
+        for page_id in missing:
+            with self.page(page_id):
+                pass
+
+    def resize(self, pool_size: int) -> None:
+        """Grow or shrink the pool while it is in use.
+
+        Shrinking drops the last buffers, writing back their pages, and
+        fails if one of them is pinned.
+        """
+        with self.latch:
+            dropped = range(pool_size, len(self.pool))
+            if any(self.pool[buffer_id].pin_count for buffer_id in dropped):
+                raise ValueError('cannot drop a pinned buffer')
+            for buffer_id in dropped:
+                buffer_ = self.pool[buffer_id].buffer
+                if self.page_table.get(buffer_.page_id) == buffer_id:
+                    del self.page_table[buffer_.page_id]
+                    self._write_back(buffer_.page_id, buffer_)
+            self.pool.resize(pool_size)
+
+    def commit(self, wait: bool = True) -> int:
+        """Log every page changed since the last commit, then commit.
+
+        With wait, return once the commit is durable; concurrent commits
+        share one fsync of the log.  Returns the LSN of the commit record,
+        or 0 when no write-ahead log is attached.
+        """
+        wal = self.disk.wal
+        if wal is None:
+            return 0
+        with self.structure_latch.exclusive():
+            with self.latch:
+                frames = self._pending_frames()
+            self._log_pages(frames)
+            with self.latch:
+                logged = self._settle(frames)
+                lsn = _log_commit(self.disk, self.committed_meta, logged)
+                self._mark_unwritten(logged, lsn)
+                self.commit_lsn = lsn
+        if wait:
+            wal.flush(lsn)
+        return lsn
+
+    def _pending_frames(self) -> List[Tuple[PageID, Frame]]:
+        """Return the pages changed since the last commit with their frames.
+
+        Call with the latch held.
+        """
+        return [(page_id, self.pool[self.page_table[page_id]])
+                for page_id in self.pending]
+
+    def _log_pages(self, frames: List[Tuple[PageID, Frame]]) -> None:
+        """Log the images of pages returned by _pending_frames().
+
+        Each image is taken under its frame latch held shared, so that a
+        page is never logged halfway through a change.  The pages stay
+        pending and pinned meanwhile, so they are not written back or
+        freed.  Call without the latch, which latch holders may wait for.
+        """
+        for page_id, frame in frames:
+            with frame.latch.shared():
+                self.disk.wal.append_page(page_id, frame.buffer.page)
                 frame.buffer.is_dirty = False
-                frame.usage_count = 1
+
+    def _settle(self, frames: List[Tuple[PageID, Frame]]) -> Set[PageID]:
+        """Drop the transaction pins of the pages just logged.
+
+        A page changed again since it was logged stays pending for the
+        next commit.  Returns the pages logged.  Call with the latch held.
+        """
+        for page_id, frame in frames:
+            if not frame.buffer.is_dirty:
+                self.pending.discard(page_id)
+                frame.pin_count -= 1
+        return {page_id for page_id, _ in frames}
+
+    def _mark_unwritten(self, page_ids: Set[PageID], lsn: int) -> None:
+        for page_id in page_ids:
+            self.unwritten[page_id] = lsn
+
+    def _due(self, redo_lsn: int) -> Set[PageID]:
+        """Return the pages committed up to redo_lsn but not written."""
+        with self.latch:
+            return {page_id for page_id, lsn in self.unwritten.items()
+                    if lsn <= redo_lsn}
+
+    def _written(self, due: Set[PageID], redo_lsn: int) -> bool:
+        """Return whether every page of due has been written since."""
+        return all(self.unwritten.get(page_id, redo_lsn + 1) > redo_lsn
+                   for page_id in due)
+
+    def checkpoint(self) -> None:
+        """Write every committed page in place and empty the log."""
+        wal = self.disk.wal
+        with self.latch:
+            if self.pending or self.disk.dirty_meta_pages:
+                raise ValueError('commit before checkpointing')
+            self.flush()
+            with self.io_latch:
+                if wal is not None:
+                    wal.flush(wal.next_lsn - 1)
+                    self.disk.write_meta_pages()
+                    self.committed_meta = {}
+                self.disk.sync()
+            if wal is not None:
+                wal.truncate()
+
+    def fuzzy_checkpoint(self) -> bool:
+        """Shorten the log while the pool stays in use.
+
+        The last commit becomes the redo point: every page committed up to
+        it is written in place, the committed meta pages are logged again
+        after it, and the log before it is dropped.  Pages are written in
+        batches without holding the latch, so other threads keep working.
+        A page changed again but not yet committed cannot be written, and
+        then False is returned and the log is left alone until a later
+        call.  Without a write-ahead log this only writes back and syncs.
+        """
+        wal = self.disk.wal
+        if wal is None:
+            self.write_back()
+            self.disk.sync()
+            return True
+        with self.latch:
+            redo_lsn = self.commit_lsn
+            due = self._due(redo_lsn)
+        self.write_back(due)
+        with self.latch:
+            if not self._written(due, redo_lsn):
+                return False
+            lsn = _relog_meta(self.disk, self.committed_meta)
+        wal.flush(lsn)
+        self.disk.sync()
+        wal.discard(redo_lsn)
+        return True
+
+    def _take_pages(self, page_ids: Sequence[PageID]
+                    ) -> Tuple[List[Tuple[PageID, Page]], int]:
+        """Mark pages clean and return their images and the LSN to flush.
+
+        Pinned pages, which may be changing, are skipped.  Call with the
+        latch held.
+        """
+        pages: List[Tuple[PageID, Page]] = []
+        lsn = 0
+        for page_id in page_ids:
+            buffer_id = self.page_table.get(page_id)
+            if buffer_id is None or self.pool[buffer_id].pin_count:
+                continue
+            buffer_ = self.pool[buffer_id].buffer
+            page_lsn = self.unwritten.pop(page_id, None)
+            if page_lsn is None and not buffer_.is_dirty:
+                continue
+            lsn = max(lsn, page_lsn or 0)
+            pages.append((page_id, bytearray(buffer_.page)))
+            buffer_.is_dirty = False
+        return pages, lsn
+
+    def write_back(self, page_ids: Optional[Set[PageID]] = None,
+                   limit: Optional[int] = None) -> int:
+        """Write unpinned dirty pages in place without holding the latch.
+
+        Pages are taken in page-ID order, starting after the page the last
+        call stopped at, so that repeated calls sweep the whole pool.
+        page_ids limits the pages considered and limit how many are
+        written.  Returns the number of pages written.
+        """
+        with self.latch:
+            candidates = sorted(
+                (page_id for page_id, buffer_id in self.page_table.items()
+                 if (page_ids is None or page_id in page_ids)
+                 and (self.pool[buffer_id].buffer.is_dirty
+                      or page_id in self.unwritten)),
+                key=PageID.to_int,
+            )
+            start = next((i for i, page_id in enumerate(candidates)
+                          if page_id.to_int() > self.write_cursor), 0)
+            candidates = candidates[start:] + candidates[:start]
+            if limit is not None:
+                candidates = candidates[:limit]
+            pages, lsn = self._take_pages(candidates)
+            if not pages:
+                return 0
+            self.write_cursor = pages[-1][0].to_int()
+            self.stats.background_writes += len(pages)
+            self.writing.update(pages)
+            self.io_latch.acquire()
+        try:
+            if lsn:
+                self.disk.wal.flush(lsn)
+            self.disk.write_pages(pages)
+        finally:
+            for page_id, page in pages:
+                if self.writing.get(page_id) is page:
+                    del self.writing[page_id]
+            self.io_latch.release()
+        for page_id, _ in pages:
+            self._invalidate(page_id)
+        return len(pages)
+
+    def flush(self) -> None:
+        """Write back every committed dirty page in one batch."""
+        with self.latch:
+            pages: List[Tuple[PageID, Page]] = []
+            lsn = 0
+            for page_id, buffer_id in self.page_table.items():
+                if page_id in self.pending:
+                    continue
+                buffer_ = self.pool[buffer_id].buffer
+                page_lsn = self.unwritten.pop(page_id, None)
+                if page_lsn is None and not buffer_.is_dirty:
+                    continue
+                lsn = max(lsn, page_lsn or 0)
+                pages.append((page_id, buffer_.page))
+                buffer_.is_dirty = False
+            with self.io_latch:
+                if lsn:
+                    self.disk.wal.flush(lsn)
+                self.disk.write_pages(pages)
+            for page_id, _ in pages:
+                self._invalidate(page_id)
+            self.stats.dirty_writes += len(pages)
+
+
+class PartitionedBufferPoolManager:
+    """Buffer pool split into partitions that are latched separately.
+
+    Page page_id always lives in partition page_id % len(partitions), a
+    BufferPoolManager with its own page table, replacer and latch, so
+    threads working on different pages seldom wait for each other.  The
+    partitions share the disk; commits and checkpoints cover all of them
+    at once.  resize() and rebalance() move buffers between partitions
+    while the pool is in use.
+    """
+    disk: DiskManager
+    partitions: List[BufferPoolManager]
+    commit_lsn: int
+    committed_meta: Dict[PageID, bytes]
+    write_partition: int
+    rebalanced_misses: List[int]
+    structure_latch: RWLatch
+
+    def __init__(self, disk: DiskManager, pools: Sequence[BufferPool],
+                 readahead: Optional[ReadAhead] = None) -> None:
+        if not pools:
+            raise ValueError('a buffer pool needs at least one partition')
+        self.disk = disk
+        self.partitions = [BufferPoolManager(disk, pool, readahead)
+                           for pool in pools]
+        self.commit_lsn = 0
+        self.committed_meta = {}
+        self.write_partition = 0
+        self.rebalanced_misses = [0] * len(pools)
+        # as in BufferPoolManager, for commits of all the partitions
+        self.structure_latch = RWLatch()
+
+    def _partition(self, page_id: PageID) -> BufferPoolManager:
+        return self.partitions[page_id.to_int() % len(self.partitions)]
+
+    @contextmanager
+    def _latched(self, io: bool = False) -> Iterator[None]:
+        """Hold the latch of every partition, always in the same order."""
+        with ExitStack() as stack:
+            for partition in self.partitions:
+                stack.enter_context(partition.latch)
+            if io:
+                for partition in self.partitions:
+                    stack.enter_context(partition.io_latch)
+            yield
+
+    @property
+    def stats(self) -> BufferPoolStats:
+        """The counters of all the partitions added up."""
+        total = BufferPoolStats()
+        for partition in self.partitions:
+            for name, value in vars(partition.stats).items():
+                setattr(total, name, getattr(total, name) + value)
+        return total
+
+    def fetch_page(self, page_id: PageID,
+                   exclusive: Optional[bool] = None) -> Buffer:
+        return self._partition(page_id).fetch_page(page_id, exclusive)
+
+    def create_page(self) -> Buffer:
+        page_id = self.disk.allocate_page()
+        try:
+            return self._partition(page_id).create_page(page_id)
+        except NoFreeBufferError:
+            self.disk.free_page(page_id)
+            raise
+
+    def unpin_page(self, page_id: PageID,
+                   exclusive: Optional[bool] = None) -> None:
+        self._partition(page_id).unpin_page(page_id, exclusive)
+
+    # built on fetch_page, create_page and unpin_page above
+    page = BufferPoolManager.page
+    new_page = BufferPoolManager.new_page
+
+    def free_page(self, page_id: PageID) -> None:
+        self._partition(page_id).free_page(page_id)
+
+    def prefetch(self, page_ids: Sequence[PageID]) -> None:
+        for page_id in page_ids:
+            self._partition(page_id).prefetch([page_id])
+
+    def resize(self, pool_sizes: Sequence[int]) -> None:
+        """Set the number of buffers of each partition."""
+        if len(pool_sizes) != len(self.partitions):
+            raise ValueError('give one size per partition')
+        for partition, pool_size in zip(self.partitions, pool_sizes):
+            partition.resize(pool_size)
+
+    def rebalance(self) -> List[int]:
+        """Move buffers to the partitions that missed most since last time.
+
+        The buffers are shared out in proportion to the misses, each
+        partition keeping at least a quarter of an even share.  A
+        partition that cannot shrink because its last buffers are pinned
+        keeps its size.  Returns the new sizes.
+        """
+        sizes = [len(partition.pool) for partition in self.partitions]
+        misses = [partition.stats.misses for partition in self.partitions]
+        recent = [now - then
+                  for now, then in zip(misses, self.rebalanced_misses)]
+        self.rebalanced_misses = misses
+        if not sum(recent):
+            return sizes
+
+        total = sum(sizes)
+        floor = max(1, total // (4 * len(sizes)))
+        spare = total - floor * len(sizes)
+        targets = [floor + spare * miss // sum(recent) for miss in recent]
+        targets[recent.index(max(recent))] += total - sum(targets)
+
+        freed = 0
+        for i, partition in enumerate(self.partitions):
+            if targets[i] < sizes[i]:
+                try:
+                    partition.resize(targets[i])
+                except ValueError:
+                    continue
+                freed += sizes[i] - targets[i]
+                sizes[i] = targets[i]
+        for i, partition in enumerate(self.partitions):
+            if targets[i] > sizes[i] and freed:
+                grown = min(targets[i] - sizes[i], freed)
+                partition.resize(sizes[i] + grown)
+                freed -= grown
+                sizes[i] += grown
+        return sizes
+
+    def commit(self, wait: bool = True) -> int:
+        """Commit the changes of every partition in one group."""
+        wal = self.disk.wal
+        if wal is None:
+            return 0
+        with self.structure_latch.exclusive():
+            with self._latched():
+                frames = [partition._pending_frames()
+                          for partition in self.partitions]
+            for partition, pending in zip(self.partitions, frames):
+                partition._log_pages(pending)
+            with self._latched():
+                logged = [partition._settle(pending) for partition, pending
+                          in zip(self.partitions, frames)]
+                lsn = _log_commit(self.disk, self.committed_meta,
+                                  set().union(*logged))
+                for partition, page_ids in zip(self.partitions, logged):
+                    partition._mark_unwritten(page_ids, lsn)
+                self.commit_lsn = lsn
+        if wait:
+            wal.flush(lsn)
+        return lsn
+
+    def checkpoint(self) -> None:
+        """Write every committed page in place and empty the log."""
+        wal = self.disk.wal
+        with self._latched():
+            if (any(partition.pending for partition in self.partitions)
+                    or self.disk.dirty_meta_pages):
+                raise ValueError('commit before checkpointing')
+            for partition in self.partitions:
+                partition.flush()
+            with self._latched(io=True):
+                if wal is not None:
+                    wal.flush(wal.next_lsn - 1)
+                    self.disk.write_meta_pages()
+                    self.committed_meta = {}
+                self.disk.sync()
+            if wal is not None:
+                wal.truncate()
+
+    def fuzzy_checkpoint(self) -> bool:
+        """Shorten the log like BufferPoolManager.fuzzy_checkpoint()."""
+        wal = self.disk.wal
+        if wal is None:
+            self.write_back()
+            self.disk.sync()
+            return True
+        with self._latched():
+            redo_lsn = self.commit_lsn
+            due = [partition._due(redo_lsn) for partition in self.partitions]
+        for partition, page_ids in zip(self.partitions, due):
+            partition.write_back(page_ids)
+        with self._latched():
+            if not all(partition._written(page_ids, redo_lsn)
+                       for partition, page_ids in zip(self.partitions, due)):
+                return False
+            lsn = _relog_meta(self.disk, self.committed_meta)
+        wal.flush(lsn)
+        self.disk.sync()
+        wal.discard(redo_lsn)
+        return True
+
+    def write_back(self, page_ids: Optional[Set[PageID]] = None,
+                   limit: Optional[int] = None) -> int:
+        """Write back dirty pages like BufferPoolManager.write_back().
+
+        Each call starts at the next partition, so that a limit does not
+        always favour the first ones.
+        """
+        count = len(self.partitions)
+        written = 0
+        for i in range(count):
+            if limit is not None and written >= limit:
+                break
+            partition = self.partitions[(self.write_partition + i) % count]
+            written += partition.write_back(
+                page_ids, None if limit is None else limit - written
+            )
+        self.write_partition = (self.write_partition + 1) % count
+        return written
+
+    def flush(self) -> None:
+        for partition in self.partitions:
+            partition.flush()
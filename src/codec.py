@@ -0,0 +1,130 @@
+from typing import Any, List, Optional, Sequence, Tuple
+import struct
+
+"""
+FIELD
+0             1
++-------------+-----------------+
+| [int] tag   | [bytes] payload |
++-------------+-----------------+
+
+A tuple is its fields encoded one after another, so that comparing two
+encoded tuples as bytes gives the order of the tuples themselves, field
+by field.  The tag is NULL or VALUE, so NULL sorts before every value.
+
+INT    8 bytes, big endian two's complement with the sign bit flipped.
+FLOAT  the IEEE 754 double, big endian; a positive number has its sign
+       bit set and a negative one has every bit inverted.
+TEXT   the UTF-8 bytes, escaped like BYTES.
+BYTES  each 00 byte written as 00 ff, then a terminator 00 00, so a
+       string sorts before any longer string it is a prefix of.
+
+Every field knows where it ends, so an encoded tuple is also a prefix of
+the encoding of any longer tuple beginning with the same fields.
+"""
+
+INT: str                = 'int'
+FLOAT: str              = 'float'
+TEXT: str               = 'text'
+BYTES: str              = 'bytes'
+TYPES                   = (INT, FLOAT, TEXT, BYTES)
+
+NULL: int               = 0x00
+VALUE: int              = 0x01
+
+INT_SIZE: int           = 8
+FLOAT_SIZE: int         = 8
+INT_BIAS: int           = 1 << (8 * INT_SIZE - 1)
+FLOAT_SIGN: int         = 1 << 63
+FLOAT_MASK: int         = (1 << 64) - 1
+TERMINATOR: bytes       = b'\x00\x00'
+
+
+def _encode_field(type_: str, value: Any) -> bytes:
+    if type_ == INT:
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f'{value!r} is not an int')
+        if not -INT_BIAS <= value < INT_BIAS:
+            raise ValueError(f'{value} does not fit in {INT_SIZE} bytes')
+        return (value + INT_BIAS).to_bytes(INT_SIZE, 'big')
+    if type_ == FLOAT:
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ValueError(f'{value!r} is not a float')
+        # -0.0 == 0.0, so they must encode alike
+        bits = int.from_bytes(struct.pack('>d', float(value) + 0.0), 'big')
+        bits = bits ^ FLOAT_MASK if bits & FLOAT_SIGN else bits | FLOAT_SIGN
+        return bits.to_bytes(FLOAT_SIZE, 'big')
+    if type_ == TEXT:
+        if not isinstance(value, str):
+            raise ValueError(f'{value!r} is not a str')
+        value = value.encode()
+    elif not isinstance(value, (bytes, bytearray, memoryview)):
+        raise ValueError(f'{value!r} is not bytes')
+    return bytes(value).replace(b'\x00', b'\x00\xff') + TERMINATOR
+
+
+def encode(types: Sequence[str], values: Sequence[Any]) -> bytes:
+    """Encode the leading len(values) fields of a tuple of the given types."""
+    if len(values) > len(types):
+        raise ValueError('more values than fields')
+    encoded = bytearray()
+    for type_, value in zip(types, values):
+        if value is None:
+            encoded.append(NULL)
+        else:
+            encoded.append(VALUE)
+            encoded += _encode_field(type_, value)
+    return bytes(encoded)
+
+
+def _decode_field(type_: str, data: bytes, begin: int) -> Tuple[Any, int]:
+    if type_ == INT:
+        end = begin + INT_SIZE
+        return int.from_bytes(data[begin:end], 'big') - INT_BIAS, end
+    if type_ == FLOAT:
+        end = begin + 8
+        bits = int.from_bytes(data[begin:end], 'big')
+        bits = bits ^ FLOAT_SIGN if bits & FLOAT_SIGN else bits ^ FLOAT_MASK
+        return struct.unpack('>d', bits.to_bytes(8, 'big'))[0], end
+    # every 00 of the payload is followed by ff, so the first 00 00 ends it
+    end = data.index(TERMINATOR, begin)
+    raw = data[begin:end].replace(b'\x00\xff', b'\x00')
+    return (raw.decode() if type_ == TEXT else raw), end + len(TERMINATOR)
+
+
+def decode(types: Sequence[str], data: bytes,
+           begin: int = 0) -> Tuple[List[Optional[Any]], int]:
+    """Decode one field of each type from data; return them and the end."""
+    values: List[Optional[Any]] = []
+    for type_ in types:
+        tag = data[begin]
+        begin += 1
+        if tag == NULL:
+            values.append(None)
+        else:
+            value, begin = _decode_field(type_, data, begin)
+            values.append(value)
+    return values, begin
+
+
+def max_size(types: Sequence[str], limit: int) -> int:
+    """Bound the encoding of fields of the given types.
+
+    The fields are taken from a tuple whose encoding is at most limit
+    bytes, which bounds TEXT and BYTES fields.
+    """
+    if any(type_ not in (INT, FLOAT) for type_ in types):
+        return limit
+    return min(limit, sum(1 + (INT_SIZE if type_ == INT else FLOAT_SIZE)
+                          for type_ in types))
+
+
+def prefix_end(prefix: bytes) -> Optional[bytes]:
+    """Return the smallest key greater than every key starting with prefix.
+
+    Returns None when there is none, for a prefix of only ff bytes.
+    """
+    stripped = prefix.rstrip(b'\xff')
+    if not stripped:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1])
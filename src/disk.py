@@ -1,51 +1,479 @@
-from typing import IO, Union
+from __future__ import annotations
+from typing import (
+    TYPE_CHECKING, IO, Dict, List, Optional, Sequence, Set, Tuple, Union
+)
+import mmap
+import os
 import pathlib
+import threading
 
+if TYPE_CHECKING:
+    from src.wal import WriteAheadLog
 
-PAGE_SIZE: int = 4096
 
+"""
+HEADER PAGE (page 0)
+0               4                  8                    12
++---------------+------------------+--------------------+
+| [bytes] magic | [int] page_count | [int] free_page_id |
++---------------+------------------+--------------------+
+12                 16
++------------------+-------+-------+-----+-------+
+| [int] tree_count | ENTRY | ENTRY | ... | ENTRY |
++------------------+-------+-------+-----+-------+
 
-class PageID:
-    page_id: int
+ENTRY
+0              32                   36               40                 44
++--------------+--------------------+----------------+------------------+
+| [bytes] name | [int] root_page_id | [int] key_size | [int] value_size |
++--------------+--------------------+----------------+------------------+
 
-    def __init__(self, page_id: int) -> None:
-        self.page_id = page_id
+FREE PAGE
+0                         4
++-------------------------+
+| [int] next_free_page_id |
++-------------------------+
 
-    def __eq__(self, other: object) -> bool:
-        if not isinstance(other, PageID):
-            return False
-        return self.page_id == other.page_id
+Freed pages form a singly linked list whose head is kept in the header;
+a free_page_id of 0 means the list is empty, since page 0 is the header.
+The rest of the header is a catalog of the trees stored in the file, so
+that they can be reopened by name.  A name is UTF-8 padded with zeros.
 
-    def __hash__(self) -> int:
-        return hash(self.page_id)
+With a WriteAheadLog attached, the header and the free-list links are
+"meta pages": they are kept in memory and handed to the buffer pool to be
+logged with the next commit, and only written in place by a checkpoint.
+Opening the file first redoes whatever the log has committed.
+"""
+
+PAGE_SIZE: int          = 4096
+
+MAGIC: bytes            = b'HBDB'
+
+MAGIC_BEGIN: int        = 0
+MAGIC_END: int          = 4
+
+PAGE_COUNT_BEGIN: int   = 4
+PAGE_COUNT_END: int     = 8
+
+FREE_PAGE_ID_BEGIN: int = 8
+FREE_PAGE_ID_END: int   = 12
+
+TREE_COUNT_BEGIN: int   = 12
+TREE_COUNT_END: int     = 16
+
+CATALOG_BEGIN: int      = 16
+
+NAME_BEGIN: int         = 0
+NAME_END: int           = 32
+ROOT_PAGE_ID_BEGIN: int = 32
+ROOT_PAGE_ID_END: int   = 36
+KEY_SIZE_BEGIN: int     = 36
+KEY_SIZE_END: int       = 40
+VALUE_SIZE_BEGIN: int   = 40
+VALUE_SIZE_END: int     = 44
+
+ENTRY_SIZE: int         = 44
+MAX_TREE_COUNT: int     = (PAGE_SIZE - CATALOG_BEGIN) // ENTRY_SIZE
+
+NEXT_FREE_BEGIN: int    = 0
+NEXT_FREE_END: int      = 4
+
+MMAP_CHUNK_SIZE: int    = 256 * PAGE_SIZE
+VECTOR_PAGES: int       = 256
+
+PageData = Union[bytes, bytearray, memoryview]
+
+
+class PageID(int):
+    """A page number.
+
+    PageID is an int, so comparing and hashing one, as every page table
+    probe does, runs at the speed of a plain int, and an instance carries
+    no __dict__.
+    """
+    __slots__ = ()
 
     def to_int(self) -> int:
-        return self.page_id
+        return int(self)
+
+
+HEADER_PAGE_ID: PageID = PageID(0)
+
+
+class TreeEntry:
+    __slots__ = ('root_page_id', 'key_size', 'value_size')
+    root_page_id: PageID
+    key_size: int
+    value_size: int
+
+    def __init__(self, root_page_id: PageID,
+                 key_size: int, value_size: int) -> None:
+        self.root_page_id = root_page_id
+        self.key_size = key_size
+        self.value_size = value_size
+
+
+class DiskStats:
+    """Pages read and written by a DiskManager.
+
+    The counters are not synchronized; with several threads doing I/O
+    they are a close approximation.
+    """
+    pages_read: int
+    pages_written: int
+
+    def __init__(self) -> None:
+        self.pages_read = 0
+        self.pages_written = 0
+
+    def bytes_read(self) -> int:
+        return self.pages_read * PAGE_SIZE
+
+    def bytes_written(self) -> int:
+        return self.pages_written * PAGE_SIZE
 
 
 class DiskManager:
     heap_file: IO[bytes]
     next_page_id: int
+    free_page_id: int
+    trees: Dict[str, TreeEntry]
+    wal: Optional[WriteAheadLog]
+    meta_pages: Dict[PageID, bytes]
+    dirty_meta_pages: Set[PageID]
+    lock: threading.RLock
+    stats: DiskStats
 
-    def __init__(self, heap_file_path: pathlib.Path) -> None:
+    def __init__(self, heap_file_path: pathlib.Path,
+                 wal: Optional[WriteAheadLog] = None) -> None:
+        self.stats = DiskStats()
         if not heap_file_path.is_file():
             heap_file_path.touch()
-        self.heap_file = heap_file_path.open(mode='br+')
-        file_size = heap_file_path.stat().st_size
-        self.next_page_id = file_size // PAGE_SIZE
+        # unbuffered: every access is a positional read or write on the fd
+        self.heap_file = heap_file_path.open(mode='br+', buffering=0)
+        self.wal = None
+        self.meta_pages = {}
+        self.dirty_meta_pages = set()
+        # guards the header, the free list and the meta pages, which
+        # threads of a partitioned buffer pool change independently
+        self.lock = threading.RLock()
+        if heap_file_path.stat().st_size == 0:
+            self.next_page_id = 1
+            self.free_page_id = 0
+            self.trees = {}
+            self.write_header()
+            self.sync()
+        if wal is not None:
+            wal.recover(self)
+        self.wal = wal
+        self.read_header()
+
+    def _write_meta(self, page_id: PageID, data: bytes) -> None:
+        if self.wal is None:
+            self.write_page_data(page_id, data)
+            return
+        self.meta_pages[page_id] = data
+        self.dirty_meta_pages.add(page_id)
+
+    def _read_meta(self, page_id: PageID) -> bytes:
+        if page_id in self.meta_pages:
+            return self.meta_pages[page_id]
+        return self.read_page_data(page_id)
+
+    def take_dirty_meta_pages(self) -> List[Tuple[PageID, bytes]]:
+        """Return the meta pages changed since the last call."""
+        with self.lock:
+            pages = [(page_id, self.meta_pages[page_id])
+                     for page_id in self.dirty_meta_pages]
+            self.dirty_meta_pages = set()
+            return pages
+
+    def write_meta_pages(self) -> None:
+        """Write the meta pages in place; their log records must be durable."""
+        with self.lock:
+            self.write_pages(list(self.meta_pages.items()))
+            self.meta_pages = {}
+
+    def read_header(self) -> None:
+        header = self._read_meta(HEADER_PAGE_ID)
+        if header[MAGIC_BEGIN:MAGIC_END] != MAGIC:
+            raise ValueError('not a heap file')
+        self.next_page_id = int.from_bytes(
+            header[PAGE_COUNT_BEGIN:PAGE_COUNT_END], 'big'
+        )
+        self.free_page_id = int.from_bytes(
+            header[FREE_PAGE_ID_BEGIN:FREE_PAGE_ID_END], 'big'
+        )
+        self.trees = {}
+        tree_count = int.from_bytes(
+            header[TREE_COUNT_BEGIN:TREE_COUNT_END], 'big'
+        )
+        for i in range(tree_count):
+            begin = CATALOG_BEGIN + i * ENTRY_SIZE
+            entry = header[begin:begin + ENTRY_SIZE]
+            name = bytes(entry[NAME_BEGIN:NAME_END]).rstrip(b'\x00')
+            self.trees[name.decode()] = TreeEntry(
+                PageID(int.from_bytes(
+                    entry[ROOT_PAGE_ID_BEGIN:ROOT_PAGE_ID_END], 'big'
+                )),
+                int.from_bytes(entry[KEY_SIZE_BEGIN:KEY_SIZE_END], 'big'),
+                int.from_bytes(entry[VALUE_SIZE_BEGIN:VALUE_SIZE_END], 'big'),
+            )
+
+    def write_header(self) -> None:
+        header = bytearray(PAGE_SIZE)
+        header[MAGIC_BEGIN:MAGIC_END] = MAGIC
+        size = PAGE_COUNT_END - PAGE_COUNT_BEGIN
+        header[PAGE_COUNT_BEGIN:PAGE_COUNT_END] = (
+            self.next_page_id.to_bytes(size, 'big')
+        )
+        size = FREE_PAGE_ID_END - FREE_PAGE_ID_BEGIN
+        header[FREE_PAGE_ID_BEGIN:FREE_PAGE_ID_END] = (
+            self.free_page_id.to_bytes(size, 'big')
+        )
+        size = TREE_COUNT_END - TREE_COUNT_BEGIN
+        header[TREE_COUNT_BEGIN:TREE_COUNT_END] = (
+            len(self.trees).to_bytes(size, 'big')
+        )
+        for i, (name, tree) in enumerate(self.trees.items()):
+            begin = CATALOG_BEGIN + i * ENTRY_SIZE
+            entry = bytearray(ENTRY_SIZE)
+            encoded = name.encode()
+            entry[NAME_BEGIN:NAME_BEGIN + len(encoded)] = encoded
+            entry[ROOT_PAGE_ID_BEGIN:ROOT_PAGE_ID_END] = (
+                tree.root_page_id.to_int().to_bytes(
+                    ROOT_PAGE_ID_END - ROOT_PAGE_ID_BEGIN, 'big'
+                )
+            )
+            entry[KEY_SIZE_BEGIN:KEY_SIZE_END] = tree.key_size.to_bytes(
+                KEY_SIZE_END - KEY_SIZE_BEGIN, 'big'
+            )
+            entry[VALUE_SIZE_BEGIN:VALUE_SIZE_END] = tree.value_size.to_bytes(
+                VALUE_SIZE_END - VALUE_SIZE_BEGIN, 'big'
+            )
+            header[begin:begin + ENTRY_SIZE] = entry
+        self._write_meta(HEADER_PAGE_ID, bytes(header))
 
-    def allocate_page(self) -> PageID:
-        page_id = self.next_page_id
-        self.next_page_id += 1
-        return PageID(page_id)
+    def create_tree(self, name: str, root_page_id: PageID,
+                    key_size: int, value_size: int) -> None:
+        """Record a new tree in the catalog."""
+        if not 0 < len(name.encode()) <= NAME_END - NAME_BEGIN:
+            raise ValueError(f'tree name {name!r} is too long or empty')
+        with self.lock:
+            if name in self.trees:
+                raise ValueError(f'tree {name!r} already exists')
+            if len(self.trees) == MAX_TREE_COUNT:
+                raise ValueError('the catalog is full')
+            self.trees[name] = TreeEntry(root_page_id, key_size, value_size)
+            self.write_header()
+
+    def set_root(self, name: str, root_page_id: PageID) -> None:
+        with self.lock:
+            self.trees[name].root_page_id = root_page_id
+            self.write_header()
+
+    def allocate_page(self, reuse: bool = True) -> PageID:
+        """Return a page for new contents, from the free list if reuse.
+
+        A page that is written in place without going through the log
+        must be allocated with reuse False.  A free page may be written
+        over by a crash that restores the free list of the last commit,
+        which would still link through it; a page past the end of the
+        file is unknown to every committed state.
+        """
+        with self.lock:
+            if reuse and self.free_page_id != 0:
+                page_id = PageID(self.free_page_id)
+                page = self._read_meta(page_id)
+                self.free_page_id = int.from_bytes(
+                    page[NEXT_FREE_BEGIN:NEXT_FREE_END], 'big'
+                )
+                # the page is live again, so its free-list link must not be
+                # written over it later
+                self.meta_pages.pop(page_id, None)
+                self.dirty_meta_pages.discard(page_id)
+            else:
+                page_id = PageID(self.next_page_id)
+                self.next_page_id += 1
+            self.write_header()
+            return page_id
+
+    def free_page(self, page_id: PageID) -> None:
+        page = bytearray(PAGE_SIZE)
+        with self.lock:
+            page[NEXT_FREE_BEGIN:NEXT_FREE_END] = self.free_page_id.to_bytes(
+                NEXT_FREE_END - NEXT_FREE_BEGIN, 'big'
+            )
+            self._write_meta(page_id, bytes(page))
+            self.free_page_id = page_id.to_int()
+            self.write_header()
+
+    def sync(self) -> None:
+        self.heap_file.flush()
+        os.fsync(self.heap_file.fileno())
+
+    def close(self) -> None:
+        self.heap_file.close()
+
+    def advise(self, page_ids: Sequence[PageID]) -> None:
+        """Hint that the given pages are about to be read.
+
+        Reads are explicit system calls here, so there is nothing to tell.
+        """
 
     def write_page_data(self, page_id: PageID,
-                        data: Union[bytes, bytearray]) -> None:
+                        data: PageData) -> None:
+        offset = PAGE_SIZE * page_id.to_int()
+        os.pwrite(self.heap_file.fileno(), data, offset)
+        self.stats.pages_written += 1
+
+    def read_page_data(self, page_id: PageID) -> bytearray:
+        offset = PAGE_SIZE * page_id.to_int()
+        page = bytearray(PAGE_SIZE)
+        os.preadv(self.heap_file.fileno(), [page], offset)
+        self.stats.pages_read += 1
+        return page
+
+    @staticmethod
+    def _runs(page_ids: Sequence[PageID]) -> List[Tuple[int, int]]:
+        """Split the sorted page IDs into runs of adjacent IDs.
+
+        Returns (first page ID, page count) pairs of at most VECTOR_PAGES
+        pages each.
+        """
+        runs: List[Tuple[int, int]] = []
+        for page_id in page_ids:
+            id_ = page_id.to_int()
+            if runs and runs[-1][0] + runs[-1][1] == id_ \
+                    and runs[-1][1] < VECTOR_PAGES:
+                runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+            else:
+                runs.append((id_, 1))
+        return runs
+
+    def read_pages(self, page_ids: Sequence[PageID]) -> List[bytearray]:
+        """Read many pages, issuing one preadv per run of adjacent IDs.
+
+        The pages are returned in the order of page_ids.
+        """
+        pages = {page_id: bytearray(PAGE_SIZE) for page_id in page_ids}
+        order = sorted(pages, key=PageID.to_int)
+        begin = 0
+        for first, count in self._runs(order):
+            buffers = [pages[page_id]
+                       for page_id in order[begin:begin + count]]
+            os.preadv(self.heap_file.fileno(), buffers, PAGE_SIZE * first)
+            begin += count
+        self.stats.pages_read += len(pages)
+        return [pages[page_id] for page_id in page_ids]
+
+    def write_pages(self, pages: Sequence[Tuple[PageID, PageData]]) -> None:
+        """Write many pages, issuing one pwritev per run of adjacent IDs."""
+        pages = sorted(pages, key=lambda page: page[0].to_int())
+        begin = 0
+        for first, count in self._runs([page_id for page_id, _ in pages]):
+            buffers = [data for _, data in pages[begin:begin + count]]
+            os.pwritev(self.heap_file.fileno(), buffers, PAGE_SIZE * first)
+            begin += count
+        self.stats.pages_written += len(pages)
+
+
+class MmapDiskManager(DiskManager):
+    """DiskManager that reads and writes pages through a shared mapping.
+
+    A miss copies the page straight out of the OS page cache, without a
+    read system call.  The copy is kept on purpose: a buffer must not be
+    written back to the file until the buffer pool says so, which a view
+    into the mapping could not guarantee.  The mapping grows
+    MMAP_CHUNK_SIZE bytes at a time as pages are allocated; map_lock keeps
+    it from being resized under a read-ahead thread.
+    """
+    map: Optional[mmap.mmap]
+    map_lock: threading.Lock
+
+    def __init__(self, heap_file_path: pathlib.Path,
+                 wal: Optional[WriteAheadLog] = None) -> None:
+        self.map = None
+        self.map_lock = threading.Lock()
+        super().__init__(heap_file_path, wal)
+
+    def _map(self, end: int) -> mmap.mmap:
+        """Return the mapping, grown to cover the first end bytes.
+
+        The caller must hold map_lock.
+        """
+        if self.map is not None and end <= len(self.map):
+            return self.map
+        size = -(-end // MMAP_CHUNK_SIZE) * MMAP_CHUNK_SIZE
+        if self.map is None:
+            size = max(size, os.fstat(self.heap_file.fileno()).st_size)
+            self.heap_file.truncate(size)
+            self.map = mmap.mmap(self.heap_file.fileno(), size)
+        else:
+            self.map.resize(size)
+        return self.map
+
+    def allocate_page(self, reuse: bool = True) -> PageID:
+        page_id = super().allocate_page(reuse)
+        with self.map_lock:
+            self._map(PAGE_SIZE * (page_id.to_int() + 1))
+        return page_id
+
+    def write_page_data(self, page_id: PageID, data: PageData) -> None:
         offset = PAGE_SIZE * page_id.to_int()
-        self.heap_file.seek(offset)
-        self.heap_file.write(data)
+        end = offset + len(data)
+        with self.map_lock:
+            self._map(end)[offset:end] = data
+        self.stats.pages_written += 1
 
     def read_page_data(self, page_id: PageID) -> bytearray:
         offset = PAGE_SIZE * page_id.to_int()
-        self.heap_file.seek(offset)
-        return bytearray(self.heap_file.read(PAGE_SIZE))
+        page = bytearray(PAGE_SIZE)
+        with self.map_lock, \
+                memoryview(self._map(offset + PAGE_SIZE)) as view:
+            page[:] = view[offset:offset + PAGE_SIZE]
+        self.stats.pages_read += 1
+        return page
+
+    def read_pages(self, page_ids: Sequence[PageID]) -> List[bytearray]:
+        return [self.read_page_data(page_id) for page_id in page_ids]
+
+    def write_pages(self, pages: Sequence[Tuple[PageID, PageData]]) -> None:
+        for page_id, data in pages:
+            self.write_page_data(page_id, data)
+
+    def sync(self) -> None:
+        with self.map_lock:
+            if self.map is not None:
+                self.map.flush()
+        super().sync()
+
+    def close(self) -> None:
+        with self.map_lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+        super().close()
+
+    def advise(self, page_ids: Sequence[PageID]) -> None:
+        """madvise(MADV_WILLNEED) the byte ranges of the given pages.
+
+        Only those ranges are advised: the rest of the mapping keeps the
+        kernel's default read-around, so point lookups running beside a
+        scan neither pay for nor undo its advice.
+        """
+        if not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        with self.map_lock:
+            for first, count in self._runs(
+                    sorted(page_ids, key=PageID.to_int)):
+                end = PAGE_SIZE * (first + count)
+                self._map(end)
+                start = PAGE_SIZE * first
+                start -= start % mmap.PAGESIZE
+                self._madvise(mmap.MADV_WILLNEED, start, end - start)
+
+    def _madvise(self, option: int, start: int, length: int) -> None:
+        """madvise part of the mapping.  The caller holds map_lock."""
+        assert self.map is not None
+        self.map.madvise(option, start, length)
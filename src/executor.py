@@ -0,0 +1,352 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, \
+    Tuple
+from operator import itemgetter
+import itertools
+from src.table import Row, Table
+
+"""
+A query is a tree of operators.  Each operator pulls batches (lists of
+rows, a row being a tuple) from its children and yields batches of its
+own, so the Python work of passing rows between operators is paid once a
+batch rather than once a row.  An operator names its output columns in
+columns; a table's columns are named after the schema, prefixed with
+"alias." when the scan is given an alias.
+"""
+
+Batch = List[Row]
+Predicate = Callable[[Row], bool]
+
+BATCH_SIZE: int         = 256
+AGGREGATES              = ('count', 'sum', 'min', 'max', 'avg')
+
+
+class Operator:
+    columns: List[str]
+
+    def batches(self) -> Iterator[Batch]:
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[Row]:
+        for batch in self.batches():
+            yield from batch
+
+    def position(self, name: str) -> int:
+        if name not in self.columns:
+            raise KeyError(f'no column named {name!r}')
+        return self.columns.index(name)
+
+
+def _table_columns(table: Table, alias: Optional[str]) -> List[str]:
+    prefix = '' if alias is None else f'{alias}.'
+    return [prefix + column.name for column in table.schema.columns]
+
+
+def _chunks(rows: Iterator[Row], batch_size: int) -> Iterator[Batch]:
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class SeqScan(Operator):
+    """Every row of a table in primary key order."""
+    table: Table
+    batch_size: int
+
+    def __init__(self, table: Table, alias: Optional[str] = None,
+                 batch_size: int = BATCH_SIZE) -> None:
+        self.table = table
+        self.batch_size = batch_size
+        self.columns = _table_columns(table, alias)
+
+    def batches(self) -> Iterator[Batch]:
+        return _chunks(iter(self.table.scan()), self.batch_size)
+
+
+class IndexScan(Operator):
+    """The rows with start <= key < end, following the leaves of an index.
+
+    Without index_name the range is over the primary key.  start and end
+    may give only the leading columns of the key.
+    """
+    table: Table
+    index_name: Optional[str]
+    start: Optional[Sequence[Any]]
+    end: Optional[Sequence[Any]]
+    batch_size: int
+
+    def __init__(self, table: Table, index_name: Optional[str] = None,
+                 start: Optional[Sequence[Any]] = None,
+                 end: Optional[Sequence[Any]] = None,
+                 alias: Optional[str] = None,
+                 batch_size: int = BATCH_SIZE) -> None:
+        self.table = table
+        self.index_name = index_name
+        self.start = start
+        self.end = end
+        self.batch_size = batch_size
+        self.columns = _table_columns(table, alias)
+
+    def batches(self) -> Iterator[Batch]:
+        if self.index_name is None:
+            return _chunks(iter(self.table.scan(self.start, self.end)),
+                           self.batch_size)
+        return self.table.index_batches(self.index_name, self.start,
+                                        self.end, self.batch_size)
+
+
+class Filter(Operator):
+    child: Operator
+    predicate: Predicate
+
+    def __init__(self, child: Operator, predicate: Predicate) -> None:
+        self.child = child
+        self.predicate = predicate
+        self.columns = child.columns
+
+    def batches(self) -> Iterator[Batch]:
+        predicate = self.predicate
+        for batch in self.child.batches():
+            batch = [row for row in batch if predicate(row)]
+            if batch:
+                yield batch
+
+
+class Project(Operator):
+    child: Operator
+    getter: Callable[[Row], Row]
+
+    def __init__(self, child: Operator, columns: Sequence[str]) -> None:
+        self.child = child
+        self.columns = list(columns)
+        positions = [child.position(name) for name in columns]
+        if len(positions) == 1:
+            # itemgetter of one position returns the value, not a tuple
+            position = positions[0]
+            self.getter = lambda row: (row[position],)
+        else:
+            self.getter = itemgetter(*positions)
+
+    def batches(self) -> Iterator[Batch]:
+        getter = self.getter
+        for batch in self.child.batches():
+            yield list(map(getter, batch))
+
+
+class Limit(Operator):
+    """At most count rows, after skipping offset rows."""
+    child: Operator
+    count: int
+    offset: int
+
+    def __init__(self, child: Operator, count: int, offset: int = 0) -> None:
+        self.child = child
+        self.count = count
+        self.offset = offset
+        self.columns = child.columns
+
+    def batches(self) -> Iterator[Batch]:
+        skip, left = self.offset, self.count
+        if left <= 0:
+            return
+        for batch in self.child.batches():
+            if skip >= len(batch):
+                skip -= len(batch)
+                continue
+            batch = batch[skip:skip + left]
+            skip = 0
+            left -= len(batch)
+            yield batch
+            if left == 0:
+                # stop pulling, so that the scans below are abandoned
+                return
+
+
+class NestedLoopJoin(Operator):
+    """Pairs of a left and a right row for which predicate holds.
+
+    The right input is read once and kept in memory.  predicate takes
+    the joined row, the left columns followed by the right ones; without
+    one, every pair is joined.
+    """
+    left: Operator
+    right: Operator
+    predicate: Optional[Predicate]
+
+    def __init__(self, left: Operator, right: Operator,
+                 predicate: Optional[Predicate] = None) -> None:
+        self.left = left
+        self.right = right
+        self.predicate = predicate
+        self.columns = left.columns + right.columns
+
+    def batches(self) -> Iterator[Batch]:
+        inner = list(self.right)
+        predicate = self.predicate
+        for batch in self.left.batches():
+            joined = [left + right for left in batch for right in inner]
+            if predicate is not None:
+                joined = [row for row in joined if predicate(row)]
+            if joined:
+                yield joined
+
+
+class IndexNestedLoopJoin(Operator):
+    """Left rows joined with the table rows whose key equals left columns.
+
+    Without index_name the key is the whole primary key, and the rows of
+    a batch are looked up with one Table.get_many().  With index_name,
+    left columns give leading columns of the index, and the rows of a
+    batch are looked up with one Table.lookup_many().  Left rows without
+    a match are dropped.
+    """
+    left: Operator
+    table: Table
+    index_name: Optional[str]
+    getter: Callable[[Row], Tuple[Any, ...]]
+
+    def __init__(self, left: Operator, table: Table,
+                 left_columns: Sequence[str],
+                 index_name: Optional[str] = None,
+                 alias: Optional[str] = None) -> None:
+        self.left = left
+        self.table = table
+        self.index_name = index_name
+        positions = [left.position(name) for name in left_columns]
+        self.getter = lambda row: tuple(row[i] for i in positions)
+        self.columns = left.columns + _table_columns(table, alias)
+
+    def batches(self) -> Iterator[Batch]:
+        getter = self.getter
+        for batch in self.left.batches():
+            keys = [getter(row) for row in batch]
+            if self.index_name is None:
+                joined = [left + right for left, right
+                          in zip(batch, self.table.get_many(keys))
+                          if right is not None]
+            else:
+                joined = [left + right for left, rights
+                          in zip(batch, self.table.lookup_many(
+                              self.index_name, keys))
+                          for right in rights]
+            if joined:
+                yield joined
+
+
+class Aggregate(Operator):
+    """Group rows and compute aggregates over each group.
+
+    aggregates are (function, column) pairs, function one of AGGREGATES;
+    column None with count counts rows.  NULLs are skipped, as in SQL.
+    The output columns are the group_by columns, then one named
+    "function(column)" per aggregate.  Without group_by, one row is
+    produced even for no input.
+    """
+    child: Operator
+    group_by: List[str]
+    aggregates: List[Tuple[str, Optional[str]]]
+    updates: List[Callable[[List[Any], Row], None]]
+
+    def __init__(self, child: Operator, group_by: Sequence[str],
+                 aggregates: Sequence[Tuple[str, Optional[str]]]) -> None:
+        for function, column in aggregates:
+            if function not in AGGREGATES:
+                raise ValueError(f'unknown aggregate {function!r}')
+            if column is None and function != 'count':
+                raise ValueError(f'{function} needs a column')
+        self.child = child
+        self.group_by = list(group_by)
+        self.aggregates = list(aggregates)
+        self.columns = self.group_by + [
+            f"{function}({'*' if column is None else column})"
+            for function, column in aggregates
+        ]
+        # chosen once, so that rows are not matched against names
+        self.updates = [
+            self._update(function,
+                         None if column is None else child.position(column))
+            for function, column in self.aggregates
+        ]
+
+    def batches(self) -> Iterator[Batch]:
+        key_positions = [self.child.position(name) for name in self.group_by]
+        updates = self.updates
+        # per group and aggregate: [non-NULL count, sum, min, max]
+        groups: Dict[Tuple[Any, ...], List[List[Any]]] = {}
+        for batch in self.child.batches():
+            for row in batch:
+                key = tuple(row[i] for i in key_positions)
+                states = groups.get(key)
+                if states is None:
+                    states = groups[key] = [[0, 0, None, None]
+                                            for _ in self.aggregates]
+                for state, update in zip(states, updates):
+                    update(state, row)
+        if not groups and not self.group_by:
+            groups[()] = [[0, 0, None, None] for _ in self.aggregates]
+
+        batch = []
+        for key, states in groups.items():
+            batch.append(key + tuple(
+                self._result(function, state)
+                for (function, _), state in zip(self.aggregates, states)
+            ))
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _update(function: str, position: Optional[int]
+                ) -> Callable[[List[Any], Row], None]:
+        """Return the function adding a row to an aggregate's state.
+
+        position None counts every row; otherwise NULLs are skipped.
+        """
+        if position is None:
+            def count_rows(state: List[Any], row: Row) -> None:
+                state[0] += 1
+            return count_rows
+
+        def count(state: List[Any], row: Row) -> None:
+            if row[position] is not None:
+                state[0] += 1
+
+        def add(state: List[Any], row: Row) -> None:
+            value = row[position]
+            if value is not None:
+                state[0] += 1
+                state[1] += value
+
+        def low(state: List[Any], row: Row) -> None:
+            value = row[position]
+            if value is not None:
+                state[0] += 1
+                if state[2] is None or value < state[2]:
+                    state[2] = value
+
+        def high(state: List[Any], row: Row) -> None:
+            value = row[position]
+            if value is not None:
+                state[0] += 1
+                if state[3] is None or value > state[3]:
+                    state[3] = value
+
+        return {'count': count, 'sum': add, 'avg': add,
+                'min': low, 'max': high}[function]
+
+    @staticmethod
+    def _result(function: str, state: List[Any]) -> Any:
+        count, total, low, high = state
+        if function == 'count':
+            return count
+        if not count:
+            return None
+        if function == 'sum':
+            return total
+        if function == 'avg':
+            return total / count
+        return low if function == 'min' else high
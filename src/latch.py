@@ -0,0 +1,80 @@
+from typing import Iterator, Optional
+from contextlib import contextmanager
+import threading
+
+
+class RWLatch:
+    """Latch held either shared by many threads or exclusively by one.
+
+    A thread waiting for exclusive access keeps new shared holders out,
+    so a steady stream of readers cannot starve a writer.  The latch is
+    not reentrant.
+
+    There is one latch per buffer frame, so the condition to wait on is
+    only made the first time the latch is contended.
+    """
+    __slots__ = ('readers', 'writer', 'waiting_writers', 'mutex', 'changed')
+    readers: int
+    writer: bool
+    waiting_writers: int
+    mutex: threading.Lock
+    changed: Optional[threading.Condition]
+
+    def __init__(self) -> None:
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.mutex = threading.Lock()
+        self.changed = None
+
+    def _wait(self) -> None:
+        if self.changed is None:
+            self.changed = threading.Condition(self.mutex)
+        self.changed.wait()
+
+    def acquire(self, exclusive: bool, blocking: bool = True) -> bool:
+        with self.mutex:
+            if exclusive:
+                if not blocking and (self.writer or self.readers):
+                    return False
+                self.waiting_writers += 1
+                while self.writer or self.readers:
+                    self._wait()
+                self.waiting_writers -= 1
+                self.writer = True
+            else:
+                if not blocking and (self.writer or self.waiting_writers):
+                    return False
+                while self.writer or self.waiting_writers:
+                    self._wait()
+                self.readers += 1
+            return True
+
+    def release(self, exclusive: bool) -> None:
+        with self.mutex:
+            if exclusive:
+                if not self.writer:
+                    raise ValueError('latch is not held exclusively')
+                self.writer = False
+            else:
+                if self.readers == 0:
+                    raise ValueError('latch is not held shared')
+                self.readers -= 1
+            if self.changed is not None:
+                self.changed.notify_all()
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        self.acquire(False)
+        try:
+            yield
+        finally:
+            self.release(False)
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        self.acquire(True)
+        try:
+            yield
+        finally:
+            self.release(True)
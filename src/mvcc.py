@@ -0,0 +1,274 @@
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import threading
+from src.btree.btree import BTree
+
+"""
+VERSION KEY
++-------------------+-------------------+----------------------------+
+| [bytes] escaped   | [bytes] 00 00     | [int] ~commit_id (8 bytes) |
++-------------------+-------------------+----------------------------+
+
+VERSION VALUE
+0            1
++------------+---------------+
+| [int] kind | [bytes] value |
++------------+---------------+
+
+Every committed write of a key is a separate version in the tree.  The
+key is escaped (each 00 byte becomes 00 ff) and terminated by 00 00, so
+versions sort by key first, and the commit ID is stored inverted so that
+the versions of one key sort newest first.  A deletion is a version of
+kind DELETED with no value.
+"""
+
+COMMIT_ID_SIZE: int     = 8
+MAX_COMMIT_ID: int      = (1 << 8 * COMMIT_ID_SIZE) - 1
+TERMINATOR: bytes       = b'\x00\x00'
+
+PUT: int                = 0
+DELETED: int            = 1
+
+
+class WriteConflictError(Exception):
+    pass
+
+
+def escape(key: bytes) -> bytes:
+    return key.replace(b'\x00', b'\x00\xff')
+
+
+def version_key(key: bytes, commit_id: int) -> bytes:
+    inverted = MAX_COMMIT_ID - commit_id
+    return (escape(key) + TERMINATOR
+            + inverted.to_bytes(COMMIT_ID_SIZE, 'big'))
+
+
+def split_version_key(version: bytes) -> Tuple[bytes, int]:
+    """Return the key and commit ID a version key was made from."""
+    escaped = version[:-COMMIT_ID_SIZE - len(TERMINATOR)]
+    inverted = int.from_bytes(version[-COMMIT_ID_SIZE:], 'big')
+    return escaped.replace(b'\x00\xff', b'\x00'), MAX_COMMIT_ID - inverted
+
+
+class TransactionManager:
+    """Snapshot isolation over the versions stored in a BTree.
+
+    A transaction reads the versions committed before it began, so a
+    reader never waits for a writer and never sees half a commit.  Writes
+    are kept in the transaction until commit(), which fails with
+    WriteConflictError if a key written was also committed by another
+    transaction since this one began (first committer wins).  Commits are
+    serialized; the versions of a commit are installed before the commit
+    ID becomes visible to new transactions.
+
+    Old versions stay until gc() drops the ones no running transaction
+    can see.  The tree must be used through one TransactionManager only.
+    """
+    tree: BTree
+    last_commit_id: int
+    active: Dict[int, int]
+    next_txid: int
+    lock: threading.Lock
+    commit_lock: threading.Lock
+
+    def __init__(self, tree: BTree) -> None:
+        self.tree = tree
+        # commit IDs keep growing across restarts
+        self.last_commit_id = max(
+            (split_version_key(version)[1] for version, _ in tree.scan()),
+            default=0,
+        )
+        self.active = {}
+        self.next_txid = 1
+        self.lock = threading.Lock()
+        self.commit_lock = threading.Lock()
+
+    def begin(self) -> Transaction:
+        with self.lock:
+            txid = self.next_txid
+            self.next_txid += 1
+            self.active[txid] = self.last_commit_id
+            return Transaction(self, txid, self.last_commit_id)
+
+    def _end(self, txid: int) -> None:
+        with self.lock:
+            self.active.pop(txid, None)
+
+    def horizon(self) -> int:
+        """Return the oldest snapshot a running transaction may read."""
+        with self.lock:
+            return min(self.active.values(), default=self.last_commit_id)
+
+    def _versions(self, key: bytes, snapshot: Optional[int] = None
+                  ) -> Iterator[Tuple[int, bytes]]:
+        """Yield (commit ID, version value) of key, newest first.
+
+        With snapshot, only the versions committed up to it are yielded.
+        """
+        start = (escape(key) + TERMINATOR if snapshot is None
+                 else version_key(key, snapshot))
+        end = escape(key) + b'\x00\x01'
+        for version, value in self.tree.scan(start, end):
+            yield split_version_key(version)[1], value
+
+    def _commit(self, transaction: Transaction) -> int:
+        rows = []
+        for key, value in sorted(transaction.writes.items()):
+            data = bytes([DELETED]) if value is None else bytes([PUT]) + value
+            rows.append((key, data))
+            # checked up front, so that a commit is never half installed
+            if (len(version_key(key, 0)) > self.tree.key_size
+                    or len(data) > self.tree.value_size):
+                raise ValueError(f'{key!r} or its value is too long')
+
+        with self.commit_lock:
+            for key in transaction.writes:
+                for commit_id, _ in self._versions(key):
+                    if commit_id > transaction.snapshot:
+                        raise WriteConflictError(
+                            f'{key!r} was changed by a later commit'
+                        )
+                    break
+            commit_id = self.last_commit_id + 1
+            for key, data in rows:
+                self.tree.add(version_key(key, commit_id), data)
+            if self.tree.bufmgr.disk.wal is not None:
+                self.tree.bufmgr.commit()
+            with self.lock:
+                self.last_commit_id = commit_id
+            return commit_id
+
+    def gc(self) -> int:
+        """Drop the versions no running or future transaction can read.
+
+        Of the versions of a key committed up to the horizon, only the
+        newest is still visible, and not even that one if it is a
+        deletion.  Returns the number of versions dropped.
+        """
+        horizon = self.horizon()
+        dead: List[bytes] = []
+        key: Optional[bytes] = None
+        seen_visible = False
+        for version, value in self.tree.scan():
+            version_of, commit_id = split_version_key(version)
+            if version_of != key:
+                key = version_of
+                seen_visible = False
+            if commit_id > horizon:
+                continue
+            if seen_visible or value[0] == DELETED:
+                dead.append(version)
+            seen_visible = True
+        for version in dead:
+            self.tree.remove(version)
+        return len(dead)
+
+
+class Transaction:
+    """A snapshot of the tree plus the writes not yet committed.
+
+    Use it as a context manager to commit on success and abort on error.
+    """
+    manager: TransactionManager
+    txid: int
+    snapshot: int
+    writes: Dict[bytes, Optional[bytes]]
+    done: bool
+
+    def __init__(self, manager: TransactionManager, txid: int,
+                 snapshot: int) -> None:
+        self.manager = manager
+        self.txid = txid
+        self.snapshot = snapshot
+        self.writes = {}
+        self.done = False
+
+    def __enter__(self) -> Transaction:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.done:
+            return
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def _check(self) -> None:
+        if self.done:
+            raise ValueError('the transaction has ended')
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        self._check()
+        if key in self.writes:
+            return self.writes[key]
+        for _, value in self.manager._versions(key, self.snapshot):
+            return None if value[0] == DELETED else value[1:]
+        return None
+
+    def put(self, key: bytes, value: bytes) -> None:
+        self._check()
+        self.writes[key] = value
+
+    def delete(self, key: bytes) -> None:
+        self._check()
+        self.writes[key] = None
+
+    def scan(self, start: Optional[bytes] = None,
+             end: Optional[bytes] = None) -> Iterator[Tuple[bytes, bytes]]:
+        """Yield the (key, value) pairs with start <= key < end in key order.
+
+        The pairs are those of the snapshot with this transaction's own
+        writes applied.
+        """
+        self._check()
+        writes = sorted(
+            (key, value) for key, value in self.writes.items()
+            if (start is None or key >= start) and (end is None or key < end)
+        )
+        written: Set[bytes] = set(self.writes)
+        i = 0
+        for key, value in self._snapshot_scan(start, end):
+            while i < len(writes) and writes[i][0] < key:
+                if writes[i][1] is not None:
+                    yield writes[i]
+                i += 1
+            if key not in written:
+                yield key, value
+        for key, value in writes[i:]:
+            if value is not None:
+                yield key, value
+
+    def _snapshot_scan(self, start: Optional[bytes],
+                       end: Optional[bytes]) -> Iterator[Tuple[bytes, bytes]]:
+        key: Optional[bytes] = None
+        found = False
+        for version, value in self.manager.tree.scan(
+                None if start is None else escape(start),
+                None if end is None else escape(end)):
+            version_of, commit_id = split_version_key(version)
+            if version_of != key:
+                key = version_of
+                found = False
+            if found or commit_id > self.snapshot:
+                continue
+            found = True
+            if value[0] != DELETED:
+                yield key, value[1:]
+
+    def commit(self) -> int:
+        """Install the writes and return the commit ID (0 if read-only)."""
+        self._check()
+        try:
+            if not self.writes:
+                return 0
+            return self.manager._commit(self)
+        finally:
+            self.done = True
+            self.manager._end(self.txid)
+
+    def abort(self) -> None:
+        self._check()
+        self.done = True
+        self.manager._end(self.txid)
@@ -0,0 +1,91 @@
+from typing import Deque, Dict, List, Optional, Sequence
+from collections import OrderedDict, deque
+import threading
+from src.disk import PageID, DiskManager
+
+
+class ReadAhead:
+    """Background worker that reads pages before they are fetched.
+
+    request() queues page IDs; the worker drains the queue, reads the
+    batch with one DiskManager.read_pages() call and stages the pages,
+    at most max_pages of them, oldest dropped first.  A buffer pool miss
+    takes a staged page instead of reading it.
+
+    A staged page is only valid until the page is written again, so the
+    buffer pool calls invalidate() for every page it writes.  Each page
+    has a generation that invalidate() bumps; a read that was in flight
+    across an invalidation is thrown away.
+    """
+    disk: DiskManager
+    max_pages: int
+    queue: Deque[PageID]
+    staged: 'OrderedDict[PageID, bytearray]'
+    generations: Dict[PageID, int]
+    closed: bool
+    lock: threading.Lock
+    requested: threading.Condition
+    worker: threading.Thread
+
+    def __init__(self, disk: DiskManager, max_pages: int = 64) -> None:
+        self.disk = disk
+        self.max_pages = max_pages
+        self.queue = deque()
+        self.staged = OrderedDict()
+        self.generations = {}
+        self.closed = False
+        self.lock = threading.Lock()
+        self.requested = threading.Condition(self.lock)
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def request(self, page_ids: Sequence[PageID]) -> None:
+        with self.lock:
+            for page_id in page_ids:
+                if page_id not in self.staged:
+                    self.queue.append(page_id)
+            self.requested.notify()
+
+    def take(self, page_id: PageID) -> Optional[bytearray]:
+        with self.lock:
+            return self.staged.pop(page_id, None)
+
+    def invalidate(self, page_id: PageID) -> None:
+        with self.lock:
+            self.staged.pop(page_id, None)
+            if page_id in self.generations or self.queue:
+                self.generations[page_id] = (
+                    self.generations.get(page_id, 0) + 1
+                )
+
+    def _run(self) -> None:
+        while True:
+            with self.lock:
+                while not self.queue and not self.closed:
+                    self.requested.wait()
+                if self.closed:
+                    return
+                batch: List[PageID] = list(dict.fromkeys(self.queue))
+                self.queue.clear()
+                generations = [self.generations.setdefault(page_id, 0)
+                               for page_id in batch]
+
+            pages = self.disk.read_pages(batch)
+
+            with self.lock:
+                for page_id, generation, page in zip(batch, generations,
+                                                     pages):
+                    if self.generations.get(page_id) != generation:
+                        continue
+                    self.staged[page_id] = page
+                    self.staged.move_to_end(page_id)
+                    if len(self.staged) > self.max_pages:
+                        self.staged.popitem(last=False)
+                if not self.queue:
+                    self.generations.clear()
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            self.requested.notify()
+        self.worker.join()
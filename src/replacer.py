@@ -0,0 +1,283 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from heapq import heappush, heappop
+from src.disk import PageID
+
+if TYPE_CHECKING:
+    from src.buffer import Frame
+
+
+BufferID = int
+
+
+class NoFreeBufferError(Exception):
+    pass
+
+
+class Replacer:
+    """Chooses which buffer of a full pool to reuse for the next page.
+
+    BufferPool attaches its frames, reports every hit and every page load
+    through access(), and asks evict() for a victim once no buffer is
+    free.  A victim must not be pinned; when every buffer is pinned,
+    evict() raises NoFreeBufferError.
+    """
+    buffers: List[Frame]
+
+    def attach(self, buffers: List[Frame]) -> None:
+        self.buffers = buffers
+
+    def is_pinned(self, buffer_id: BufferID) -> bool:
+        return self.buffers[buffer_id].pin_count > 0
+
+    def access(self, buffer_id: BufferID, page_id: PageID,
+               hit: bool) -> None:
+        raise NotImplementedError
+
+    def evict(self, page_id: Optional[PageID] = None) -> BufferID:
+        """Pick a victim to make room for page_id (None for a new page)."""
+        raise NotImplementedError
+
+    def remove(self, buffer_id: BufferID) -> None:
+        """Forget a buffer whose page was freed."""
+        raise NotImplementedError
+
+
+class ClockReplacer(Replacer):
+    max_usage_count: int
+    next_victim_id: BufferID
+
+    def __init__(self, max_usage_count: int = 5) -> None:
+        self.max_usage_count = max_usage_count
+        self.next_victim_id = 0
+
+    def access(self, buffer_id: BufferID, page_id: PageID,
+               hit: bool) -> None:
+        frame = self.buffers[buffer_id]
+        if hit:
+            frame.usage_count = min(frame.usage_count + 1,
+                                    self.max_usage_count)
+        else:
+            frame.usage_count = 1
+
+    def evict(self, page_id: Optional[PageID] = None) -> BufferID:
+        pool_size = len(self.buffers)
+        consective_pinned = 0
+
+        while True:
+            # the pool may have shrunk since the hand last moved
+            next_victim_id = self.next_victim_id % pool_size
+            frame = self.buffers[next_victim_id]
+            if frame.pin_count > 0:
+                consective_pinned += 1
+                if consective_pinned >= pool_size:
+                    raise NoFreeBufferError('every buffer is pinned')
+            else:
+                if frame.usage_count == 0:
+                    return next_victim_id
+                frame.usage_count -= 1
+                consective_pinned = 0
+            self.next_victim_id = (next_victim_id + 1) % pool_size
+
+    def remove(self, buffer_id: BufferID) -> None:
+        self.buffers[buffer_id].usage_count = 0
+
+
+class LRUKReplacer(Replacer):
+    """Evict the buffer whose k-th most recent access is the oldest.
+
+    Buffers seen fewer than k times count as infinitely old and go first,
+    oldest first access first.  Candidates sit in a heap with lazy
+    deletion: an entry is stale once its buffer has been accessed again.
+    """
+    k: int
+    now: int
+    history: Dict[BufferID, Deque[int]]
+    keys: Dict[BufferID, Tuple[int, int]]
+    heap: List[Tuple[Tuple[int, int], BufferID]]
+
+    def __init__(self, k: int = 2) -> None:
+        self.k = k
+        self.now = 0
+        self.history = {}
+        self.keys = {}
+        self.heap = []
+
+    def access(self, buffer_id: BufferID, page_id: PageID,
+               hit: bool) -> None:
+        self.now += 1
+        if not hit or buffer_id not in self.history:
+            self.history[buffer_id] = deque(maxlen=self.k)
+        history = self.history[buffer_id]
+        history.append(self.now)
+
+        key = (int(len(history) == self.k), history[0])
+        if self.keys.get(buffer_id) == key:
+            return
+        self.keys[buffer_id] = key
+        heappush(self.heap, (key, buffer_id))
+        if len(self.heap) > 4 * len(self.buffers):
+            self.heap = [(key, buffer_id)
+                         for buffer_id, key in self.keys.items()]
+            self.heap.sort()
+
+    def evict(self, page_id: Optional[PageID] = None) -> BufferID:
+        pinned = []
+        try:
+            while self.heap:
+                key, buffer_id = heappop(self.heap)
+                if self.keys.get(buffer_id) != key:
+                    continue
+                if self.is_pinned(buffer_id):
+                    pinned.append((key, buffer_id))
+                    continue
+                self.remove(buffer_id)
+                return buffer_id
+            raise NoFreeBufferError('every buffer is pinned')
+        finally:
+            for entry in pinned:
+                heappush(self.heap, entry)
+
+    def remove(self, buffer_id: BufferID) -> None:
+        self.history.pop(buffer_id, None)
+        self.keys.pop(buffer_id, None)
+
+
+class TwoQReplacer(Replacer):
+    """Simplified 2Q.
+
+    Pages loaded for the first time enter the FIFO a1in.  A page that is
+    requested again after leaving a1in, while its ID is still remembered
+    in the ghost queue a1out, is promoted to the LRU queue am.  Pages read
+    only once, such as those of a scan, therefore never push out am.
+    """
+    in_ratio: float
+    out_ratio: float
+    a1in: 'OrderedDict[BufferID, PageID]'
+    am: 'OrderedDict[BufferID, PageID]'
+    a1out: 'OrderedDict[PageID, None]'
+
+    def __init__(self, in_ratio: float = 0.25,
+                 out_ratio: float = 0.5) -> None:
+        self.in_ratio = in_ratio
+        self.out_ratio = out_ratio
+        self.a1in = OrderedDict()
+        self.am = OrderedDict()
+        self.a1out = OrderedDict()
+
+    def access(self, buffer_id: BufferID, page_id: PageID,
+               hit: bool) -> None:
+        if hit:
+            if buffer_id in self.am:
+                self.am.move_to_end(buffer_id)
+            return
+        if page_id in self.a1out:
+            del self.a1out[page_id]
+            self.am[buffer_id] = page_id
+        else:
+            self.a1in[buffer_id] = page_id
+
+    def evict(self, page_id: Optional[PageID] = None) -> BufferID:
+        if len(self.a1in) > self.in_ratio * len(self.buffers):
+            queues = [self.a1in, self.am]
+        else:
+            queues = [self.am, self.a1in]
+        for queue in queues:
+            for buffer_id in queue:
+                if self.is_pinned(buffer_id):
+                    continue
+                evicted = queue.pop(buffer_id)
+                if queue is self.a1in:
+                    self.a1out[evicted] = None
+                    if len(self.a1out) > self.out_ratio * len(self.buffers):
+                        self.a1out.popitem(last=False)
+                return buffer_id
+        raise NoFreeBufferError('every buffer is pinned')
+
+    def remove(self, buffer_id: BufferID) -> None:
+        self.a1in.pop(buffer_id, None)
+        self.am.pop(buffer_id, None)
+
+
+class ARCReplacer(Replacer):
+    """Adaptive Replacement Cache.
+
+    t1 holds pages seen once recently and t2 pages seen at least twice;
+    b1 and b2 remember the IDs recently evicted from each.  A miss that
+    hits a ghost list moves the target size p of t1 towards the list
+    that would have kept the page.
+    """
+    p: float
+    t1: 'OrderedDict[BufferID, PageID]'
+    t2: 'OrderedDict[BufferID, PageID]'
+    b1: 'OrderedDict[PageID, None]'
+    b2: 'OrderedDict[PageID, None]'
+    promoted: Optional[PageID]
+
+    def __init__(self) -> None:
+        self.p = 0
+        self.t1 = OrderedDict()
+        self.t2 = OrderedDict()
+        self.b1 = OrderedDict()
+        self.b2 = OrderedDict()
+        self.promoted = None
+
+    def _adapt(self, page_id: PageID) -> None:
+        """Adjust p on a ghost hit and remember the page for promotion."""
+        size = len(self.buffers)
+        if page_id in self.b1:
+            self.p = min(size, self.p + max(len(self.b2) / len(self.b1), 1))
+            del self.b1[page_id]
+            self.promoted = page_id
+        elif page_id in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) / len(self.b2), 1))
+            del self.b2[page_id]
+            self.promoted = page_id
+
+    def access(self, buffer_id: BufferID, page_id: PageID,
+               hit: bool) -> None:
+        if hit:
+            if buffer_id in self.t1:
+                del self.t1[buffer_id]
+            self.t2[buffer_id] = page_id
+            self.t2.move_to_end(buffer_id)
+            return
+
+        if self.promoted != page_id:
+            self._adapt(page_id)
+        if self.promoted == page_id:
+            self.promoted = None
+            self.t2[buffer_id] = page_id
+            return
+
+        self.t1[buffer_id] = page_id
+        size = len(self.buffers)
+        if len(self.t1) + len(self.b1) > size and self.b1:
+            self.b1.popitem(last=False)
+        total = len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2)
+        if total > 2 * size and self.b2:
+            self.b2.popitem(last=False)
+
+    def evict(self, page_id: Optional[PageID] = None) -> BufferID:
+        in_b2 = page_id is not None and page_id in self.b2
+        if page_id is not None:
+            self._adapt(page_id)
+        from_t1 = len(self.t1) > 0 and (
+            len(self.t1) > self.p or (in_b2 and len(self.t1) == self.p)
+        )
+        if from_t1:
+            lists = [(self.t1, self.b1), (self.t2, self.b2)]
+        else:
+            lists = [(self.t2, self.b2), (self.t1, self.b1)]
+        for resident, ghost in lists:
+            for buffer_id in resident:
+                if self.is_pinned(buffer_id):
+                    continue
+                ghost[resident.pop(buffer_id)] = None
+                return buffer_id
+        raise NoFreeBufferError('every buffer is pinned')
+
+    def remove(self, buffer_id: BufferID) -> None:
+        self.t1.pop(buffer_id, None)
+        self.t2.pop(buffer_id, None)
@@ -0,0 +1,162 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+import math
+import threading
+
+if TYPE_CHECKING:
+    from src.disk import DiskManager
+    from src.buffer import BufferPoolManager
+    from src.btree.btree import BTree
+
+
+Hook = Callable[[str, Dict[str, Any]], None]
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+# bucket i of a histogram holds latencies in [GROWTH ** i, GROWTH ** (i + 1))
+GROWTH: float           = 1.01
+
+
+class LatencyHistogram:
+    """Latencies in nanoseconds, kept to within 1% in log-spaced buckets.
+
+    The memory used does not depend on how many latencies are recorded,
+    so a benchmark of billions of operations can keep all of them.
+    """
+    buckets: List[int]
+    count: int
+    total: int
+    max: int
+
+    def __init__(self) -> None:
+        self.buckets = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns: int) -> None:
+        index = int(math.log(ns, GROWTH)) if ns > 1 else 0
+        if index >= len(self.buckets):
+            self.buckets.extend([0] * (index + 1 - len(self.buckets)))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += ns
+        self.max = max(self.max, ns)
+
+    def percentile(self, p: float) -> float:
+        """Return the p-th percentile, the upper bound of its bucket."""
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(GROWTH ** (index + 1), self.max)
+        return float(self.max)
+
+    def summary(self) -> Dict[str, float]:
+        """Return the count, and the mean, percentiles and max in us."""
+        if not self.count:
+            return {'count': 0}
+        summary = {'count': self.count,
+                   'mean': self.total / self.count / 1000}
+        for p in PERCENTILES:
+            summary[f'p{p:g}'] = self.percentile(p) / 1000
+        summary['max'] = self.max / 1000
+        return summary
+
+
+class TreeStats:
+    leaf_splits: int
+    inner_splits: int
+    merges: int
+    root_grows: int
+    root_shrinks: int
+
+    def __init__(self) -> None:
+        self.leaf_splits = 0
+        self.inner_splits = 0
+        self.merges = 0
+        self.root_grows = 0
+        self.root_shrinks = 0
+
+
+class StatsRegistry:
+    """Collects the counters of the storage engine in one place.
+
+    Components are attached by name.  snapshot() then reads their
+    counters into one flat dict keyed by "name.counter", together with
+    the latency histograms, so it can be logged or exported as is.
+
+    Attaching also enables what costs something to keep: a tree times
+    its get, get_many, add and remove into histograms, and a tree or a
+    buffer pool reports events (page misses, evictions, splits, merges)
+    to the hooks added with add_hook().  A hook is called as
+    hook(event, fields) on the thread that caused the event, possibly
+    with latches held, so it must be quick and must not use the pool.
+    """
+    sources: Dict[str, Callable[[], Dict[str, Any]]]
+    histograms: Dict[str, LatencyHistogram]
+    hooks: List[Hook]
+    lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.sources = {}
+        self.histograms = {}
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def register(self, name: str,
+                 source: Callable[[], Dict[str, Any]]) -> None:
+        """Include the dict returned by source() in every snapshot."""
+        self.sources[name] = source
+
+    def attach_disk(self, disk: DiskManager, name: str = 'disk') -> None:
+        self.register(name, lambda: dict(vars(disk.stats)))
+
+    def attach_buffer_pool(self, bufmgr: BufferPoolManager,
+                           name: str = 'buffer') -> None:
+        def read() -> Dict[str, Any]:
+            stats = bufmgr.stats
+            return dict(vars(stats), hit_rate=stats.hit_rate())
+
+        self.register(name, read)
+        # a PartitionedBufferPoolManager reports through its partitions
+        for partition in getattr(bufmgr, 'partitions', [bufmgr]):
+            partition.registry = self
+
+    def attach_tree(self, tree: BTree, name: str = 'btree') -> None:
+        self.register(name, lambda: dict(vars(tree.stats),
+                                         height=tree.height()))
+        tree.stats_name = name
+        tree.registry = self
+
+    def record(self, name: str, ns: int) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(ns)
+
+    def add_hook(self, hook: Hook) -> None:
+        self.hooks = self.hooks + [hook]
+
+    def remove_hook(self, hook: Hook) -> None:
+        self.hooks = [other for other in self.hooks if other is not hook]
+
+    def emit(self, event: str, **fields: Any) -> None:
+        # hooks is replaced, never changed, so no lock is needed here
+        for hook in self.hooks:
+            hook(event, fields)
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot: Dict[str, Any] = {}
+        for name, source in list(self.sources.items()):
+            for counter, value in source().items():
+                snapshot[f'{name}.{counter}'] = value
+        with self.lock:
+            for name, histogram in self.histograms.items():
+                snapshot[f'latency.{name}'] = histogram.summary()
+        return snapshot
+
+    def reset_histograms(self) -> None:
+        with self.lock:
+            self.histograms = {}
@@ -0,0 +1,403 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import itertools
+import threading
+from src.buffer import BufferPoolManager
+from src.btree.btree import BTree
+from src import codec
+
+"""
+PRIMARY TREE
+key = encode(primary key columns)
+value = encode(the other columns)
+
+INDEX TREE
+key = encode(index columns) [+ encode(primary key columns)]
+value = encode(primary key columns)
+
+A table is a BTree keyed by its primary key, plus one BTree per secondary
+index mapping the indexed columns to primary keys.  Tuples are encoded
+with codec, so the trees order them as the tuples themselves are ordered.
+The key of a non-unique index ends with the primary key, which makes
+equal index values distinct entries.  So does the key of a unique index
+entry that has a NULL, since NULLs never collide; any other unique index
+key is the index columns only, and inserting a second row with the same
+values fails.
+"""
+
+Row = Tuple[Any, ...]
+
+
+class DuplicateKeyError(Exception):
+    pass
+
+
+def _new_tree(bufmgr: BufferPoolManager, name: Optional[str],
+              key_size: int, value_size: int) -> BTree:
+    if name is None:
+        return BTree(bufmgr, key_size, value_size)
+    return BTree.create(bufmgr, name, key_size, value_size)
+
+
+class Column:
+    name: str
+    type: str
+    nullable: bool
+
+    def __init__(self, name: str, type_: str, nullable: bool = True) -> None:
+        if type_ not in codec.TYPES:
+            raise ValueError(f'unknown column type {type_!r}')
+        self.name = name
+        self.type = type_
+        self.nullable = nullable
+
+
+class Index:
+    name: str
+    columns: List[str]
+    unique: bool
+
+    def __init__(self, name: str, columns: Sequence[str],
+                 unique: bool = False) -> None:
+        self.name = name
+        self.columns = list(columns)
+        self.unique = unique
+
+
+class Schema:
+    """Columns, the primary key and the secondary indexes of a table.
+
+    Primary key columns are never NULL.  Rows are tuples of column values
+    in column order; the primary tree stores the key columns in its keys
+    and the value_columns, the rest, in its values.
+    """
+    columns: List[Column]
+    primary_key: List[str]
+    indexes: List[Index]
+    positions: Dict[str, int]
+    key_types: List[str]
+    value_columns: List[str]
+    value_types: List[str]
+
+    def __init__(self, columns: Sequence[Column], primary_key: Sequence[str],
+                 indexes: Sequence[Index] = ()) -> None:
+        self.columns = list(columns)
+        self.positions = {column.name: i
+                          for i, column in enumerate(self.columns)}
+        if len(self.positions) != len(self.columns):
+            raise ValueError('column names must be unique')
+        if not primary_key:
+            raise ValueError('a table needs a primary key')
+        self.primary_key = list(primary_key)
+        self.key_types = self.types(self.primary_key)
+        self.value_columns = [column.name for column in self.columns
+                              if column.name not in self.primary_key]
+        self.value_types = self.types(self.value_columns)
+        self.indexes = []
+        for index in indexes:
+            self.add_index(index)
+
+    def position(self, name: str) -> int:
+        if name not in self.positions:
+            raise KeyError(f'no column named {name!r}')
+        return self.positions[name]
+
+    def index(self, name: str) -> Index:
+        for index in self.indexes:
+            if index.name == name:
+                return index
+        raise KeyError(f'no index named {name!r}')
+
+    def check_index(self, index: Index) -> None:
+        if any(other.name == index.name for other in self.indexes):
+            raise ValueError(f'index {index.name!r} already exists')
+        if len(set(index.columns)) != len(index.columns):
+            raise ValueError('an index names each column at most once')
+        for name in index.columns:
+            self.position(name)
+
+    def add_index(self, index: Index) -> None:
+        self.check_index(index)
+        self.indexes.append(index)
+
+    def types(self, names: Sequence[str]) -> List[str]:
+        return [self.columns[self.position(name)].type for name in names]
+
+    def index_sizes(self, index: Index, key_size: int,
+                    value_size: int) -> Tuple[int, int]:
+        """Return the key and value sizes of the tree of index.
+
+        key_size and value_size are those of the primary tree.  Indexed
+        columns of the primary key take at most key_size bytes, the others
+        at most value_size, and the primary key may follow them.
+        """
+        key_columns = [name for name in index.columns
+                       if name in self.primary_key]
+        value_columns = [name for name in index.columns
+                         if name not in self.primary_key]
+        size = (codec.max_size(self.types(key_columns), key_size)
+                + codec.max_size(self.types(value_columns), value_size))
+        return size + key_size, key_size
+
+    def project(self, row: Row, names: Sequence[str]) -> List[Any]:
+        return [row[self.position(name)] for name in names]
+
+    def check(self, row: Row) -> None:
+        if len(row) != len(self.columns):
+            raise ValueError(f'a row has {len(self.columns)} columns')
+        for column, value in zip(self.columns, row):
+            if value is None and (not column.nullable
+                                  or column.name in self.primary_key):
+                raise ValueError(f'column {column.name!r} may not be NULL')
+
+
+class Table:
+    """Rows of a Schema stored in a BTree, with its secondary indexes.
+
+    Inserts and deletes update the table and every index together;
+    they are serialized by a lock, so that no two rows can claim the same
+    unique key.  Reads take no lock.  A lookup through an index skips
+    entries whose row is not there, which a reader may see while a row is
+    being deleted.  A named table keeps its trees in the file's catalog
+    as name and name.index, to be reopened with the same schema.
+    """
+    schema: Schema
+    tree: BTree
+    indexes: Dict[str, BTree]
+    name: Optional[str]
+    lock: threading.Lock
+
+    def __init__(self, schema: Schema, tree: BTree, indexes: Dict[str, BTree],
+                 name: Optional[str] = None) -> None:
+        self.schema = schema
+        self.tree = tree
+        self.indexes = indexes
+        self.name = name
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def create(bufmgr: BufferPoolManager, schema: Schema, key_size: int,
+               value_size: int, name: Optional[str] = None) -> Table:
+        """Create an empty table, recorded in the catalog if named.
+
+        key_size and value_size bound the encoded primary key and the
+        encoded other columns.  ValueError is raised before any tree is
+        made if one of the trees would not fit its pages.
+        """
+        BTree.check_sizes(key_size, value_size)
+        for index in schema.indexes:
+            BTree.check_sizes(*schema.index_sizes(index, key_size,
+                                                  value_size))
+        tree = _new_tree(bufmgr, name, key_size, value_size)
+        table = Table(schema, tree, {}, name)
+        for index in schema.indexes:
+            table.indexes[index.name] = table._new_index_tree(index)
+        return table
+
+    @staticmethod
+    def open(bufmgr: BufferPoolManager, name: str, schema: Schema) -> Table:
+        """Open a table created with create() and the same schema."""
+        return Table(schema, BTree.open(bufmgr, name), {
+            index.name: BTree.open(bufmgr, f'{name}.{index.name}')
+            for index in schema.indexes
+        }, name)
+
+    def _new_index_tree(self, index: Index) -> BTree:
+        key_size, value_size = self.schema.index_sizes(
+            index, self.tree.key_size, self.tree.value_size
+        )
+        BTree.check_sizes(key_size, value_size)
+        return _new_tree(
+            self.tree.bufmgr,
+            None if self.name is None else f'{self.name}.{index.name}',
+            key_size, value_size
+        )
+
+    def _encode_key(self, key: Sequence[Any]) -> bytes:
+        return codec.encode(self.schema.key_types, key)
+
+    def _index_entry(self, index: Index, row: Row,
+                     primary: bytes) -> Tuple[bytes, bool]:
+        """Return the key of row in index, and whether it must be unique."""
+        values = self.schema.project(row, index.columns)
+        key = codec.encode(self.schema.types(index.columns), values)
+        if index.unique and None not in values:
+            return key, True
+        return key + primary, False
+
+    def _decode_row(self, key: bytes, value: bytes) -> Row:
+        schema = self.schema
+        row: List[Any] = [None] * len(schema.columns)
+        values = (codec.decode(schema.key_types, key)[0]
+                  + codec.decode(schema.value_types, value)[0])
+        for name, value_ in zip(schema.primary_key + schema.value_columns,
+                                values):
+            row[schema.positions[name]] = value_
+        return tuple(row)
+
+    def insert(self, row: Sequence[Any]) -> None:
+        """Insert a row, failing with DuplicateKeyError on a taken key."""
+        row = tuple(row)
+        self.schema.check(row)
+        primary = self._encode_key(self.schema.project(
+            row, self.schema.primary_key
+        ))
+        value = codec.encode(self.schema.value_types, self.schema.project(
+            row, self.schema.value_columns
+        ))
+        entries = [(self.indexes[index.name],)
+                   + self._index_entry(index, row, primary)
+                   for index in self.schema.indexes]
+        # checked up front, so that a failed insert changes nothing
+        if len(primary) > self.tree.key_size \
+                or len(value) > self.tree.value_size:
+            raise ValueError('row is too long for the table')
+        for tree, key, _ in entries:
+            if len(key) > tree.key_size:
+                raise ValueError('row is too long for an index')
+
+        with self.lock:
+            if self.tree.get(primary) is not None:
+                raise DuplicateKeyError(f'primary key {primary.hex()}')
+            for index, (tree, key, unique) in zip(self.schema.indexes,
+                                                  entries):
+                if unique and tree.get(key) is not None:
+                    raise DuplicateKeyError(f'unique index {index.name!r}')
+            self.tree.add(primary, value)
+            for tree, key, _ in entries:
+                tree.add(key, primary)
+
+    def get(self, key: Sequence[Any]) -> Optional[Row]:
+        """Return the row with the given primary key values."""
+        primary = self._encode_key(key)
+        value = self.tree.get(primary)
+        return None if value is None else self._decode_row(primary, value)
+
+    def get_many(self, keys: Sequence[Sequence[Any]]) -> List[Optional[Row]]:
+        """Look up many primary keys with one BTree.get_many()."""
+        primaries = [self._encode_key(key) for key in keys]
+        return [None if value is None else self._decode_row(primary, value)
+                for primary, value in zip(primaries,
+                                          self.tree.get_many(primaries))]
+
+    def delete(self, key: Sequence[Any]) -> bool:
+        primary = self._encode_key(key)
+        with self.lock:
+            value = self.tree.get(primary)
+            if value is None:
+                return False
+            row = self._decode_row(primary, value)
+            # indexes first, so that an index never names a missing row
+            # for longer than the delete takes
+            for index in self.schema.indexes:
+                entry, _ = self._index_entry(index, row, primary)
+                self.indexes[index.name].remove(entry)
+            self.tree.remove(primary)
+            return True
+
+    def scan(self, start: Optional[Sequence[Any]] = None,
+             end: Optional[Sequence[Any]] = None) -> Iterator[Row]:
+        """Yield the rows with start <= primary key < end in key order.
+
+        start and end may give only the leading primary key columns.
+        """
+        for key, value in self.tree.scan(
+                None if start is None else self._encode_key(start),
+                None if end is None else self._encode_key(end)):
+            yield self._decode_row(key, value)
+
+    def lookup(self, index_name: str, values: Sequence[Any],
+               batch_size: int = 256) -> Iterator[Row]:
+        """Yield the rows whose indexed columns equal values.
+
+        values may give only the leading columns of the index.  The rows
+        come in index order.
+        """
+        index = self.schema.index(index_name)
+        prefix = codec.encode(self.schema.types(index.columns), values)
+        for batch in self._index_batches(index_name, prefix,
+                                         codec.prefix_end(prefix),
+                                         batch_size):
+            yield from batch
+
+    def lookup_many(self, index_name: str,
+                    values: Sequence[Sequence[Any]]) -> List[List[Row]]:
+        """Return the rows matching each of values, as lookup() would.
+
+        The distinct prefixes are resolved with one BTree.scan_many() over
+        the index, and their rows fetched with one BTree.get_many().
+        """
+        index = self.schema.index(index_name)
+        types = self.schema.types(index.columns)
+        prefixes = [codec.encode(types, value) for value in values]
+        distinct = sorted(set(prefixes))
+        entries = self.indexes[index_name].scan_many(
+            (prefix, codec.prefix_end(prefix)) for prefix in distinct
+        )
+        primaries = sorted({primary for found in entries
+                            for _, primary in found})
+        rows = {primary: self._decode_row(primary, value)
+                for primary, value in zip(primaries,
+                                          self.tree.get_many(primaries))
+                if value is not None}
+        matches = {
+            prefix: [rows[primary] for _, primary in found
+                     if primary in rows]
+            for prefix, found in zip(distinct, entries)
+        }
+        return [matches[prefix] for prefix in prefixes]
+
+    def index_batches(self, index_name: str,
+                      start: Optional[Sequence[Any]] = None,
+                      end: Optional[Sequence[Any]] = None,
+                      batch_size: int = 256) -> Iterator[List[Row]]:
+        """Yield the rows with start <= indexed columns < end, in batches.
+
+        start and end may give only the leading columns of the index.
+        The index is scanned along its leaves, and the rows of each batch
+        of entries are fetched with one BTree.get_many().
+        """
+        types = self.schema.types(self.schema.index(index_name).columns)
+        return self._index_batches(
+            index_name,
+            None if start is None else codec.encode(types, start),
+            None if end is None else codec.encode(types, end),
+            batch_size,
+        )
+
+    def _index_batches(self, index_name: str, start: Optional[bytes],
+                       end: Optional[bytes],
+                       batch_size: int) -> Iterator[List[Row]]:
+        primaries = (primary for _, primary
+                     in self.indexes[index_name].scan(start, end))
+        while True:
+            batch = list(itertools.islice(primaries, batch_size))
+            if not batch:
+                return
+            yield [self._decode_row(primary, value)
+                   for primary, value in zip(batch,
+                                             self.tree.get_many(batch))
+                   if value is not None]
+
+    def create_index(self, index: Index) -> None:
+        """Add an index to the table, filling it from the rows already in.
+
+        The entries are sorted in memory and bulk loaded.  On a duplicate
+        key in a unique index, DuplicateKeyError is raised and the table
+        is left as it was.
+        """
+        self.schema.check_index(index)
+        with self.lock:
+            entries = []
+            for key, value in self.tree.scan():
+                row = self._decode_row(key, value)
+                entry, _ = self._index_entry(index, row, key)
+                entries.append((entry, key))
+            entries.sort()
+            for (entry, _), (next_entry, _) in zip(entries, entries[1:]):
+                if entry == next_entry:
+                    raise DuplicateKeyError(f'unique index {index.name!r}')
+            tree = self._new_index_tree(index)
+            tree.bulk_load(entries)
+            self.schema.add_index(index)
+            self.indexes[index.name] = tree
@@ -0,0 +1,243 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, IO, Dict, Iterator, List, Tuple
+import os
+import pathlib
+import threading
+import zlib
+from src.disk import PageID, PageData
+
+if TYPE_CHECKING:
+    from src.disk import DiskManager
+
+"""
+RECORD
+0           8            9               13             17
++-----------+------------+---------------+--------------+
+| [int] lsn | [int] type | [int] page_id | [int] length |
++-----------+------------+---------------+--------------+
+17               17 + length          21 + length
++----------------+--------------------+
+| [bytes] data   | [int] crc32        |
++----------------+--------------------+
+
+LOG = RECORD + RECORD + RECORD + ...
+
+A PAGE record carries the full image of a page after a change.  A COMMIT
+record closes a group: recovery writes back the images of every group
+that reached its COMMIT and drops the trailing, unfinished one.  The crc32
+covers the header and the data, so a record torn by a crash ends the log.
+"""
+
+LSN_BEGIN: int          = 0
+LSN_END: int            = 8
+
+TYPE: int               = 8
+
+PAGE_ID_BEGIN: int      = 9
+PAGE_ID_END: int        = 13
+
+LENGTH_BEGIN: int       = 13
+LENGTH_END: int         = 17
+
+DATA_BEGIN: int         = 17
+
+CRC_SIZE: int           = 4
+
+PAGE_RECORD: int        = 1
+COMMIT_RECORD: int      = 2
+
+LSN = int
+Record = Tuple[LSN, int, PageID, bytes]
+
+
+class WriteAheadLog:
+    """Redo log of page images with group commit.
+
+    Records are appended to an in-memory tail.  flush(lsn) makes the log
+    durable up to lsn: the first caller becomes the leader, writes the
+    whole tail and fsyncs it once, and every caller that arrives meanwhile
+    waits for that fsync instead of issuing its own.  commit_delay lets the
+    leader wait a little for more records to join the group.
+    """
+    log_file_path: pathlib.Path
+    log_file: IO[bytes]
+    commit_delay: float
+    tail: bytearray
+    next_lsn: LSN
+    flushed_lsn: LSN
+    flushing: bool
+    sync_count: int
+    lock: threading.Lock
+    flushed: threading.Condition
+
+    def __init__(self, log_file_path: pathlib.Path,
+                 commit_delay: float = 0.0) -> None:
+        if not log_file_path.is_file():
+            log_file_path.touch()
+        self.log_file_path = log_file_path
+        self.log_file = log_file_path.open(mode='br+')
+        self.log_file.seek(0, os.SEEK_END)
+        self.commit_delay = commit_delay
+        self.tail = bytearray()
+        self.next_lsn = 1
+        self.flushed_lsn = 0
+        self.flushing = False
+        self.sync_count = 0
+        self.lock = threading.Lock()
+        self.flushed = threading.Condition(self.lock)
+
+    def _append(self, type_: int, page_id: PageID, data: PageData) -> LSN:
+        with self.lock:
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            record = bytearray(DATA_BEGIN)
+            record[LSN_BEGIN:LSN_END] = lsn.to_bytes(LSN_END - LSN_BEGIN, 'big')
+            record[TYPE] = type_
+            record[PAGE_ID_BEGIN:PAGE_ID_END] = page_id.to_int().to_bytes(
+                PAGE_ID_END - PAGE_ID_BEGIN, 'big'
+            )
+            record[LENGTH_BEGIN:LENGTH_END] = len(data).to_bytes(
+                LENGTH_END - LENGTH_BEGIN, 'big'
+            )
+            record += data
+            record += zlib.crc32(record).to_bytes(CRC_SIZE, 'big')
+            self.tail += record
+            return lsn
+
+    def append_page(self, page_id: PageID, data: PageData) -> LSN:
+        return self._append(PAGE_RECORD, page_id, data)
+
+    def append_commit(self) -> LSN:
+        return self._append(COMMIT_RECORD, PageID(0), b'')
+
+    def flush(self, lsn: LSN) -> None:
+        """Return once every record up to lsn is on stable storage."""
+        with self.lock:
+            while self.flushed_lsn < lsn:
+                if self.flushing:
+                    self.flushed.wait()
+                    continue
+                self.flushing = True
+                try:
+                    if self.commit_delay:
+                        self.flushed.wait(self.commit_delay)
+                    data = bytes(self.tail)
+                    self.tail.clear()
+                    target = self.next_lsn - 1
+                    self.lock.release()
+                    try:
+                        self.log_file.write(data)
+                        self.log_file.flush()
+                        os.fsync(self.log_file.fileno())
+                    finally:
+                        self.lock.acquire()
+                    self.flushed_lsn = target
+                    self.sync_count += 1
+                finally:
+                    self.flushing = False
+                    self.flushed.notify_all()
+
+    def commit(self, wait: bool = True) -> LSN:
+        lsn = self.append_commit()
+        if wait:
+            self.flush(lsn)
+        return lsn
+
+    @staticmethod
+    def _parse(log: bytes) -> Iterator[Tuple[int, Record]]:
+        """Yield each valid record with the offset just past it."""
+        begin = 0
+        while begin + DATA_BEGIN + CRC_SIZE <= len(log):
+            length = int.from_bytes(
+                log[begin + LENGTH_BEGIN:begin + LENGTH_END], 'big'
+            )
+            end = begin + DATA_BEGIN + length
+            if end + CRC_SIZE > len(log):
+                return
+            crc = int.from_bytes(log[end:end + CRC_SIZE], 'big')
+            if zlib.crc32(log[begin:end]) != crc:
+                return
+            yield end + CRC_SIZE, (
+                int.from_bytes(log[begin + LSN_BEGIN:begin + LSN_END], 'big'),
+                log[begin + TYPE],
+                PageID(int.from_bytes(
+                    log[begin + PAGE_ID_BEGIN:begin + PAGE_ID_END], 'big'
+                )),
+                log[begin + DATA_BEGIN:end],
+            )
+            begin = end + CRC_SIZE
+
+    def _read_log(self) -> bytes:
+        self.log_file.seek(0)
+        log = self.log_file.read()
+        self.log_file.seek(0, os.SEEK_END)
+        return log
+
+    def records(self) -> Iterator[Record]:
+        """Yield the valid records on disk, stopping at the first torn one."""
+        with self.lock:
+            log = self._read_log()
+        for _, record in self._parse(log):
+            yield record
+
+    def recover(self, disk: DiskManager) -> int:
+        """Redo every committed page image onto disk, then empty the log.
+
+        Returns the number of pages written back.
+        """
+        pages: Dict[PageID, bytes] = {}
+        group: List[Tuple[PageID, bytes]] = []
+        for lsn, type_, page_id, data in self.records():
+            if type_ == PAGE_RECORD:
+                group.append((page_id, data))
+            elif type_ == COMMIT_RECORD:
+                pages.update(group)
+                group = []
+        for page_id, data in pages.items():
+            disk.write_page_data(page_id, data)
+        disk.sync()
+        self.truncate()
+        return len(pages)
+
+    def truncate(self) -> None:
+        """Drop the whole log; only safe once every page is on disk."""
+        with self.lock:
+            self.tail.clear()
+            self.flushed_lsn = self.next_lsn - 1
+            self.log_file.seek(0)
+            self.log_file.truncate()
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+
+    def discard(self, lsn: LSN) -> None:
+        """Drop the records up to lsn from the head of the log.
+
+        lsn must close a committed group and every page logged up to it
+        must be on disk.  The rest of the log is copied to a new file that
+        then replaces the old one, so a crash leaves one or the other.
+        """
+        with self.lock:
+            while self.flushing:
+                self.flushed.wait()
+            log = self._read_log()
+            begin = 0
+            for end, (record_lsn, _, _, _) in self._parse(log):
+                if record_lsn > lsn:
+                    break
+                begin = end
+            if begin == 0:
+                return
+            temp_path = self.log_file_path.with_name(
+                self.log_file_path.name + '.tmp'
+            )
+            with temp_path.open(mode='wb') as temp_file:
+                temp_file.write(log[begin:])
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, self.log_file_path)
+            self.log_file.close()
+            self.log_file = self.log_file_path.open(mode='br+')
+            self.log_file.seek(0, os.SEEK_END)
+
+    def close(self) -> None:
+        self.log_file.close()
@@ -0,0 +1,50 @@
+from src.disk import DiskManager
+from src.btree.bloom import BloomFilter
+
+
+class TestBloomFilter:
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter.for_capacity(10000, 0.01)
+        present = sum(bloom.add(i.to_bytes(8, 'big')) for i in range(10000))
+        assert present < 10000 * 0.01
+        assert bloom.add((5).to_bytes(8, 'big'))
+
+        assert all(i.to_bytes(8, 'big') in bloom for i in range(10000))
+        false_positives = sum(i.to_bytes(8, 'big') in bloom
+                              for i in range(10000, 30000))
+        assert false_positives < 20000 * 0.02
+
+        # keys that seemed present are not counted
+        assert bloom.count == 10000 - present
+        while not bloom.is_full():
+            bloom.add(bloom.count.to_bytes(8, 'little'))
+        grown = bloom.grown()
+        assert grown.count == 0
+        assert (grown.bit_count, grown.hash_count, grown.capacity) == (
+            2 * bloom.bit_count, bloom.hash_count, 2 * bloom.capacity
+        )
+
+    def test_save_and_read(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        bloom = BloomFilter.for_capacity(20000, 0.001)
+        for i in range(0, 20000, 3):
+            bloom.add(i.to_bytes(8, 'big'))
+        page_ids = [disk.allocate_page() for _ in range(bloom.page_count())]
+        assert len(page_ids) > 1
+        bloom.save(disk, page_ids)
+
+        read, read_page_ids, clean = BloomFilter.read(disk, page_ids[0])
+        assert (read.bit_count, read.hash_count, read.capacity, read.count,
+                read.bits) == (bloom.bit_count, bloom.hash_count,
+                               bloom.capacity, bloom.count, bloom.bits)
+        assert read_page_ids == page_ids and clean
+
+        BloomFilter.mark_unclean(disk, page_ids[0])
+        read, _, clean = BloomFilter.read(disk, page_ids[0])
+        assert not clean and read.count == 0 and not any(read.bits)
+
+        page = disk.read_page_data(page_ids[-1])
+        page[4] ^= 1
+        disk.write_page_data(page_ids[-1], page)
+        assert BloomFilter.read(disk, page_ids[0]) is None
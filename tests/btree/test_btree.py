@@ -1,3 +1,5 @@
+import random
+import threading
 import pytest
 from src.disk import DiskManager
 from src.buffer import BufferPool, BufferPoolManager
@@ -13,6 +15,25 @@ def empty_buffer_pool_manager(tmp_path):
     return bufmgr
 
 
+@pytest.fixture
+def count_fetches(monkeypatch):
+    """Return a function that starts counting a manager's page fetches.
+
+    It returns the list the fetched page ids are appended to.
+    """
+    def count(bufmgr):
+        fetched = []
+        fetch_page = bufmgr.fetch_page
+
+        def counting_fetch_page(page_id, exclusive=None):
+            fetched.append(page_id)
+            return fetch_page(page_id, exclusive)
+
+        monkeypatch.setattr(bufmgr, 'fetch_page', counting_fetch_page)
+        return fetched
+    return count
+
+
 class TestBTree:
 
     def test_add_ascending(self, empty_buffer_pool_manager):
@@ -42,3 +63,477 @@ class TestBTree:
 
         for i in range(record_count):
             assert (bytearray(i.to_bytes(key_size, 'big')) in bt)
+
+    def test_get(self, empty_buffer_pool_manager):
+        key_size = 8
+        value_size = 16
+        bt = BTree(empty_buffer_pool_manager, key_size, value_size)
+
+        for i in range(0, 2000, 2):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+
+        for i in range(2000):
+            value = bt.get(i.to_bytes(key_size, 'big'))
+            if i % 2 == 0:
+                assert value == i.to_bytes(value_size, 'big')
+            else:
+                assert value is None
+
+    def test_get_many(self, empty_buffer_pool_manager):
+        key_size = 8
+        value_size = 16
+        bt = BTree(empty_buffer_pool_manager, key_size, value_size)
+
+        for i in range(0, 2000, 2):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+
+        probes = [1999, 4, 3, 4, 1000, 0, 2001]
+        keys = [i.to_bytes(key_size, 'big') for i in probes]
+        assert bt.get_many(keys) == [
+            i.to_bytes(value_size, 'big') if i % 2 == 0 and i < 2000 else None
+            for i in probes
+        ]
+        assert bt.get_many([]) == []
+
+    def test_get_many_fetches_each_page_once(self, empty_buffer_pool_manager,
+                                             count_fetches):
+        key_size = 8
+        value_size = 16
+        bufmgr = empty_buffer_pool_manager
+        bt = BTree(bufmgr, key_size, value_size)
+
+        for i in range(2000):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+
+        fetched = count_fetches(bufmgr)
+        keys = [i.to_bytes(key_size, 'big') for i in range(100, 110)]
+        bt.get_many(keys)
+        assert len(fetched) == len(set(fetched))
+
+    def test_scan(self, empty_buffer_pool_manager):
+        key_size = 8
+        value_size = 100
+        bt = BTree(empty_buffer_pool_manager, key_size, value_size)
+
+        for i in reversed(range(0, 1000, 2)):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+
+        def to_key(i):
+            return i.to_bytes(key_size, 'big')
+
+        def keys(rows):
+            return [int.from_bytes(key, 'big') for key, _ in rows]
+
+        assert keys(bt.scan()) == list(range(0, 1000, 2))
+        assert keys(bt.scan(to_key(101), to_key(501))) == (
+            list(range(102, 501, 2))
+        )
+        assert keys(bt.scan(to_key(100), to_key(500))) == (
+            list(range(100, 500, 2))
+        )
+        assert keys(bt.scan(start=to_key(990))) == [990, 992, 994, 996, 998]
+        assert keys(bt.scan(end=to_key(5))) == [0, 2, 4]
+        assert keys(bt.scan(to_key(500), to_key(100))) == []
+        assert all(
+            value == key.rjust(value_size, b'\0')
+            for key, value in bt.scan()
+        )
+
+    def test_scan_many(self, empty_buffer_pool_manager, count_fetches):
+        key_size = 8
+        value_size = 100
+        bufmgr = empty_buffer_pool_manager
+        bt = BTree(bufmgr, key_size, value_size)
+        for i in range(0, 2000, 2):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+
+        def to_key(i):
+            return i.to_bytes(key_size, 'big')
+
+        ranges = [(to_key(1500), None), (to_key(101), to_key(501)),
+                  (to_key(7), to_key(8)), (to_key(9), to_key(10)),
+                  (to_key(101), to_key(501)), (to_key(0), to_key(1))]
+        fetched = count_fetches(bufmgr)
+        rows = bt.scan_many(ranges)
+        # overlapping ranges still fetch each page once
+        assert len(fetched) == len(set(fetched))
+        assert rows == [list(bt.scan(start, end)) for start, end in ranges]
+        assert bt.scan_many([]) == []
+
+    def test_scan_reverse(self, empty_buffer_pool_manager):
+        key_size = 8
+        value_size = 100
+        bt = BTree(empty_buffer_pool_manager, key_size, value_size)
+
+        for i in range(0, 1000, 2):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+
+        def to_key(i):
+            return i.to_bytes(key_size, 'big')
+
+        def keys(rows):
+            return [int.from_bytes(key, 'big') for key, _ in rows]
+
+        assert keys(bt.scan(reverse=True)) == list(range(998, -1, -2))
+        assert keys(bt.scan(to_key(101), to_key(501), reverse=True)) == (
+            list(range(500, 101, -2))
+        )
+        assert keys(bt.scan(to_key(100), to_key(500), reverse=True)) == (
+            list(range(498, 99, -2))
+        )
+
+    def test_scan_follows_leaf_chain(self, empty_buffer_pool_manager,
+                                     count_fetches):
+        key_size = 8
+        value_size = 100
+        bufmgr = empty_buffer_pool_manager
+        bt = BTree(bufmgr, key_size, value_size)
+
+        for i in range(1000):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+
+        fetched = count_fetches(bufmgr)
+        assert len(list(bt.scan(prefetch=True))) == 1000
+        assert len(set(fetched)) < 1000 // 10
+
+    def test_bulk_load(self, empty_buffer_pool_manager):
+        key_size = 8
+        value_size = 100
+        record_count = 5000
+        bt = BTree(empty_buffer_pool_manager, key_size, value_size)
+
+        rows = (
+            (i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+            for i in range(0, 2 * record_count, 2)
+        )
+        assert bt.bulk_load(rows) == record_count
+
+        assert list(bt.scan()) == [
+            (i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+            for i in range(0, 2 * record_count, 2)
+        ]
+        assert [key for key, _ in bt.scan(reverse=True)] == [
+            i.to_bytes(key_size, 'big')
+            for i in reversed(range(0, 2 * record_count, 2))
+        ]
+        for i in range(2 * record_count):
+            assert (i.to_bytes(key_size, 'big') in bt) == (i % 2 == 0)
+
+        for i in range(1, 2 * record_count, 2):
+            key = i.to_bytes(key_size, 'big')
+            assert bt.add(key, i.to_bytes(value_size, 'big'))
+        for i in range(2 * record_count):
+            assert i.to_bytes(key_size, 'big') in bt
+
+    def test_bulk_load_packs_pages(self, tmp_path):
+        key_size = 8
+        value_size = 100
+        record_count = 5000
+
+        def load(name, bulk, reverse=False):
+            disk = DiskManager(tmp_path / name)
+            bufmgr = BufferPoolManager(disk, BufferPool(10))
+            bt = BTree(bufmgr, key_size, value_size)
+            rows = [
+                (i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+                for i in range(record_count)
+            ]
+            if bulk:
+                bt.bulk_load(rows)
+            else:
+                for key, value in (reversed(rows) if reverse else rows):
+                    bt.add(key, value)
+            bufmgr.flush()
+            return disk.next_page_id
+
+        assert load('bulk', True) * 3 // 2 < load('add', False, True)
+
+    def test_ascending_adds_pack_pages(self, empty_buffer_pool_manager,
+                                       count_fetches):
+        key_size = 8
+        value_size = 100
+        bufmgr = empty_buffer_pool_manager
+        bt = BTree(bufmgr, key_size, value_size)
+        for i in range(2500):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+        assert bt.stats.leaf_splits * 0.8 < 2500 / (4096 // 116)
+        assert [key for key, _ in bt.scan()] == [
+            i.to_bytes(key_size, 'big') for i in range(2500)
+        ]
+
+        # once the rightmost leaf is known, an append fetches only it
+        fetched = count_fetches(bufmgr)
+        bt.add((2500).to_bytes(key_size, 'big'), bytes(value_size))
+        fetched.clear()
+        bt.add((2501).to_bytes(key_size, 'big'), bytes(value_size))
+        assert len(fetched) == 1
+        assert not bt.add((5).to_bytes(key_size, 'big'), bytes(value_size))
+        assert len(fetched) > bt.height()
+
+    def test_bulk_load_small_and_empty(self, empty_buffer_pool_manager):
+        bt = BTree(empty_buffer_pool_manager, 4, 4)
+        assert bt.bulk_load([]) == 0
+        assert list(bt.scan()) == []
+        assert bt.bulk_load([(b'aaaa', b'0000'), (b'bbbb', b'1111')]) == 2
+        assert list(bt.scan()) == [(b'aaaa', b'0000'), (b'bbbb', b'1111')]
+
+    def test_bulk_load_rejects_bad_input(self, empty_buffer_pool_manager):
+        bt = BTree(empty_buffer_pool_manager, 4, 4)
+        with pytest.raises(ValueError):
+            bt.bulk_load([(b'bbbb', b'0000'), (b'aaaa', b'1111')])
+        with pytest.raises(ValueError):
+            bt.bulk_load([], fill_factor=0)
+
+        bt = BTree(empty_buffer_pool_manager, 4, 4)
+        bt.add(b'aaaa', b'0000')
+        with pytest.raises(ValueError):
+            bt.bulk_load([(b'bbbb', b'1111')])
+
+    def test_remove(self, empty_buffer_pool_manager):
+        key_size = 500
+        value_size = 100
+        record_count = 1000
+        bt = BTree(empty_buffer_pool_manager, key_size, value_size)
+
+        for i in range(record_count):
+            key = bytearray(i.to_bytes(key_size, 'big'))
+            value = bytearray(i.to_bytes(value_size, 'big'))
+            bt.add(key, value)
+
+        for i in range(0, record_count, 3):
+            assert bt.remove(i.to_bytes(key_size, 'big'))
+        assert not bt.remove((0).to_bytes(key_size, 'big'))
+
+        for i in range(record_count):
+            assert (i.to_bytes(key_size, 'big') in bt) == (i % 3 != 0)
+        assert [int.from_bytes(key, 'big') for key, _ in bt.scan()] == (
+            [i for i in range(record_count) if i % 3 != 0]
+        )
+        assert [int.from_bytes(key, 'big') for key, _ in bt.scan(
+            reverse=True)] == (
+            [i for i in reversed(range(record_count)) if i % 3 != 0]
+        )
+
+    def test_remove_random(self, empty_buffer_pool_manager):
+        key_size = 8
+        value_size = 1000
+        bt = BTree(empty_buffer_pool_manager, key_size, value_size)
+        rng = random.Random(0)
+        live = set()
+
+        for _ in range(5000):
+            i = rng.randrange(1000)
+            key = i.to_bytes(key_size, 'big')
+            if rng.random() < 0.5:
+                assert bt.add(key, i.to_bytes(value_size, 'big')) == (
+                    i not in live
+                )
+                live.add(i)
+            else:
+                assert bt.remove(key) == (i in live)
+                live.discard(i)
+
+        assert [int.from_bytes(key, 'big') for key, _ in bt.scan()] == (
+            sorted(live)
+        )
+
+    def test_remove_reuses_pages(self, empty_buffer_pool_manager):
+        key_size = 500
+        value_size = 100
+        record_count = 500
+        bufmgr = empty_buffer_pool_manager
+        bt = BTree(bufmgr, key_size, value_size)
+
+        def fill():
+            for i in range(record_count):
+                key = i.to_bytes(key_size, 'big')
+                bt.add(key, i.to_bytes(value_size, 'big'))
+
+        fill()
+        page_count = bufmgr.disk.next_page_id
+        for i in range(record_count):
+            assert bt.remove(i.to_bytes(key_size, 'big'))
+        assert list(bt.scan()) == []
+
+        fill()
+        assert bufmgr.disk.next_page_id <= page_count + 1
+
+    def test_trees_share_a_file(self, tmp_path):
+        file_path = tmp_path / "test.txt"
+        key_size = 8
+        value_size = 100
+        bufmgr = BufferPoolManager(DiskManager(file_path), BufferPool(100))
+        users = BTree.create(bufmgr, "users", key_size, value_size)
+        orders = BTree.create(bufmgr, "orders", 16, 8)
+        for i in range(1000):
+            users.add(i.to_bytes(key_size, 'big'),
+                      i.to_bytes(value_size, 'big'))
+            orders.add(i.to_bytes(16, 'big'), i.to_bytes(8, 'big'))
+        root_page_id = users.root_page_id
+        bufmgr.flush()
+        bufmgr.disk.close()
+
+        bufmgr = BufferPoolManager(DiskManager(file_path), BufferPool(100))
+        users = BTree.open(bufmgr, "users")
+        orders = BTree.open(bufmgr, "orders")
+        assert users.root_page_id == root_page_id
+        assert (users.key_size, users.value_size) == (key_size, value_size)
+        assert len(list(users.scan())) == 1000
+        assert orders.get((999).to_bytes(16, 'big')) == (
+            (999).to_bytes(8, 'big')
+        )
+        with pytest.raises(KeyError):
+            BTree.open(bufmgr, "items")
+
+    def test_upsert_and_update(self, empty_buffer_pool_manager,
+                               count_fetches):
+        key_size = 8
+        value_size = 100
+        bufmgr = empty_buffer_pool_manager
+        bt = BTree(bufmgr, key_size, value_size)
+        for i in range(0, 1000, 2):
+            assert bt.insert(i.to_bytes(key_size, 'big'), b'a')
+        assert not bt.insert((10).to_bytes(key_size, 'big'), b'b')
+        assert bt.get((10).to_bytes(key_size, 'big')) == b'a'
+
+        assert not bt.update((11).to_bytes(key_size, 'big'), b'b')
+        assert bt.get((11).to_bytes(key_size, 'big')) is None
+        assert bt.upsert((11).to_bytes(key_size, 'big'), b'b')
+        assert not bt.upsert((11).to_bytes(key_size, 'big'), b'c')
+        assert bt.get((11).to_bytes(key_size, 'big')) == b'c'
+
+        # values of the same length are written over in place
+        splits = bt.stats.leaf_splits
+        fetched = count_fetches(bufmgr)
+        for i in range(0, 1000, 2):
+            assert bt.update(i.to_bytes(key_size, 'big'), b'b')
+        # one descent each, the leaf being fetched again to latch it
+        assert len(fetched) == 500 * (bt.height() + 1)
+        assert bt.stats.leaf_splits == splits
+
+        # longer values split leaves without losing rows
+        for i in range(0, 1000, 2):
+            assert bt.update(i.to_bytes(key_size, 'big'),
+                             i.to_bytes(value_size, 'big'))
+        assert bt.stats.leaf_splits > splits
+        assert list(bt.scan()) == sorted(
+            [(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+             for i in range(0, 1000, 2)]
+            + [((11).to_bytes(key_size, 'big'), b'c')]
+        )
+        with pytest.raises(ValueError):
+            bt.upsert((0).to_bytes(key_size, 'big'), bytes(value_size + 1))
+
+    def test_bloom_filter(self, tmp_path, count_fetches):
+        file_path = tmp_path / "test.txt"
+        key_size = 8
+        value_size = 16
+        bufmgr = BufferPoolManager(DiskManager(file_path), BufferPool(100))
+        bt = BTree.create(bufmgr, "items", key_size, value_size)
+        for i in range(0, 2000, 2):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+        bt.enable_bloom(false_positive_rate=0.001)
+        for i in range(2000, 3000, 2):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+        assert not bt.add((10).to_bytes(key_size, 'big'), bytes(value_size))
+
+        fetched = count_fetches(bufmgr)
+        for i in range(3000):
+            value = bt.get(i.to_bytes(key_size, 'big'))
+            assert (value is not None) == (i % 2 == 0)
+        assert len(fetched) < 1600 * bt.height()
+        odd = [i.to_bytes(key_size, 'big') for i in range(1, 3000, 2)]
+        assert bt.get_many(odd) == [None] * len(odd)
+
+        bt.save_bloom()
+        bufmgr.flush()
+        bt = BTree.open(bufmgr, "items")
+        assert bt.bloom_clean
+        assert bt.get((2998).to_bytes(key_size, 'big')) is not None
+
+        # a change after the save leaves the saved filter unclean, and
+        # opening rebuilds it from the keys
+        bt.add((3001).to_bytes(key_size, 'big'), bytes(value_size))
+        bufmgr.flush()
+        bt = BTree.open(bufmgr, "items")
+        assert not bt.bloom_clean
+        assert bt.get((3001).to_bytes(key_size, 'big')) == bytes(value_size)
+
+    def test_bloom_filter_grows(self, empty_buffer_pool_manager):
+        key_size = 8
+        bt = BTree(empty_buffer_pool_manager, key_size, 8)
+        bt.enable_bloom(false_positive_rate=0.01)
+        capacity = bt.bloom.capacity
+        for i in range(0, 40000, 2):
+            bt.add(i.to_bytes(key_size, 'big'), b'')
+
+        assert bt.bloom.capacity >= 20000 > capacity
+        assert all(i.to_bytes(key_size, 'big') in bt.bloom
+                   for i in range(0, 40000, 2))
+        false_positives = sum(i.to_bytes(key_size, 'big') in bt.bloom
+                              for i in range(1, 40000, 2))
+        assert false_positives < 20000 * 0.02
+
+    def test_variable_length_keys(self, empty_buffer_pool_manager):
+        rng = random.Random(0)
+        bt = BTree(empty_buffer_pool_manager, 200, 50)
+        rows = {}
+        for i in range(3000):
+            key = ('user-%d' % i).encode() * rng.choice([1, 1, 1, 20])
+            value = bytes(rng.randint(0, 50))
+            rows[key] = value
+            bt.add(key, value)
+
+        assert list(bt.scan()) == sorted(rows.items())
+        for key in list(rows)[::2]:
+            assert bt.remove(key)
+            del rows[key]
+        assert list(bt.scan()) == sorted(rows.items())
+        with pytest.raises(ValueError):
+            bt.add(b'k' * 201, b'')
+
+    def test_compressed_keys_raise_fan_out(self, empty_buffer_pool_manager):
+        key_size = 500
+        value_size = 100
+        bufmgr = empty_buffer_pool_manager
+        bt = BTree(bufmgr, key_size, value_size)
+
+        for i in random.Random(0).sample(range(2000), 2000):
+            bt.add(i.to_bytes(key_size, 'big'), i.to_bytes(value_size, 'big'))
+
+        # uncompressed, six 500-byte keys fit in a leaf
+        assert bufmgr.disk.next_page_id < 2000 // 6 // 2
+        assert [int.from_bytes(key, 'big') for key, _ in bt.scan()] == (
+            list(range(2000))
+        )
+
+    def test_concurrent_threads(self, empty_buffer_pool_manager):
+        key_size = 8
+        value_size = 8
+        bt = BTree(empty_buffer_pool_manager, key_size, value_size)
+        thread_count = 4
+        scans = []
+
+        def to_key(i):
+            return i.to_bytes(key_size, 'big')
+
+        def run(t):
+            for i in range(t, 2000, thread_count):
+                assert bt.add(to_key(i), to_key(i))
+                assert bt.get(to_key(i)) == to_key(i)
+            for i in range(t, 2000, 2 * thread_count):
+                assert bt.remove(to_key(i))
+            keys = [key for key, _ in bt.scan()]
+            scans.append(keys == sorted(set(keys)))
+
+        threads = [threading.Thread(target=run, args=(t,))
+                   for t in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert scans == [True] * thread_count
+        assert [key for key, _ in bt.scan()] == [
+            to_key(i) for i in range(2000) if i % (2 * thread_count)
+            >= thread_count
+        ]
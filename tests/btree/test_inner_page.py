@@ -6,7 +6,6 @@ from src.disk import PAGE_SIZE, PageID
 @pytest.fixture
 def empty_inner():
     key_size = 4
-    page = bytearray(PAGE_SIZE)
     return InnerPage.empty_inner(key_size)
 
 
@@ -15,48 +14,96 @@ class TestInnerPageConstant:
     def test_constant(self):
         from src.btree.inner_page import (
             FLAG, LEAF_BIT,
+            LAST_CHILD_BEGIN, LAST_CHILD_END,
             KEY_COUNT_BEGIN, KEY_COUNT_END,
-            CELL_BEGIN,
+            SLOT_BEGIN,
             PAGE_ID_SIZE, RECORD_SIZE
         )
 
         assert FLAG                == 0
         assert LEAF_BIT            == 0b00000001
 
-        assert KEY_COUNT_BEGIN     == 1
-        assert KEY_COUNT_END       == 5
+        assert LAST_CHILD_BEGIN    == 1
+        assert LAST_CHILD_END      == 5
 
-        assert CELL_BEGIN          == 5
+        assert KEY_COUNT_BEGIN     == 5
+        assert KEY_COUNT_END       == 7
+
+        assert SLOT_BEGIN          == 11
 
         assert PAGE_ID_SIZE        == 4
-        assert RECORD_SIZE         == PAGE_SIZE - CELL_BEGIN
+        assert RECORD_SIZE         == PAGE_SIZE - SLOT_BEGIN
 
 
 class TestInnerPageConstructor:
 
     def test_empty_inner_properties(self, empty_inner):
-        assert empty_inner.keys == []
-        assert empty_inner.children == []
+        assert empty_inner.key_count == 0
+        assert empty_inner.child(0).to_int() == 0
 
     def test_full_inner_properties(self, empty_inner):
         inner = empty_inner
-
         key_size = inner.key_size
-        max_key_count = inner.max_key_count
 
-        for i in range(max_key_count):
-            inner.keys.append(bytearray(i.to_bytes(inner.key_size, 'big')))
-        for i in range(max_key_count + 1):
-            inner.children.append(PageID(i))
+        count = 0
+        while not inner.is_full():
+            key = count.to_bytes(key_size, 'big')
+            inner.insert(count, key, PageID(count))
+            count += 1
+        inner.set_child(count, PageID(count))
 
-        page = inner.to_page()
-        full_inner = InnerPage(page, key_size)
+        full_inner = InnerPage(inner.page, key_size)
         assert full_inner.key_size == key_size
-        assert full_inner.max_key_count == max_key_count
-
-        for i in range(max_key_count):
-            assert full_inner.keys[i] == inner.keys[i]
-        for i in range(max_key_count + 1):
-            assert full_inner.children[i].to_int() == (
-                inner.children[i].to_int()
-            )
+        assert full_inner.key_count == count
+        assert full_inner.is_full()
+
+        for i in range(count):
+            assert full_inner.key(i) == i.to_bytes(key_size, 'big')
+        for i in range(count + 1):
+            assert full_inner.child(i).to_int() == i
+
+
+class TestInnerPageSearch:
+
+    def test_search_routes_to_child(self, empty_inner):
+        inner = empty_inner
+        inner.set_child(0, PageID(30))
+        for i, key in enumerate([10, 20]):
+            inner.insert(i, key.to_bytes(4, 'big'), PageID(key))
+
+        assert inner.child(inner.search((5).to_bytes(4, 'big'))).to_int() == 10
+        assert inner.child(inner.search((10).to_bytes(4, 'big'))).to_int() == 10
+        assert inner.child(inner.search((15).to_bytes(4, 'big'))).to_int() == 20
+        assert inner.child(inner.search((25).to_bytes(4, 'big'))).to_int() == 30
+
+    def test_delete_cells_keeps_last_child(self, empty_inner):
+        inner = empty_inner
+        inner.set_child(0, PageID(99))
+        for i in range(4):
+            inner.insert(i, i.to_bytes(4, 'big'), PageID(i))
+
+        inner.delete_cells(0, 2)
+        assert inner.key_count == 2
+        assert [inner.child(i).to_int() for i in range(3)] == [2, 3, 99]
+
+    def test_set_key_keeps_child(self, empty_inner):
+        inner = empty_inner
+        inner.set_child(0, PageID(99))
+        for i in range(3):
+            inner.insert(i, bytes([i]), PageID(i))
+
+        inner.set_key(1, b'\x01\x01\x01')
+        assert [inner.key(i) for i in range(3)] == (
+            [b'\x00', b'\x01\x01\x01', b'\x02']
+        )
+        assert [inner.child(i).to_int() for i in range(4)] == [0, 1, 2, 99]
+
+    def test_truncate_promotes_child(self, empty_inner):
+        inner = empty_inner
+        inner.set_child(0, PageID(99))
+        for i in range(4):
+            inner.insert(i, i.to_bytes(4, 'big'), PageID(i))
+
+        inner.truncate(2)
+        assert inner.key_count == 2
+        assert [inner.child(i).to_int() for i in range(3)] == [0, 1, 2]
@@ -18,7 +18,8 @@ class TestLeafPageConstant:
             PREV_PAGE_ID_BEGIN, PREV_PAGE_ID_END,
             NEXT_PAGE_ID_BEGIN, NEXT_PAGE_ID_END,
             KEY_COUNT_BEGIN, KEY_COUNT_END,
-            CELL_BEGIN,
+            PREFIX_SIZE_BEGIN, PREFIX_SIZE_END,
+            PREFIX_BEGIN,
             RECORD_SIZE
         )
 
@@ -34,11 +35,14 @@ class TestLeafPageConstant:
         assert NEXT_PAGE_ID_END   == 9
 
         assert KEY_COUNT_BEGIN    == 9
-        assert KEY_COUNT_END      == 13
+        assert KEY_COUNT_END      == 11
 
-        assert CELL_BEGIN         == 13
+        assert PREFIX_SIZE_BEGIN  == 15
+        assert PREFIX_SIZE_END    == 17
 
-        assert RECORD_SIZE        == PAGE_SIZE - CELL_BEGIN
+        assert PREFIX_BEGIN       == 17
+
+        assert RECORD_SIZE        == PAGE_SIZE - PREFIX_BEGIN
 
 
 class TestLeafPage:
@@ -46,33 +50,155 @@ class TestLeafPage:
     def test_empty_leaf_properties(self, empty_leaf):
         assert empty_leaf.prev_page_id is None
         assert empty_leaf.next_page_id is None
-
-        assert empty_leaf.keys == []
-        assert empty_leaf.values == []
+        assert empty_leaf.key_count == 0
 
     def test_full_leaf_properties(self, empty_leaf):
         leaf = empty_leaf
 
         key_size = leaf.key_size
         value_size = leaf.value_size
-        max_key_count = leaf.max_key_count
         next_page_id = PageID(1)
         prev_page_id = PageID(2)
 
-        for i in range(max_key_count):
-            leaf.keys.append(bytearray((2 * i).to_bytes(leaf.key_size, 'big')))
-            leaf.values.append(bytearray(i.to_bytes(leaf.value_size, 'big')))
+        count = 0
+        while not leaf.is_full():
+            key = (2 * count).to_bytes(key_size, 'big')
+            value = count.to_bytes(value_size, 'big')
+            leaf.insert(leaf.key_count, key, value)
+            count += 1
         leaf.next_page_id = next_page_id
         leaf.prev_page_id = prev_page_id
-        page = leaf.to_page()
+        page = leaf.page
 
         full_leaf = LeafPage(page, key_size, value_size)
         assert full_leaf.key_size == key_size
         assert full_leaf.value_size == value_size
         assert full_leaf.prev_page_id.to_int() == prev_page_id.to_int()
         assert full_leaf.next_page_id.to_int() == next_page_id.to_int()
-        assert full_leaf.max_key_count == max_key_count
+        assert full_leaf.key_count == count
+        assert full_leaf.is_full()
+
+        for i in range(count):
+            assert full_leaf.key(i) == (2 * i).to_bytes(key_size, 'big')
+            assert full_leaf.value(i) == i.to_bytes(value_size, 'big')
+
+    def test_insert_in_place(self, empty_leaf):
+        leaf = empty_leaf
+        page = leaf.page.obj
+
+        for i in [4, 0, 2, 3, 1]:
+            key = i.to_bytes(leaf.key_size, 'big')
+            value = (10 * i).to_bytes(leaf.value_size, 'big')
+            leaf.insert(leaf.search(key), key, value)
+
+        same_leaf = LeafPage(page, leaf.key_size, leaf.value_size)
+        assert same_leaf.key_count == 5
+        for i in range(5):
+            assert same_leaf.key(i) == i.to_bytes(leaf.key_size, 'big')
+            assert same_leaf.value(i) == (
+                (10 * i).to_bytes(leaf.value_size, 'big')
+            )
+        assert leaf.search((3).to_bytes(leaf.key_size, 'big')) == 3
+        assert leaf.search((9).to_bytes(leaf.key_size, 'big')) == 5
+
+    def test_move_cells(self, empty_leaf):
+        leaf = empty_leaf
+        for i in range(6):
+            leaf.insert(i, i.to_bytes(4, 'big'), i.to_bytes(4, 'big'))
 
-        for i in range(max_key_count):
-            assert full_leaf.keys[i] == leaf.keys[i]
-            assert full_leaf.values[i] == leaf.values[i]
+        cells = leaf.cells(0, 3)
+        leaf.delete_cells(0, 3)
+        other = LeafPage.empty_leaf(leaf.key_size, leaf.value_size)
+        other.insert_cells(0, cells)
+
+        assert [leaf.key(i) for i in range(leaf.key_count)] == (
+            [i.to_bytes(4, 'big') for i in range(3, 6)]
+        )
+        assert [other.value(i) for i in range(other.key_count)] == (
+            [i.to_bytes(4, 'big') for i in range(3)]
+        )
+
+    def test_clear_sibling_links(self, empty_leaf):
+        leaf = empty_leaf
+        leaf.next_page_id = PageID(3)
+        leaf.next_page_id = None
+        assert leaf.next_page_id is None
+        assert leaf.page[0] == 0b00000001
+
+    def test_variable_length_cells(self):
+        leaf = LeafPage.empty_leaf(64, 64)
+        rows = [(b'a' * i, b'v' * (64 - i)) for i in range(1, 40)]
+        for key, value in rows:
+            leaf.insert(leaf.search(key), key, value)
+
+        assert [(leaf.key(i), leaf.value(i))
+                for i in range(leaf.key_count)] == rows
+        with pytest.raises(ValueError):
+            leaf.insert(0, b'k' * 65, b'')
+
+    def test_compact_reuses_deleted_space(self):
+        leaf = LeafPage.empty_leaf(16, 100)
+        count = 0
+        while not leaf.is_full():
+            leaf.insert(count, count.to_bytes(16, 'big'), bytes(100))
+            count += 1
+        free_space = leaf.free_space()
+        leaf.delete_cells(0, count // 2)
+        assert leaf.free_space() > free_space
+
+        for i in range(count // 2):
+            leaf.insert(i, i.to_bytes(16, 'big'), bytes(100))
+        assert [leaf.key(i) for i in range(count)] == (
+            [i.to_bytes(16, 'big') for i in range(count)]
+        )
+        assert leaf.free_space() == free_space
+
+    def test_replace_value(self):
+        leaf = LeafPage.empty_leaf(16, 100)
+        for i in range(3):
+            leaf.insert(i, i.to_bytes(16, 'big'), b'v' * 10)
+        free_space = leaf.free_space()
+
+        assert leaf.replace_value(1, b'w' * 10)
+        assert leaf.free_space() == free_space
+        assert leaf.replace_value(2, b'x' * 50)
+        assert leaf.replace_value(0, b'')
+        assert leaf.rows(0, 3) == [
+            ((0).to_bytes(16, 'big'), b''),
+            ((1).to_bytes(16, 'big'), b'w' * 10),
+            ((2).to_bytes(16, 'big'), b'x' * 50),
+        ]
+        with pytest.raises(ValueError):
+            leaf.replace_value(0, bytes(101))
+
+        count = 3
+        while not leaf.is_full():
+            leaf.insert(count, count.to_bytes(16, 'big'), b'')
+            count += 1
+        while leaf.is_full():
+            leaf.delete_cells(count - 1, count)
+            count -= 1
+        assert not leaf.replace_value(0, bytes(100))
+        assert leaf.value(0) == b''
+
+    def test_reject_oversized_cells(self):
+        with pytest.raises(ValueError):
+            LeafPage.empty_leaf(1000, 100)
+
+    def test_prefix(self):
+        leaf = LeafPage.empty_leaf(8, 4)
+        keys = [b'user-1%d' % i for i in range(10)]
+        for key in keys:
+            leaf.insert(leaf.key_count, key, b'v')
+        free_space = leaf.free_space()
+        leaf.set_prefix(b'user-1')
+
+        assert leaf.prefix == b'user-1'
+        assert leaf.free_space() == free_space + 9 * len(b'user-1')
+        assert [key for key, _ in leaf.rows(0, 10)] == keys
+        assert leaf.search(b'user-15') == 5
+        assert leaf.search(b'user-0') == 0
+        assert leaf.search(b'user-2') == 10
+        assert LeafPage(leaf.page.obj, 8, 4).key(3) == b'user-13'
+        with pytest.raises(ValueError):
+            leaf.insert(0, b'user-0', b'v')
@@ -0,0 +1,24 @@
+from src.btree.prefix import common_prefix, shortest_separator, fence_prefix
+
+
+class TestPrefix:
+
+    def test_common_prefix(self):
+        assert common_prefix(b'user-12', b'user-19') == b'user-1'
+        assert common_prefix(b'user', b'user-1') == b'user'
+        assert common_prefix(b'abc', b'xyz') == b''
+
+    def test_shortest_separator(self):
+        assert shortest_separator(b'apple', b'banana') == b'b'
+        assert shortest_separator(b'user-15', b'user-2') == b'user-15'
+        assert shortest_separator(b'user', b'user-15') == b'user-'
+        left = (0x01ff).to_bytes(8, 'big')
+        right = (0x0200).to_bytes(8, 'big')
+        separator = shortest_separator(left, right)
+        assert left <= separator < right
+        assert len(separator) == 7
+
+    def test_fence_prefix(self):
+        assert fence_prefix(b'user-10', b'user-19') == b'user-1'
+        assert fence_prefix(None, b'user-19') == b''
+        assert fence_prefix(b'user-10', None) == b''
@@ -0,0 +1,45 @@
+import random
+import pytest
+from bench.workload import Workload, ZipfianGenerator
+from bench.runner import BenchmarkConfig, compare, run
+
+
+class TestBench:
+
+    def test_zipfian_is_skewed(self):
+        zipf = ZipfianGenerator(1000, random.Random(0))
+        ranks = [zipf.next() for _ in range(10000)]
+
+        assert all(0 <= rank < 1000 for rank in ranks)
+        assert ranks.count(0) > ranks.count(10) > ranks.count(500)
+
+    @pytest.mark.parametrize('distribution',
+                             ['sequential', 'random', 'zipfian'])
+    def test_keys_are_distinct(self, distribution):
+        workload = Workload(distribution, 5000)
+        keys = set(workload.insert_keys())
+
+        assert len(keys) == 5000
+        assert set(workload.lookup_keys(1000)) <= keys
+
+    def test_run(self, tmp_path):
+        config = BenchmarkConfig('random', 2000, pool_size=16, partitions=2)
+        result = run(config, tmp_path)
+
+        insert = result['phases']['insert']
+        lookup = result['phases']['lookup']
+        assert insert['ops'] == lookup['ops'] == 2000
+        assert insert['bytes_written_per_op'] > 0
+        assert 0 < lookup['hit_rate'] < 1
+        assert lookup['latency_us']['p50'] <= lookup['latency_us']['p99']
+        assert list(tmp_path.iterdir()) == []
+
+        slower = {
+            'name': result['name'],
+            'phases': {
+                'insert': dict(insert, ops_per_sec=insert['ops_per_sec'] / 2),
+                'lookup': lookup,
+            },
+        }
+        assert compare([result], [result]) == []
+        assert len(compare([result], [slower])) == 1
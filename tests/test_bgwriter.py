@@ -0,0 +1,83 @@
+from src.disk import DiskManager
+from src.wal import WriteAheadLog, COMMIT_RECORD
+from src.buffer import BufferPool, BufferPoolManager
+from src.bgwriter import BackgroundWriter
+from src.btree.btree import BTree
+
+
+def open_bufmgr(tmp_path, pool_size=100, wal=True):
+    log = WriteAheadLog(tmp_path / "test.wal") if wal else None
+    disk = DiskManager(tmp_path / "test", log)
+    return BufferPoolManager(disk, BufferPool(pool_size))
+
+
+def to_key(i):
+    return i.to_bytes(8, 'big')
+
+
+class TestBackgroundWriter:
+
+    def test_write_back_keeps_evictions_clean(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path, pool_size=3, wal=False)
+        page_ids = []
+        for i in range(3):
+            with bufmgr.new_page() as buffer_:
+                buffer_.page[0] = i
+                page_ids.append(buffer_.page_id)
+
+        assert bufmgr.write_back(limit=2) == 2
+        assert bufmgr.write_back() == 1
+        assert bufmgr.write_back() == 0
+        with bufmgr.new_page():
+            pass
+        assert bufmgr.stats.dirty_writes == 0
+        assert bufmgr.stats.background_writes == 3
+        for i, page_id in enumerate(page_ids):
+            assert bufmgr.disk.read_page_data(page_id)[0] == i
+
+    def test_fuzzy_checkpoint(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree(bufmgr, 8, 8)
+        for i in range(1000):
+            bt.add(to_key(i), to_key(i))
+        bufmgr.commit()
+        for i in range(0, 1000, 2):
+            bt.remove(to_key(i))
+        bufmgr.commit()
+        # the leaf holding key 0 is committed but changed again
+        bt.add(to_key(0), to_key(0))
+        assert not bufmgr.fuzzy_checkpoint()
+        bufmgr.commit()
+        assert bufmgr.fuzzy_checkpoint()
+        records = list(bufmgr.disk.wal.records())
+        assert [type_ for _, type_, _, _ in records][-1:] == [COMMIT_RECORD]
+        assert len(records) < bufmgr.disk.next_page_id
+
+        root_page_id = bt.root_page_id
+        bufmgr.disk.close()
+        bufmgr.disk.wal.close()
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree(bufmgr, 8, 8, root_page_id)
+        assert [key for key, _ in bt.scan()] == (
+            [to_key(0)] + [to_key(i) for i in range(1, 1000, 2)]
+        )
+
+    def test_concurrent_writer(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path, pool_size=20)
+        writer = BackgroundWriter(bufmgr, interval=0.001,
+                                  checkpoint_interval=0.01)
+        bt = BTree(bufmgr, 8, 8)
+        for i in range(3000):
+            bt.add(to_key(i), to_key(i))
+            if i % 50 == 49:
+                bufmgr.commit()
+        writer.close()
+        assert bufmgr.stats.background_writes > 0
+
+        root_page_id = bt.root_page_id
+        bufmgr.disk.close()
+        bufmgr.disk.wal.close()
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree(bufmgr, 8, 8, root_page_id)
+        assert [key for key, _ in bt.scan()] == [to_key(i)
+                                                 for i in range(3000)]
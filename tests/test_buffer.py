@@ -1,6 +1,11 @@
 import pytest
 from src.disk import PageID, PAGE_SIZE, DiskManager
-from src.buffer import Buffer, Frame, BufferPool, BufferPoolManager
+from src.wal import WriteAheadLog
+from src.buffer import (
+    Buffer, Frame, BufferPool, BufferPoolManager,
+    PartitionedBufferPoolManager, NoFreeBufferError
+)
+from src.btree.btree import BTree
 
 
 @pytest.fixture
@@ -28,6 +33,7 @@ class TestFrame:
     def test_create_frame(self):
         frame = Frame(self.usage_count, self.buffer_)
         assert frame.usage_count == self.usage_count
+        assert frame.pin_count == 0
         assert frame.buffer == self.buffer_
 
 
@@ -49,39 +55,69 @@ class TestBufferPoolManager:
     def test_io(self, empty_buffer_pool_manager):
         bufmgr = empty_buffer_pool_manager
 
-        buffer_ = bufmgr.create_page()
-        buffer_.page = self.hello
-        buffer_.is_dirty = True
-        hello_id = buffer_.page_id
+        with bufmgr.new_page() as buffer_:
+            buffer_.page = self.hello
+            buffer_.is_dirty = True
+            hello_id = buffer_.page_id
 
-        buffer_ = bufmgr.fetch_page(hello_id)
-        page = buffer_.page
-        assert(self.hello == page)
+        with bufmgr.page(hello_id) as buffer_:
+            assert(self.hello == buffer_.page)
 
-        buffer_ = bufmgr.create_page()
-        buffer_.page = self.world
-        buffer_.is_dirty = True
-        world_id = buffer_.page_id
+        with bufmgr.new_page() as buffer_:
+            buffer_.page = self.world
+            buffer_.is_dirty = True
+            world_id = buffer_.page_id
 
-        buffer_ = bufmgr.fetch_page(world_id)
-        page = buffer_.page
-        assert(self.world == page)
+        with bufmgr.page(world_id) as buffer_:
+            assert(self.world == buffer_.page)
 
-        buffer_ = bufmgr.fetch_page(hello_id)
-        page = buffer_.page
-        assert(self.hello == page)
+        with bufmgr.page(hello_id) as buffer_:
+            assert(self.hello == buffer_.page)
 
-        buffer_ = bufmgr.fetch_page(world_id)
-        page = buffer_.page
-        assert(self.world == page)
+        with bufmgr.page(world_id) as buffer_:
+            assert(self.world == buffer_.page)
+
+    def test_pinned_page_is_not_evicted(self, tmp_path):
+        disk = DiskManager(tmp_path / "test.txt")
+        bufmgr = BufferPoolManager(disk, BufferPool(2))
+
+        hello = bufmgr.create_page()
+        hello.page = self.hello
+        bufmgr.unpin_page(hello.page_id)
+        pinned = bufmgr.create_page()
+        pinned.page = self.world
+
+        for _ in range(3):
+            with bufmgr.new_page():
+                pass
+        assert bufmgr.page_table[pinned.page_id] is not None
+        assert pinned.page == self.world
+        assert hello.page_id not in bufmgr.page_table
+
+    def test_every_buffer_pinned(self, empty_buffer_pool_manager):
+        bufmgr = empty_buffer_pool_manager
+
+        with bufmgr.new_page():
+            with pytest.raises(NoFreeBufferError):
+                bufmgr.create_page()
+        with bufmgr.new_page():
+            pass
+
+    def test_unpin_unpinned_page(self, empty_buffer_pool_manager):
+        bufmgr = empty_buffer_pool_manager
+
+        with bufmgr.new_page() as buffer_:
+            page_id = buffer_.page_id
+        with pytest.raises(ValueError):
+            bufmgr.unpin_page(page_id)
 
     def test_flush_memory_data_to_disk(self, empty_buffer_pool_manager):
         bufmgr = empty_buffer_pool_manager
 
-        buffer_ = bufmgr.create_page()
-        buffer_.page = self.hello
-        buffer_.is_dirty = True
-        hello_id = buffer_.page_id
+        with bufmgr.new_page() as buffer_:
+            buffer_.page = self.hello
+            buffer_.is_dirty = True
+            hello_id = buffer_.page_id
 
         bufmgr.flush()
 
@@ -89,6 +125,145 @@ class TestBufferPoolManager:
         new_pool = BufferPool(1)
         new_bufmgr = BufferPoolManager(disk, new_pool)
 
-        buffer_ = new_bufmgr.fetch_page(hello_id)
-        page = buffer_.page
-        assert(self.hello == page)
+        with new_bufmgr.page(hello_id) as buffer_:
+            assert(self.hello == buffer_.page)
+
+    def test_free_page(self, empty_buffer_pool_manager):
+        bufmgr = empty_buffer_pool_manager
+
+        with bufmgr.new_page() as buffer_:
+            buffer_.page = self.hello
+            buffer_.is_dirty = True
+            hello_id = buffer_.page_id
+
+        bufmgr.free_page(hello_id)
+        assert hello_id not in bufmgr.page_table
+
+        with bufmgr.new_page() as buffer_:
+            assert buffer_.page_id == hello_id
+            assert buffer_.page == bytearray(PAGE_SIZE)
+
+    def test_free_pinned_page(self, empty_buffer_pool_manager):
+        bufmgr = empty_buffer_pool_manager
+
+        with bufmgr.new_page() as buffer_:
+            with pytest.raises(ValueError):
+                bufmgr.free_page(buffer_.page_id)
+
+    def test_stats(self, empty_buffer_pool_manager):
+        bufmgr = empty_buffer_pool_manager
+
+        with bufmgr.new_page() as buffer_:
+            buffer_.page = self.hello
+            hello_id = buffer_.page_id
+        with bufmgr.page(hello_id):
+            pass
+        with bufmgr.new_page() as buffer_:
+            buffer_.page = self.world
+            world_id = buffer_.page_id
+        with bufmgr.page(hello_id):
+            pass
+
+        stats = bufmgr.stats
+        assert stats.hits == 1
+        assert stats.misses == 1
+        assert stats.evictions == 2
+        assert stats.dirty_writes == 2
+        assert stats.hit_rate() == 0.5
+
+        # the world page was evicted for the hello page, so it misses
+        with bufmgr.page(world_id) as buffer_:
+            assert buffer_.page == self.world
+        assert stats.misses == 2
+        assert stats.hits == 1
+
+    def test_resize(self, tmp_path):
+        bufmgr = BufferPoolManager(DiskManager(tmp_path / "test"),
+                                   BufferPool(2))
+        page_ids = []
+        for i in range(2):
+            with bufmgr.new_page() as buffer_:
+                buffer_.page[0] = i
+                page_ids.append(buffer_.page_id)
+
+        bufmgr.resize(4)
+        with bufmgr.new_page(), bufmgr.new_page():
+            assert bufmgr.stats.evictions == 0
+        bufmgr.resize(1)
+        assert len(bufmgr.page_table) == 1
+        for i, page_id in enumerate(page_ids):
+            with bufmgr.page(page_id) as buffer_:
+                assert buffer_.page[0] == i
+        with bufmgr.page(page_ids[0]):
+            with pytest.raises(ValueError):
+                bufmgr.resize(0)
+
+
+class TestPartitionedBufferPoolManager:
+
+    def test_pages_stay_in_their_partition(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        bufmgr = PartitionedBufferPoolManager(
+            disk, [BufferPool(2) for _ in range(3)]
+        )
+        page_ids = []
+        for i in range(6):
+            with bufmgr.new_page() as buffer_:
+                buffer_.page[0] = i
+                buffer_.is_dirty = True
+                page_ids.append(buffer_.page_id)
+        for partition in bufmgr.partitions:
+            assert len(partition.page_table) == 2
+        for i, page_id in enumerate(page_ids):
+            with bufmgr.page(page_id) as buffer_:
+                assert buffer_.page[0] == i
+        assert bufmgr.stats.hits == 6
+
+    def test_btree_commit_and_recover(self, tmp_path):
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        disk = DiskManager(tmp_path / "test", wal)
+        bufmgr = PartitionedBufferPoolManager(
+            disk, [BufferPool(20) for _ in range(4)]
+        )
+        bt = BTree(bufmgr, 8, 8)
+        for i in range(2000):
+            bt.add(i.to_bytes(8, 'big'), i.to_bytes(8, 'big'))
+        bufmgr.commit()
+        for i in range(0, 2000, 2):
+            bt.remove(i.to_bytes(8, 'big'))
+        assert bufmgr.fuzzy_checkpoint() is False
+        bufmgr.commit()
+        assert bufmgr.fuzzy_checkpoint()
+        for i in range(0, 100, 2):
+            bt.add(i.to_bytes(8, 'big'), i.to_bytes(8, 'big'))
+        disk.close()
+        wal.close()
+
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        disk = DiskManager(tmp_path / "test", wal)
+        bt = BTree(BufferPoolManager(disk, BufferPool(50)), 8, 8,
+                   bt.root_page_id)
+        assert [key for key, _ in bt.scan()] == [
+            i.to_bytes(8, 'big') for i in range(1, 2000, 2)
+        ]
+
+    def test_rebalance(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        bufmgr = PartitionedBufferPoolManager(
+            disk, [BufferPool(8) for _ in range(2)]
+        )
+        page_ids = []
+        for _ in range(40):
+            with bufmgr.new_page() as buffer_:
+                buffer_.is_dirty = True
+                page_ids.append(buffer_.page_id)
+        bufmgr.rebalance()
+        for _ in range(3):
+            for page_id in page_ids:
+                if page_id.to_int() % 2 == 0:
+                    with bufmgr.page(page_id):
+                        pass
+
+        sizes = bufmgr.rebalance()
+        assert sum(sizes) == 16
+        assert len(bufmgr.partitions[0].pool) == sizes[0] > 8
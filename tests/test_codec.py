@@ -0,0 +1,51 @@
+import itertools
+import pytest
+from src.codec import INT, FLOAT, TEXT, BYTES, encode, decode, prefix_end, \
+    max_size
+
+
+class TestCodec:
+
+    @pytest.mark.parametrize('type_, values', [
+        (INT, [-2 ** 63, -5, -1, 0, 1, 7, 2 ** 63 - 1]),
+        (FLOAT, [float('-inf'), -1e300, -2.5, -1e-300, 0.0, 1e-300, 3.0,
+                 float('inf')]),
+        (TEXT, ['', 'a', 'a\x00', 'a\x00b', 'ab', 'b', 'é']),
+        (BYTES, [b'', b'\x00', b'\x00\x00', b'\x00\xff', b'\x01', b'\xff']),
+    ])
+    def test_order_and_round_trip(self, type_, values):
+        types = [type_, INT]
+        for a, b in itertools.product(values, repeat=2):
+            encoded_a = encode(types, [a, 1])
+            encoded_b = encode(types, [b, 2])
+            assert (encoded_a < encoded_b) == ((a, 1) < (b, 2))
+            assert decode(types, encoded_a) == ([a, 1], len(encoded_a))
+        # NULL sorts first
+        assert encode(types, [None, 2]) < encode(types, [values[0], 1])
+
+    def test_prefix(self):
+        types = [TEXT, INT]
+        prefix = encode(types, ['ab'])
+        end = prefix_end(prefix)
+
+        assert prefix <= encode(types, ['ab', -1]) < end
+        assert not encode(types, ['ab\x00', 0]) < end
+        assert not prefix <= encode(types, ['a', 5])
+        assert encode([FLOAT], [-0.0]) == encode([FLOAT], [0.0])
+        assert prefix_end(b'\x01\xff') == b'\x02'
+        assert prefix_end(b'\xff\xff') is None
+
+    def test_bad_values(self):
+        with pytest.raises(ValueError):
+            encode([INT], [2 ** 63])
+        with pytest.raises(ValueError):
+            encode([INT], ['1'])
+        with pytest.raises(ValueError):
+            encode([TEXT], [b'a'])
+
+    def test_max_size(self):
+        assert max_size([INT, FLOAT], 100) == len(encode([INT, FLOAT],
+                                                         [1, 2.0]))
+        assert max_size([INT, INT], 10) == 10
+        assert max_size([INT, TEXT], 100) == 100
+        assert max_size([], 100) == 0
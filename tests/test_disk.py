@@ -1,5 +1,9 @@
 import pytest
-from src.disk import PageID, PAGE_SIZE, DiskManager
+from src.disk import (
+    PageID, PAGE_SIZE, MMAP_CHUNK_SIZE, DiskManager, MmapDiskManager
+)
+from src.buffer import BufferPool, BufferPoolManager
+from src.btree.btree import BTree
 
 
 class TestPage:
@@ -19,10 +23,10 @@ class TestPage:
         assert page_id != diff_page_id
 
 
-@pytest.fixture
-def empty_disk(tmp_path):
+@pytest.fixture(params=[DiskManager, MmapDiskManager])
+def empty_disk(request, tmp_path):
     file_path = tmp_path / "test"
-    disk = DiskManager(file_path)
+    disk = request.param(file_path)
     return disk
 
 
@@ -54,3 +58,124 @@ class TestDisk:
 
         assert disk.read_page_data(id_hello) == self.hello
         assert disk.read_page_data(id_world) == self.world
+
+    def test_vectored_io(self, empty_disk):
+        disk = empty_disk
+        page_ids = [disk.allocate_page() for _ in range(5)]
+        pages = [to_page_data(str(i)) for i in range(5)]
+        read, written = disk.stats.pages_read, disk.stats.pages_written
+        disk.write_pages([(page_ids[i], pages[i]) for i in (4, 0, 1, 3)])
+        assert disk.stats.pages_written == written + 4
+
+        read_ids = [page_ids[3], page_ids[0], page_ids[4], page_ids[1]]
+        assert disk.read_pages(read_ids) == [
+            pages[3], pages[0], pages[4], pages[1]
+        ]
+        assert disk.stats.bytes_read() == (read + 4) * PAGE_SIZE
+        assert disk.read_page_data(page_ids[2]) == bytearray(PAGE_SIZE)
+
+    def test_header_page_is_reserved(self, empty_disk):
+        disk = empty_disk
+        assert disk.allocate_page().to_int() == 1
+
+    def test_reuse_freed_page(self, empty_disk):
+        disk = empty_disk
+        page_ids = [disk.allocate_page() for _ in range(3)]
+        disk.free_page(page_ids[0])
+        disk.free_page(page_ids[2])
+
+        assert disk.allocate_page() == page_ids[2]
+        assert disk.allocate_page() == page_ids[0]
+        assert disk.allocate_page().to_int() == page_ids[2].to_int() + 1
+
+    def test_free_list_persists(self, tmp_path):
+        file_path = tmp_path / "test"
+        disk = DiskManager(file_path)
+        page_ids = [disk.allocate_page() for _ in range(3)]
+        for page_id in page_ids:
+            disk.write_page_data(page_id, self.hello)
+        disk.free_page(page_ids[1])
+        disk.close()
+
+        disk = DiskManager(file_path)
+        assert disk.allocate_page() == page_ids[1]
+        assert disk.allocate_page().to_int() == page_ids[2].to_int() + 1
+
+    def test_reject_foreign_file(self, tmp_path):
+        file_path = tmp_path / "test"
+        file_path.write_bytes(self.hello)
+        with pytest.raises(ValueError):
+            DiskManager(file_path)
+
+    def test_catalog_persists(self, tmp_path):
+        file_path = tmp_path / "test"
+        disk = DiskManager(file_path)
+        disk.create_tree("users", PageID(3), 8, 100)
+        disk.create_tree("orders", PageID(5), 16, 4)
+        disk.set_root("users", PageID(7))
+        disk.close()
+
+        disk = DiskManager(file_path)
+        assert list(disk.trees) == ["users", "orders"]
+        users = disk.trees["users"]
+        assert (users.root_page_id, users.key_size, users.value_size) == (
+            PageID(7), 8, 100
+        )
+
+    def test_reject_duplicate_tree(self, empty_disk):
+        disk = empty_disk
+        disk.create_tree("users", PageID(1), 8, 8)
+        with pytest.raises(ValueError):
+            disk.create_tree("users", PageID(2), 8, 8)
+        with pytest.raises(ValueError):
+            disk.create_tree("x" * 33, PageID(2), 8, 8)
+
+
+class TestMmapDisk:
+    hello = to_page_data("hello")
+
+    def test_mapping_grows_in_chunks(self, tmp_path):
+        file_path = tmp_path / "test"
+        disk = MmapDiskManager(file_path)
+        page_ids = [disk.allocate_page()
+                    for _ in range(MMAP_CHUNK_SIZE // PAGE_SIZE + 1)]
+        disk.write_page_data(page_ids[-1], self.hello)
+        assert len(disk.map) == 2 * MMAP_CHUNK_SIZE
+        assert disk.read_page_data(page_ids[-1]) == self.hello
+
+    def test_readable_by_disk_manager(self, tmp_path):
+        file_path = tmp_path / "test"
+        disk = MmapDiskManager(file_path)
+        page_id = disk.allocate_page()
+        disk.write_page_data(page_id, self.hello)
+        disk.advise([page_id])
+        disk.sync()
+        disk.close()
+
+        disk = DiskManager(file_path)
+        assert disk.next_page_id == page_id.to_int() + 1
+        assert disk.read_page_data(page_id) == self.hello
+
+    def test_scan_advice_beside_gets(self, tmp_path, monkeypatch):
+        disk = MmapDiskManager(tmp_path / "test")
+        bt = BTree(BufferPoolManager(disk, BufferPool(10)), 8, 100)
+        for i in reversed(range(2000)):
+            bt.add(i.to_bytes(8, 'big'), i.to_bytes(100, 'big'))
+
+        advised = []
+        monkeypatch.setattr(
+            disk, '_madvise',
+            lambda option, start, length: advised.append((start, length))
+        )
+        rows = bt.scan()
+        for i in range(2000):
+            assert next(rows)[0] == i.to_bytes(8, 'big')
+            if i % 100 == 0:
+                scanned = len(advised)
+                key = (1999 - i).to_bytes(8, 'big')
+                assert bt.get(key) == (1999 - i).to_bytes(100, 'big')
+                assert bt.get_many([key]) == [(1999 - i).to_bytes(100, 'big')]
+                assert len(advised) == scanned
+        # each hint covers one leaf, never the whole mapping
+        assert advised
+        assert all(length == PAGE_SIZE for _, length in advised)
@@ -0,0 +1,99 @@
+import pytest
+from src.disk import DiskManager
+from src.buffer import BufferPool, BufferPoolManager
+from src.codec import INT, TEXT
+from src.table import Column, Index, Schema, Table
+from src.executor import SeqScan, IndexScan, Filter, Project, Limit, \
+    NestedLoopJoin, IndexNestedLoopJoin, Aggregate
+
+
+@pytest.fixture
+def tables(tmp_path):
+    disk = DiskManager(tmp_path / "test")
+    bufmgr = BufferPoolManager(disk, BufferPool(64))
+    users = Table.create(bufmgr, Schema(
+        [Column('id', INT), Column('name', TEXT), Column('city', TEXT)],
+        ['id'], [Index('by_city', ['city'])],
+    ), 16, 100)
+    orders = Table.create(bufmgr, Schema(
+        [Column('id', INT), Column('user_id', INT), Column('amount', INT)],
+        ['id'], [Index('by_user', ['user_id'])],
+    ), 16, 100)
+    cities = ['kyoto', 'osaka', 'tokyo']
+    for i in range(30):
+        users.insert((i, f'user{i}', cities[i % 3]))
+    for i in range(300):
+        orders.insert((i, i % 20, i))
+    return users, orders
+
+
+class TestExecutor:
+
+    def test_scan_filter_project_limit(self, tables):
+        users, _ = tables
+        plan = Limit(Project(
+            Filter(SeqScan(users, batch_size=7), lambda row: row[0] % 2),
+            ['name'],
+        ), 5, offset=2)
+
+        assert plan.columns == ['name']
+        assert list(plan) == [('user5',), ('user7',), ('user9',),
+                              ('user11',), ('user13',)]
+        batches = list(SeqScan(users, batch_size=7).batches())
+        assert [len(batch) for batch in batches] == [7, 7, 7, 7, 2]
+
+    def test_index_scan(self, tables):
+        users, _ = tables
+        by_key = IndexScan(users, start=(10,), end=(13,))
+        assert [row[0] for row in by_key] == [10, 11, 12]
+
+        by_city = IndexScan(users, 'by_city', start=('l',), end=('p',))
+        assert sorted(row[0] for row in by_city) == list(range(1, 30, 3))
+        only = IndexScan(users, 'by_city', start=('tokyo',))
+        assert all(row[2] == 'tokyo' for row in only)
+
+    def test_joins(self, tables):
+        users, orders = tables
+        kyoto = IndexScan(users, 'by_city', ('kyoto',), ('kyoto\x00',),
+                          alias='u')
+        plan = IndexNestedLoopJoin(kyoto, orders, ['u.id'], 'by_user',
+                                   alias='o')
+        rows = list(Project(plan, ['u.id', 'o.amount']))
+        expected = sorted((i % 20, i) for i in range(300) if i % 20 % 3 == 0)
+        assert sorted(rows) == expected
+
+        by_key = IndexNestedLoopJoin(SeqScan(orders, alias='o'), users,
+                                     ['o.user_id'], alias='u')
+        assert len(list(by_key)) == 300
+
+        nested = NestedLoopJoin(
+            SeqScan(users, alias='u'), SeqScan(orders, alias='o'),
+            lambda row: row[0] == row[4] and row[5] >= 280,
+        )
+        assert sorted(row[5] for row in nested) == list(range(280, 300))
+
+    def test_aggregate(self, tables):
+        users, orders = tables
+        joined = IndexNestedLoopJoin(SeqScan(orders), users, ['user_id'],
+                                     alias='u')
+        plan = Aggregate(joined, ['u.city'], [
+            ('count', None), ('sum', 'amount'), ('min', 'amount'),
+            ('max', 'u.name'), ('avg', 'amount'),
+        ])
+
+        assert plan.columns == ['u.city', 'count(*)', 'sum(amount)',
+                                'min(amount)', 'max(u.name)', 'avg(amount)']
+        rows = {row[0]: row[1:] for row in plan}
+        amounts = [i for i in range(300) if i % 20 % 3 == 1]
+        assert rows['osaka'] == (len(amounts), sum(amounts), 1, 'user7',
+                                 sum(amounts) / len(amounts))
+
+        empty = Aggregate(Filter(SeqScan(orders), lambda row: False), [],
+                          [('count', None), ('sum', 'amount')])
+        assert list(empty) == [(0, None)]
+
+        users.insert((30, 'user30', None))
+        nulls = Aggregate(SeqScan(users), [], [
+            ('count', None), ('count', 'city'), ('min', 'city'),
+        ])
+        assert list(nulls) == [(31, 30, 'kyoto')]
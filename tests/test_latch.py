@@ -0,0 +1,37 @@
+import threading
+import pytest
+from src.latch import RWLatch
+
+
+class TestRWLatch:
+
+    def test_shared_holders(self):
+        latch = RWLatch()
+        assert latch.acquire(False)
+        assert latch.acquire(False)
+        assert not latch.acquire(True, blocking=False)
+        latch.release(False)
+        latch.release(False)
+        assert latch.acquire(True, blocking=False)
+        assert not latch.acquire(False, blocking=False)
+        latch.release(True)
+
+    def test_release_unheld(self):
+        latch = RWLatch()
+        with pytest.raises(ValueError):
+            latch.release(True)
+        with pytest.raises(ValueError):
+            latch.release(False)
+
+    def test_waiting_writer_blocks_readers(self):
+        latch = RWLatch()
+        latch.acquire(False)
+        writer = threading.Thread(target=latch.acquire, args=(True,))
+        writer.start()
+        while not latch.waiting_writers:
+            writer.join(0.001)
+        assert not latch.acquire(False, blocking=False)
+        latch.release(False)
+        writer.join()
+        assert latch.writer
+        latch.release(True)
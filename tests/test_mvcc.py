@@ -0,0 +1,120 @@
+import threading
+import pytest
+from src.disk import DiskManager
+from src.wal import WriteAheadLog
+from src.buffer import BufferPool, BufferPoolManager
+from src.btree.btree import BTree
+from src.mvcc import (
+    TransactionManager, WriteConflictError, version_key, split_version_key
+)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    disk = DiskManager(tmp_path / "test")
+    tree = BTree(BufferPoolManager(disk, BufferPool(100)), 32, 16)
+    return TransactionManager(tree)
+
+
+class TestVersionKey:
+
+    def test_order(self):
+        keys = [b'', b'\x00', b'\x00\x00', b'\x00\x01', b'a', b'a\x00', b'b']
+        versions = [version_key(key, commit_id)
+                    for key in keys for commit_id in (9, 2, 1)]
+        assert sorted(versions) == versions
+        assert [split_version_key(version) for version in versions] == [
+            (key, commit_id) for key in keys for commit_id in (9, 2, 1)
+        ]
+
+
+class TestTransaction:
+
+    def test_snapshot(self, manager):
+        with manager.begin() as txn:
+            txn.put(b'a', b'1')
+            txn.put(b'b', b'1')
+        reader = manager.begin()
+        with manager.begin() as txn:
+            txn.put(b'a', b'2')
+            txn.delete(b'b')
+            txn.put(b'c', b'2')
+            assert txn.get(b'a') == b'2'
+
+        assert reader.get(b'a') == b'1'
+        assert list(reader.scan()) == [(b'a', b'1'), (b'b', b'1')]
+        reader.commit()
+        with manager.begin() as txn:
+            assert list(txn.scan()) == [(b'a', b'2'), (b'c', b'2')]
+            txn.put(b'b', b'3')
+            txn.delete(b'c')
+            assert list(txn.scan(b'b')) == [(b'b', b'3')]
+            txn.abort()
+
+    def test_write_conflict(self, manager):
+        first = manager.begin()
+        second = manager.begin()
+        first.put(b'a', b'1')
+        second.put(b'a', b'2')
+        first.commit()
+        with pytest.raises(WriteConflictError):
+            second.commit()
+        with manager.begin() as txn:
+            assert txn.get(b'a') == b'1'
+
+    def test_gc(self, manager):
+        for i in range(5):
+            with manager.begin() as txn:
+                txn.put(b'a', bytes([i]))
+                txn.put(b'b', bytes([i]))
+        reader = manager.begin()
+        with manager.begin() as txn:
+            txn.put(b'a', b'new')
+            txn.delete(b'b')
+
+        assert manager.gc() == 8
+        assert reader.get(b'b') == bytes([4])
+        reader.commit()
+        assert manager.gc() == 3
+        assert [split_version_key(version)[0]
+                for version, _ in manager.tree.scan()] == [b'a']
+
+    def test_readers_run_beside_writers(self, manager):
+        with manager.begin() as txn:
+            for i in range(100):
+                txn.put(i.to_bytes(4, 'big'), b'0')
+
+        def write():
+            for n in range(1, 20):
+                with manager.begin() as txn:
+                    for i in range(100):
+                        txn.put(i.to_bytes(4, 'big'), bytes([n]))
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        snapshots = []
+        while writer.is_alive():
+            with manager.begin() as txn:
+                snapshots.append({value for _, value in txn.scan()})
+        writer.join()
+        assert all(len(values) == 1 for values in snapshots)
+
+    def test_commit_ids_survive_restart(self, tmp_path):
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        disk = DiskManager(tmp_path / "test", wal)
+        tree = BTree.create(BufferPoolManager(disk, BufferPool(20)),
+                            'rows', 32, 16)
+        manager = TransactionManager(tree)
+        with manager.begin() as txn:
+            txn.put(b'a', b'1')
+        disk.close()
+        wal.close()
+
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        disk = DiskManager(tmp_path / "test", wal)
+        manager = TransactionManager(
+            BTree.open(BufferPoolManager(disk, BufferPool(20)), 'rows')
+        )
+        assert manager.last_commit_id == 1
+        with manager.begin() as txn:
+            assert txn.get(b'a') == b'1'
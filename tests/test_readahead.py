@@ -0,0 +1,53 @@
+from src.disk import PAGE_SIZE, DiskManager
+from src.buffer import BufferPool, BufferPoolManager
+from src.readahead import ReadAhead
+from src.btree.btree import BTree
+
+
+def wait_staged(readahead, page_id):
+    for _ in range(1000):
+        with readahead.lock:
+            if page_id in readahead.staged:
+                return
+        readahead.worker.join(0.001)
+    raise AssertionError('page was never staged')
+
+
+class TestReadAhead:
+
+    def test_take_staged_page(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        page_id = disk.allocate_page()
+        disk.write_page_data(page_id, bytearray(b'x' * PAGE_SIZE))
+        readahead = ReadAhead(disk)
+
+        readahead.request([page_id])
+        wait_staged(readahead, page_id)
+        assert readahead.take(page_id) == bytearray(b'x' * PAGE_SIZE)
+        assert readahead.take(page_id) is None
+        readahead.close()
+
+    def test_invalidate_drops_staged_page(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        page_id = disk.allocate_page()
+        readahead = ReadAhead(disk)
+
+        readahead.request([page_id])
+        wait_staged(readahead, page_id)
+        readahead.invalidate(page_id)
+        assert readahead.take(page_id) is None
+        readahead.close()
+
+    def test_scan_with_readahead(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        bt = BTree(BufferPoolManager(disk, BufferPool(100)), 8, 8)
+        for i in range(2000):
+            bt.add(i.to_bytes(8, 'big'), i.to_bytes(8, 'big'))
+        bt.bufmgr.flush()
+
+        readahead = ReadAhead(disk)
+        bufmgr = BufferPoolManager(disk, BufferPool(100), readahead)
+        bt = BTree(bufmgr, 8, 8, bt.root_page_id)
+        keys = [key for key, _ in bt.scan(prefetch=True)]
+        assert keys == [i.to_bytes(8, 'big') for i in range(2000)]
+        readahead.close()
@@ -0,0 +1,93 @@
+import pytest
+from src.disk import PAGE_SIZE, PageID, DiskManager
+from src.buffer import BufferPool, BufferPoolManager
+from src.replacer import (
+    NoFreeBufferError, ClockReplacer, LRUKReplacer, TwoQReplacer, ARCReplacer
+)
+
+
+REPLACERS = [ClockReplacer, LRUKReplacer, TwoQReplacer, ARCReplacer]
+
+
+@pytest.fixture
+def disk(tmp_path):
+    disk = DiskManager(tmp_path / "test")
+    for i in range(100):
+        page_id = disk.allocate_page()
+        disk.write_page_data(page_id, bytes([i % 256]) * PAGE_SIZE)
+    return disk
+
+
+def page_ids(disk):
+    return [PageID(i) for i in range(1, disk.next_page_id)]
+
+
+def read(bufmgr, page_id):
+    with bufmgr.page(page_id) as buffer_:
+        return buffer_.page[0]
+
+
+@pytest.mark.parametrize('replacer', REPLACERS)
+class TestReplacer:
+
+    def test_read_through_small_pool(self, disk, replacer):
+        bufmgr = BufferPoolManager(disk, BufferPool(4, replacer()))
+        ids = page_ids(disk)
+        for _ in range(3):
+            for i, page_id in enumerate(ids):
+                assert read(bufmgr, page_id) == i % 256
+        assert len(bufmgr.page_table) == 4
+
+    def test_pinned_page_stays(self, disk, replacer):
+        bufmgr = BufferPoolManager(disk, BufferPool(4, replacer()))
+        ids = page_ids(disk)
+        pinned = bufmgr.fetch_page(ids[0])
+        for page_id in ids[1:]:
+            read(bufmgr, page_id)
+        assert bufmgr.page_table[ids[0]] is not None
+        assert pinned.page[0] == 0
+
+    def test_every_buffer_pinned(self, disk, replacer):
+        bufmgr = BufferPoolManager(disk, BufferPool(4, replacer()))
+        ids = page_ids(disk)
+        for page_id in ids[:4]:
+            bufmgr.fetch_page(page_id)
+        with pytest.raises(NoFreeBufferError):
+            bufmgr.fetch_page(ids[4])
+
+    def test_freed_buffer_is_reused(self, disk, replacer):
+        bufmgr = BufferPoolManager(disk, BufferPool(4, replacer()))
+        ids = page_ids(disk)
+        for page_id in ids[:4]:
+            read(bufmgr, page_id)
+        bufmgr.free_page(ids[2])
+        read(bufmgr, ids[4])
+        assert all(page_id in bufmgr.page_table
+                   for page_id in [ids[0], ids[1], ids[3], ids[4]])
+
+
+@pytest.mark.parametrize('replacer', [LRUKReplacer, TwoQReplacer, ARCReplacer])
+def test_scan_resistance(disk, replacer):
+    bufmgr = BufferPoolManager(disk, BufferPool(8, replacer()))
+    ids = page_ids(disk)
+    hot = ids[:2]
+
+    # let the hot pages be evicted once and come back, which is what
+    # makes 2Q and ARC treat them as frequently used
+    for page_id in hot + ids[2:10] + hot + hot:
+        read(bufmgr, page_id)
+    for page_id in ids[10:40]:
+        read(bufmgr, page_id)
+
+    hits = bufmgr.stats.hits
+    for page_id in hot:
+        read(bufmgr, page_id)
+    assert bufmgr.stats.hits == hits + len(hot)
+
+
+def test_clock_usage_count_is_capped(disk):
+    bufmgr = BufferPoolManager(disk, BufferPool(2, ClockReplacer(3)))
+    ids = page_ids(disk)
+    for _ in range(1000):
+        read(bufmgr, ids[0])
+    assert max(frame.usage_count for frame in bufmgr.pool.buffers) == 3
@@ -0,0 +1,74 @@
+import pytest
+from src.disk import DiskManager
+from src.buffer import BufferPool, BufferPoolManager
+from src.btree.btree import BTree
+from src.stats import LatencyHistogram, StatsRegistry
+
+
+class TestStats:
+
+    def test_latency_histogram(self):
+        latencies = LatencyHistogram()
+        for ns in range(1, 10001):
+            latencies.record(ns * 1000)
+
+        assert latencies.percentile(50) == pytest.approx(5000 * 1000,
+                                                         rel=0.01)
+        assert latencies.percentile(99) == pytest.approx(9900 * 1000,
+                                                         rel=0.01)
+        summary = latencies.summary()
+        assert summary['count'] == 10000
+        assert summary['max'] == 10000
+
+    def test_snapshot(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        bufmgr = BufferPoolManager(disk, BufferPool(8))
+        tree = BTree(bufmgr, 8, 100)
+        registry = StatsRegistry()
+        registry.attach_disk(disk)
+        registry.attach_buffer_pool(bufmgr)
+        registry.attach_tree(tree)
+
+        for i in range(1000):
+            tree.add(i.to_bytes(8, 'big'), bytes(100))
+        for i in range(0, 1000, 2):
+            tree.remove(i.to_bytes(8, 'big'))
+        tree.get((1).to_bytes(8, 'big'))
+
+        snapshot = registry.snapshot()
+        assert snapshot['btree.leaf_splits'] > 0
+        assert snapshot['btree.merges'] > 0
+        assert snapshot['btree.height'] == tree.height() > 1
+        assert snapshot['buffer.evictions'] > 0
+        assert 0 < snapshot['buffer.hit_rate'] < 1
+        assert snapshot['disk.pages_written'] > 0
+        assert snapshot['latency.btree.add']['count'] == 1000
+        assert snapshot['latency.btree.remove']['count'] == 500
+        assert snapshot['latency.btree.get']['count'] == 1
+
+    def test_hooks(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        bufmgr = BufferPoolManager(disk, BufferPool(4))
+        tree = BTree(bufmgr, 8, 100)
+        registry = StatsRegistry()
+        registry.attach_buffer_pool(bufmgr)
+        registry.attach_tree(tree)
+        events = []
+
+        def hook(event, fields):
+            events.append((event, fields))
+
+        registry.add_hook(hook)
+        for i in range(200):
+            tree.add(i.to_bytes(8, 'big'), bytes(100))
+        registry.remove_hook(hook)
+        count = len(events)
+        tree.add((200).to_bytes(8, 'big'), bytes(100))
+
+        names = {event for event, _ in events}
+        assert {'btree.split', 'btree.grow', 'buffer.evict'} <= names
+        assert len(events) == count
+        splits = [fields for event, fields in events
+                  if event == 'btree.split']
+        assert len(splits) == tree.stats.leaf_splits
+        assert all(fields['tree'] == 'btree' for fields in splits)
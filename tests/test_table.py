@@ -0,0 +1,122 @@
+import pytest
+from src.disk import DiskManager
+from src.buffer import BufferPool, BufferPoolManager
+from src.codec import INT, TEXT, FLOAT
+from src.table import Column, Index, Schema, Table, DuplicateKeyError
+
+
+def people_schema(indexes=()):
+    return Schema(
+        [Column('id', INT), Column('name', TEXT), Column('email', TEXT),
+         Column('score', FLOAT)],
+        ['id'], indexes,
+    )
+
+
+@pytest.fixture
+def bufmgr(tmp_path):
+    disk = DiskManager(tmp_path / "test")
+    return BufferPoolManager(disk, BufferPool(32))
+
+
+class TestTable:
+
+    def test_insert_get_scan(self, bufmgr):
+        table = Table.create(bufmgr, people_schema(), 16, 200)
+        for i in reversed(range(-50, 50)):
+            table.insert((i, f'name{i}', None, i / 2))
+
+        assert table.get((7,)) == (7, 'name7', None, 3.5)
+        assert table.get((100,)) is None
+        assert [row[0] for row in table.scan()] == list(range(-50, 50))
+        assert [row[0] for row in table.scan((-3,), (2,))] == [-3, -2, -1,
+                                                               0, 1]
+        with pytest.raises(DuplicateKeyError):
+            table.insert((7, 'again', None, 0.0))
+        with pytest.raises(ValueError):
+            table.insert((None, 'no id', None, 0.0))
+
+    def test_indexes(self, bufmgr):
+        schema = people_schema([
+            Index('by_name', ['name']),
+            Index('by_email', ['email'], unique=True),
+        ])
+        table = Table.create(bufmgr, schema, 16, 200)
+        for i in range(300):
+            table.insert((i, f'name{i % 7}', f'{i}@example.com', 0.0))
+        table.insert((300, 'name0', None, 0.0))
+        table.insert((301, 'name0', None, 0.0))
+
+        rows = list(table.lookup('by_name', ['name3']))
+        assert [row[0] for row in rows] == list(range(3, 300, 7))
+        assert list(table.lookup('by_email', ['5@example.com'])) == [
+            (5, 'name5', '5@example.com', 0.0)
+        ]
+        assert [row[0] for row in table.lookup('by_email', [None])] == [
+            300, 301
+        ]
+        with pytest.raises(DuplicateKeyError):
+            table.insert((400, 'other', '5@example.com', 0.0))
+        assert table.get((400,)) is None
+
+        assert table.delete((5,))
+        assert not table.delete((5,))
+        assert list(table.lookup('by_email', ['5@example.com'])) == []
+        assert 5 not in [row[0] for row in table.lookup('by_name', ['name5'])]
+        table.insert((400, 'other', '5@example.com', 0.0))
+
+    def test_create_index(self, bufmgr):
+        table = Table.create(bufmgr, people_schema(), 16, 200)
+        for i in range(100):
+            table.insert((i, f'name{i % 10}', f'{i % 50}@example.com', 0.0))
+
+        with pytest.raises(DuplicateKeyError):
+            table.create_index(Index('by_email', ['email'], unique=True))
+        assert table.schema.indexes == []
+
+        table.create_index(Index('by_name', ['name', 'id']))
+        rows = list(table.lookup('by_name', ['name4']))
+        assert [row[0] for row in rows] == list(range(4, 100, 10))
+        assert [row[0] for row in table.lookup('by_name', ['name4', 44])] \
+            == [44]
+
+        values = [['name4'], ['name0', 30], ['none'], ['name4'], ['name9']]
+        assert table.lookup_many('by_name', values) == [
+            list(table.lookup('by_name', value)) for value in values
+        ]
+        assert table.lookup_many('by_name', []) == []
+
+    def test_index_tree_sizes(self, bufmgr):
+        schema = Schema(
+            [Column('id', INT), Column('user_id', INT), Column('body', TEXT)],
+            ['id'], [Index('by_user', ['user_id', 'id'])],
+        )
+        table = Table.create(bufmgr, schema, 64, 800, name='posts')
+        tree = table.indexes['by_user']
+        assert (tree.key_size, tree.value_size) == (9 + 9 + 64, 64)
+        table.insert((1, 2, 'x' * 700))
+        assert list(table.lookup('by_user', [2]))[0][0] == 1
+
+        # an index on the long column does not fit, and no tree is made
+        schema.add_index(Index('by_body', ['body']))
+        with pytest.raises(ValueError):
+            Table.create(bufmgr, schema, 64, 800, name='other')
+        assert 'other' not in bufmgr.disk.trees
+        with pytest.raises(ValueError):
+            table.create_index(Index('by_body', ['body']))
+        with pytest.raises(ValueError):
+            table.create_index(Index('twice', ['id', 'id']))
+
+    def test_reopen(self, tmp_path):
+        file_path = tmp_path / "test"
+        schema = people_schema([Index('by_name', ['name'])])
+        bufmgr = BufferPoolManager(DiskManager(file_path), BufferPool(32))
+        table = Table.create(bufmgr, schema, 16, 200, name='people')
+        for i in range(50):
+            table.insert((i, f'name{i % 5}', None, 1.0))
+        bufmgr.flush()
+
+        bufmgr = BufferPoolManager(DiskManager(file_path), BufferPool(32))
+        table = Table.open(bufmgr, 'people', schema)
+        assert len(list(table.scan())) == 50
+        assert len(list(table.lookup('by_name', ['name2']))) == 10
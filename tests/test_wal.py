@@ -0,0 +1,279 @@
+import threading
+import pytest
+from src.disk import PageID, PAGE_SIZE, DiskManager
+from src.wal import WriteAheadLog, PAGE_RECORD, COMMIT_RECORD
+from src.buffer import BufferPool, BufferPoolManager
+from src.btree.btree import BTree
+
+
+def to_page_data(string: str) -> bytearray:
+    page_data = bytearray(PAGE_SIZE)
+    page_data[:len(string)] = string.encode()
+    return page_data
+
+
+def open_bufmgr(tmp_path, pool_size=100):
+    wal = WriteAheadLog(tmp_path / "test.wal")
+    disk = DiskManager(tmp_path / "test", wal)
+    return BufferPoolManager(disk, BufferPool(pool_size))
+
+
+def crash(bufmgr):
+    """Drop the buffer pool without writing anything back."""
+    bufmgr.disk.close()
+    bufmgr.disk.wal.close()
+
+
+class TestWriteAheadLog:
+    hello = to_page_data("hello")
+    world = to_page_data("world")
+
+    def test_records(self, tmp_path):
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        wal.append_page(PageID(1), self.hello)
+        lsn = wal.commit()
+        assert wal.flushed_lsn == lsn
+        assert list(wal.records()) == [
+            (1, PAGE_RECORD, PageID(1), bytes(self.hello)),
+            (2, COMMIT_RECORD, PageID(0), b''),
+        ]
+
+    def test_recover_committed_only(self, tmp_path):
+        disk = DiskManager(tmp_path / "test")
+        hello_id = disk.allocate_page()
+        world_id = disk.allocate_page()
+        disk.sync()
+        disk.close()
+
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        wal.append_page(hello_id, self.hello)
+        wal.commit()
+        wal.append_page(world_id, self.world)
+        wal.flush(wal.next_lsn - 1)
+        wal.close()
+
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        disk = DiskManager(tmp_path / "test", wal)
+        assert disk.read_page_data(hello_id) == self.hello
+        assert disk.read_page_data(world_id) != self.world
+        assert list(wal.records()) == []
+
+    def test_torn_record(self, tmp_path):
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        wal.append_page(PageID(1), self.hello)
+        wal.commit()
+        wal.close()
+        with (tmp_path / "test.wal").open('ab') as log_file:
+            log_file.write(b'\x00' * 30)
+
+        wal = WriteAheadLog(tmp_path / "test.wal")
+        assert len(list(wal.records())) == 2
+
+    def test_group_commit(self, tmp_path):
+        wal = WriteAheadLog(tmp_path / "test.wal", commit_delay=0.01)
+        thread_count = 8
+
+        def run(i):
+            wal.append_page(PageID(i), self.hello)
+            wal.commit()
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert wal.flushed_lsn == 2 * thread_count
+        assert wal.sync_count < thread_count
+
+
+class TestRecovery:
+    key_size = 8
+    value_size = 8
+
+    def test_crash(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path, pool_size=20)
+        bt = BTree(bufmgr, self.key_size, self.value_size)
+        for i in range(2000):
+            bt.add(i.to_bytes(self.key_size, 'big'),
+                   i.to_bytes(self.value_size, 'big'))
+            if i % 100 == 99:
+                bufmgr.commit()
+        root_page_id = bt.root_page_id
+        for i in range(2000, 2050):
+            bt.add(i.to_bytes(self.key_size, 'big'),
+                   i.to_bytes(self.value_size, 'big'))
+        crash(bufmgr)
+
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree(bufmgr, self.key_size, self.value_size, root_page_id)
+        keys = [key for key, _ in bt.scan()]
+        assert keys == [i.to_bytes(self.key_size, 'big')
+                        for i in range(2000)]
+
+    def test_crash_after_remove(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree(bufmgr, self.key_size, self.value_size)
+        for i in range(1000):
+            bt.add(i.to_bytes(self.key_size, 'big'), b'\x00' * 8)
+        bufmgr.commit()
+        for i in range(0, 1000, 2):
+            bt.remove(i.to_bytes(self.key_size, 'big'))
+        bufmgr.commit()
+        root_page_id = bt.root_page_id
+        page_count = bufmgr.disk.next_page_id
+        crash(bufmgr)
+
+        bufmgr = open_bufmgr(tmp_path)
+        assert bufmgr.disk.next_page_id == page_count
+        assert bufmgr.disk.free_page_id != 0
+        bt = BTree(bufmgr, self.key_size, self.value_size, root_page_id)
+        keys = [key for key, _ in bt.scan()]
+        assert keys == [i.to_bytes(self.key_size, 'big')
+                        for i in range(1, 1000, 2)]
+
+    def test_crash_after_bulk_load(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree(bufmgr, self.key_size, self.value_size)
+        for i in range(1000):
+            bt.add(i.to_bytes(self.key_size, 'big'), b'\x00' * 8)
+        bufmgr.commit()
+        for i in range(1000):
+            bt.remove(i.to_bytes(self.key_size, 'big'))
+        bufmgr.commit()
+        bufmgr.checkpoint()
+        free_page_id = bufmgr.disk.free_page_id
+        assert free_page_id != 0
+        loaded = BTree(bufmgr, self.key_size, self.value_size)
+        loaded.bulk_load((i.to_bytes(self.key_size, 'big'), b'\x01' * 8)
+                         for i in range(2000))
+        crash(bufmgr)
+
+        # the bulk-loaded pages were not taken from the free list, so the
+        # free list of the checkpoint is intact
+        disk = open_bufmgr(tmp_path).disk
+        assert disk.free_page_id == free_page_id
+        page_count = disk.next_page_id
+        while disk.free_page_id != 0:
+            assert disk.allocate_page() < page_count
+
+    def test_crash_after_save_bloom(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree.create(bufmgr, "items", self.key_size, self.value_size)
+        for i in range(1000):
+            bt.add(i.to_bytes(self.key_size, 'big'), b'\x00' * 8)
+        bufmgr.commit()
+        for i in range(0, 1000, 2):
+            bt.remove(i.to_bytes(self.key_size, 'big'))
+        bufmgr.commit()
+        bufmgr.checkpoint()
+        free_page_id = bufmgr.disk.free_page_id
+        assert free_page_id != 0
+        bt.enable_bloom(capacity=100000)
+        bt.save_bloom()
+        crash(bufmgr)
+
+        disk = open_bufmgr(tmp_path).disk
+        assert disk.free_page_id == free_page_id
+        page_count = disk.next_page_id
+        while disk.free_page_id != 0:
+            assert disk.allocate_page() < page_count
+
+    def test_commit_waits_for_latches(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path)
+        with bufmgr.new_page() as buffer_:
+            page_id = buffer_.page_id
+        committed = threading.Event()
+
+        def commit():
+            bufmgr.commit()
+            committed.set()
+
+        # a structural change in flight holds off the commit
+        bufmgr.structure_latch.acquire(False)
+        thread = threading.Thread(target=commit)
+        thread.start()
+        assert not committed.wait(0.1)
+        bufmgr.structure_latch.release(False)
+        thread.join()
+
+        # so does a pending page being changed, which is then logged whole
+        with bufmgr.page(page_id, True) as buffer_:
+            buffer_.page[:5] = b'hello'
+            buffer_.is_dirty = True
+        buffer_ = bufmgr.fetch_page(page_id, True)
+        buffer_.page[5:8] = b'wor'
+        committed.clear()
+        thread = threading.Thread(target=commit)
+        thread.start()
+        assert not committed.wait(0.1)
+        buffer_.page[8:10] = b'ld'
+        bufmgr.unpin_page(page_id, True)
+        thread.join()
+        crash(bufmgr)
+
+        bufmgr = open_bufmgr(tmp_path)
+        with bufmgr.page(page_id) as buffer_:
+            assert buffer_.page[:10] == b'helloworld'
+
+    def test_commit_beside_splits(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path, pool_size=200)
+        bt = BTree(bufmgr, self.key_size, self.value_size)
+        root_page_id = bt.root_page_id
+        bufmgr.commit()
+        thread_count = 4
+        stop = threading.Event()
+
+        def add(t):
+            for i in range(t, 4000, thread_count):
+                bt.add(i.to_bytes(self.key_size, 'big'), b'\x00' * 8)
+
+        def commit():
+            while not stop.is_set():
+                bufmgr.commit(wait=False)
+
+        committer = threading.Thread(target=commit)
+        committer.start()
+        threads = [threading.Thread(target=add, args=(t,))
+                   for t in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop.set()
+        committer.join()
+        bufmgr.commit()
+        root_page_id = bt.root_page_id
+        crash(bufmgr)
+
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree(bufmgr, self.key_size, self.value_size, root_page_id)
+        assert [key for key, _ in bt.scan()] == [
+            i.to_bytes(self.key_size, 'big') for i in range(4000)
+        ]
+
+    def test_uncommitted_pages_stay_pinned(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path, pool_size=1)
+        with bufmgr.new_page() as buffer_:
+            buffer_.page[:5] = b'hello'
+        with pytest.raises(ValueError):
+            bufmgr.checkpoint()
+        bufmgr.commit()
+        with bufmgr.new_page():
+            pass
+
+    def test_checkpoint(self, tmp_path):
+        bufmgr = open_bufmgr(tmp_path)
+        bt = BTree(bufmgr, self.key_size, self.value_size)
+        for i in range(500):
+            bt.add(i.to_bytes(self.key_size, 'big'), b'\x00' * 8)
+        bufmgr.commit()
+        bufmgr.checkpoint()
+        assert list(bufmgr.disk.wal.records()) == []
+        root_page_id = bt.root_page_id
+        crash(bufmgr)
+
+        disk = DiskManager(tmp_path / "test")
+        bt = BTree(BufferPoolManager(disk, BufferPool(10)),
+                   self.key_size, self.value_size, root_page_id)
+        assert len(list(bt.scan())) == 500